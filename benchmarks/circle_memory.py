@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+Measures how many bytes of memory each `~pyps.shapes.Circle` occupies,
+including all of the point, length, and color objects it owns.
+
+The size of an object graph is found by walking the objects reachable from
+each circle with `gc.get_referents`, and summing `sys.getsizeof` for each
+object that is not shared with other circles (like classes, ``None``, or
+small interned numbers). The result is compared against `BASELINE`. Run it
+as a script::
+
+    $ python -m benchmarks.circle_memory
+"""
+
+import gc
+import sys
+import types
+
+from pyps.shapes import Circle
+from pyps.art.color import Color
+
+
+BASELINE = 2777.0
+"""
+The bytes per circle measured before the `pyps.geom` value types and
+`~pyps.art.color.FixedColor` used ``__slots__``.
+"""
+
+def _make_circle(i):
+    return Circle(
+        (i * 1.5, i * 0.5), 10.0 + (i % 5),
+        fill=Color.Fixed(red=0.2, green=0.5, blue=1.0),
+        stroke=(0.1, 0.1, 0.1),
+        stroke_width=2.0
+    )
+
+
+def _shared(obj):
+    return isinstance(obj, (type, types.ModuleType, types.FunctionType)) or obj is None
+
+
+def deep_size(obj, seen=None):
+    """
+    Returns the total size in bytes of ``obj`` and every object reachable
+    from it that hasn't already been counted in ``seen``.
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or _shared(o):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return total
+
+
+def bytes_per_circle(count=1000):
+    """
+    Returns the average number of bytes used by each of ``count`` circles.
+    Objects shared between circles are counted only once, and are charged to
+    the first circle that refers to them.
+    """
+    circles = [_make_circle(i) for i in xrange(count)]
+    seen = set()
+    return sum(deep_size(c, seen) for c in circles) / float(count)
+
+
+def main():
+    size = bytes_per_circle()
+    print 'Bytes per Circle: %.1f (baseline %.1f, %.0f%%)' % (size, BASELINE, size / BASELINE * 100)
+
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+Measures how long it takes to import pyps modules in a fresh interpreter,
+which is a significant part of the run time of short lived processes.
+
+Each module is imported in a new Python process, so that nothing is already
+loaded, and the best of several runs is kept. The number of modules loaded
+by the import is reported as well, which shows when a heavy dependency (like
+``numpy``) starts being pulled in eagerly. Run it as a script::
+
+    $ python -m benchmarks.import_time
+"""
+
+import json
+import subprocess
+import sys
+
+
+MODULES = ('pyps', 'pyps.shapes', 'pyps.writers.postscript')
+"""
+The modules measured by default.
+"""
+
+_SCRIPT = r"""
+import json, sys, timeit
+before = set(sys.modules)
+start = timeit.default_timer()
+import %s
+elapsed = timeit.default_timer() - start
+print json.dumps({'seconds': elapsed, 'modules': len(set(sys.modules) - before)})
+"""
+
+
+def measure(module, repeat=5):
+    """
+    Imports ``module`` in ``repeat`` fresh interpreters, and returns a `dict`
+    with the best time, in ``seconds``, and the number of ``modules`` the
+    import loaded.
+    """
+    best = None
+    for i in xrange(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _SCRIPT % (module,)])
+        result = json.loads(output)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def import_times(modules=MODULES, repeat=5):
+    """
+    Measures each of the given modules with `measure`, and returns a `dict`
+    of the results by module name.
+    """
+    return dict((module, measure(module, repeat)) for module in modules)
+
+
+def main():
+    for module, m in sorted(import_times().iteritems()):
+        print '%-28s %8.1f ms %5d modules' % (module, m['seconds'] * 1000.0, m['modules'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+Times each of the main stages of building and writing a document, at a range
+of document sizes, and compares the results against a stored baseline.
+
+Each stage is run on documents of randomly placed circles, and its rate (in
+shapes, points, or megabytes per second) is reported for each size. The best
+of several repeats is kept, to filter out noise from other processes. Run it
+as a script::
+
+    $ python -m benchmarks.run --sizes 1000,10000,100000
+    $ python -m benchmarks.run --output results.json
+    $ python -m benchmarks.run --save-baseline
+
+The memory used by each circle, and the time taken to import the main
+modules (see `benchmarks.import_time`), are reported along with the stages.
+Results are printed as a table, and can be written out as JSON. Any stage
+which is slower than the baseline by more than the tolerance is reported as
+a regression, and the script exits with a non-zero status.
+"""
+
+import argparse
+import json
+import os.path
+import platform
+import random
+import StringIO
+import sys
+import timeit
+
+import pyps
+from pyps.shapes import Circle
+from pyps.writers.postscript import EPSWriter
+
+from benchmarks import circle_memory, import_time
+
+
+DEFAULT_SIZES = (1000, 10000)
+"""
+The numbers of shapes each stage is measured with, by default. Larger sizes,
+up to 10\ :sup:`6`, can be given with ``--sizes``.
+"""
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+"""
+The stored results that new results are compared against.
+"""
+
+DEFAULT_TOLERANCE = 0.25
+"""
+The fraction by which a rate may drop below its baseline before it is
+reported as a regression.
+"""
+
+
+def _circle_args(count, seed=1618):
+    rand = random.Random(seed)
+    return [
+        ((rand.uniform(0, 1000), rand.uniform(0, 1000)), rand.uniform(1, 20))
+        for i in xrange(count)
+    ]
+
+def _circles(count):
+    return [Circle(center, radius, fill=(0.2, 0.5, 0.7)) for center, radius in _circle_args(count)]
+
+def _document(count):
+    doc = pyps.Document()
+    doc.add_shape(*_circles(count))
+    return doc
+
+def _points(count, seed=2718):
+    rand = random.Random(seed)
+    return [(rand.uniform(0, 1000), rand.uniform(0, 1000)) for i in xrange(count)]
+
+
+class _NullStream(object):
+    """ An output stream which only counts the bytes written to it. """
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+#Each stage takes a size and returns a pair of callables: a setup function,
+# whose result is passed to the timed function, which returns the number of
+# units it processed.
+
+def _stage_construct(count):
+    args = _circle_args(count)
+    def run(_):
+        for center, radius in args:
+            Circle(center, radius, fill=(0.2, 0.5, 0.7))
+        return count
+    return None, run
+
+def _stage_add_shape(count):
+    def run(circles):
+        doc = pyps.Document()
+        for c in circles:
+            doc.add_shape(c)
+        return count
+    return lambda: _circles(count), run
+
+def _stage_render(count):
+    def run(circles):
+        for c in circles:
+            c.render()
+        return count
+    return lambda: _circles(count), run
+
+def _stage_eps_write(count):
+    def run(doc):
+        ostream = _NullStream()
+        EPSWriter().write(ostream, doc)
+        return ostream.bytes / 1e6
+    return lambda: _document(count), run
+
+def _stage_hittest(count):
+    points = _points(count)
+    def run(circles):
+        #Test every point against a fixed number of circles, so the rate is
+        # comparable between sizes.
+        tests = 0
+        for c in circles[:100]:
+            for x, y in points:
+                c.hittest(x, y)
+            tests += len(points)
+        return tests
+    return lambda: _circles(count), run
+
+def _stage_shapes_at(count):
+    points = _points(1000)
+    def setup():
+        doc = _document(count)
+        #Build the index outside of the timed loop.
+        doc.shapes_at(-1, -1)
+        return doc
+    def run(doc):
+        for x, y in points:
+            doc.shapes_at(x, y)
+        return len(points)
+    return setup, run
+
+def _stage_boundingbox(count):
+    def run(circles):
+        for c in circles:
+            bbox = c.boundingbox()
+            bbox.lowerleft.coords()
+            bbox.upperright.coords()
+        return count
+    return lambda: _circles(count), run
+
+
+STAGES = (
+    ('construct', 'shapes/s', _stage_construct),
+    ('add_shape', 'shapes/s', _stage_add_shape),
+    ('render', 'shapes/s', _stage_render),
+    ('eps_write', 'MB/s', _stage_eps_write),
+    ('hittest', 'tests/s', _stage_hittest),
+    ('shapes_at', 'queries/s', _stage_shapes_at),
+    ('boundingbox', 'shapes/s', _stage_boundingbox),
+)
+"""
+The stages measured, as tuples of :samp:`({name}, {units}, {factory})`.
+"""
+
+
+def measure(stage, count, repeat=3):
+    """
+    Runs one stage ``repeat`` times at the given size, and returns a `dict`
+    with the best time, in ``seconds``, and the corresponding ``rate``.
+    """
+    setup, run = stage(count)
+    best = None
+    for i in xrange(repeat):
+        arg = setup() if setup is not None else None
+        start = timeit.default_timer()
+        units = run(arg)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, units)
+    seconds, units = best
+    return {
+        'seconds': seconds,
+        'rate': units / seconds if seconds > 0 else float('inf'),
+    }
+
+def run_all(sizes=DEFAULT_SIZES, repeat=3, stages=None, log=None):
+    """
+    Measures each of the named ``stages`` (by default, all of `STAGES`) at each
+    of the given sizes, and returns the results as a JSON-serializable `dict`.
+    """
+    results = {}
+    for name, units, stage in STAGES:
+        if stages is not None and name not in stages:
+            continue
+        results[name] = {'units': units, 'sizes': {}}
+        for count in sizes:
+            m = measure(stage, count, repeat)
+            results[name]['sizes'][str(count)] = m
+            if log is not None:
+                log('%-12s %9d %14.1f %s\n' % (name, count, m['rate'], units))
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'memory': {'bytes_per_circle': circle_memory.bytes_per_circle()},
+        'imports': import_time.import_times(),
+    }
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares two sets of results from `run_all`, and returns a list of
+    :samp:`({stage}, {size}, {ratio})` tuples for each measurement whose rate
+    in ``current`` is lower than in ``baseline`` by more than ``tolerance``.
+    The ``ratio`` is the current rate divided by the baseline rate. Stages and
+    sizes which are not in both sets are ignored.
+    """
+    regressions = []
+    for name, result in sorted(current['results'].iteritems()):
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        for size, m in sorted(result['sizes'].iteritems(), key=lambda item: int(item[0])):
+            b = base['sizes'].get(size)
+            if b is None or not b['rate']:
+                continue
+            ratio = m['rate'] / b['rate']
+            if ratio < 1.0 - tolerance:
+                regressions.append((name, int(size), ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the main stages of pyps.')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+        help='Comma separated numbers of shapes to measure with.')
+    parser.add_argument('--stages', default=None,
+        help='Comma separated names of the stages to run (default: all).')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='How many times to run each measurement, keeping the best.')
+    parser.add_argument('--output', default=None,
+        help='Write the results to this file as JSON.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+        help='The stored results to compare against.')
+    parser.add_argument('--save-baseline', action='store_true',
+        help='Store the results as the new baseline, instead of comparing.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+        help='The fractional slowdown reported as a regression.')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    stages = args.stages.split(',') if args.stages else None
+    current = run_all(sizes, args.repeat, stages, sys.stdout.write)
+    print 'Bytes per Circle: %.1f' % (current['memory']['bytes_per_circle'],)
+    for module, m in sorted(current['imports'].iteritems()):
+        print 'Import %s: %.1f ms' % (module, m['seconds'] * 1000.0)
+
+    if args.output:
+        with open(args.output, 'w') as ofile:
+            json.dump(current, ofile, indent=2, sort_keys=True, separators=(',', ': '))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as ofile:
+            json.dump(current, ofile, indent=2, sort_keys=True, separators=(',', ': '))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print 'No baseline at %s' % (args.baseline,)
+        return 0
+    with open(args.baseline, 'r') as ifile:
+        baseline = json.load(ifile)
+    regressions = compare(current, baseline, args.tolerance)
+    for name, size, ratio in regressions:
+        print 'REGRESSION: %s at %d shapes is at %.0f%% of baseline' % (name, size, ratio * 100)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
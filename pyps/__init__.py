@@ -3,22 +3,92 @@
 
 """
 The toplevel module for the pyps package.
+
+Importing this module is kept cheap, for short lived processes: the
+`pyps.shapes` package is only imported when shapes are first added to a page,
+if it hasn't already been imported by creating them.
 """
 
 import abc
+import array
 
-from docit import *
+import pyps.geom
+from pyps.geom.rtree import RTree
 
-import pyps.shapes
+#The `pyps.shapes.xforms` module, once `_shapes_xforms` has imported it.
+_xforms = None
+
+def _shapes_xforms():
+    """
+    Returns the `pyps.shapes.xforms` module, importing it, along with the
+    `pyps.shapes` package, the first time it's needed.
+    """
+    global _xforms
+    if _xforms is None:
+        import pyps.shapes.xforms
+        _xforms = pyps.shapes.xforms
+    return _xforms
+
+class Page(object):
+    """
+    A single page of a `Document`, holding an ordered collection of shapes.
+    The order in which shapes are added is their z-order, from bottom to top.
+    """
 
-class Document(object):
     def __init__(self):
         self.__shapes = []
+        self.__index = None
+        self.__bounds = None
+        self.__stroke_pad = 0.0
+        #The extent of each shape when it was added, four values per shape,
+        # which the spatial index is built from.
+        self.__extents = array.array('d')
+
+    @classmethod
+    def _restore(cls, shapes, extents, bounds, stroke_pad):
+        """
+        Creates a page from the state returned by `_saved_state`, without
+        looking at any of its shapes, for `pyps.storage`. ``shapes`` only needs
+        to be a sequence which supports ``len``, indexing, iteration and
+        ``extend``, and ``extents`` a sequence of floats which supports
+        ``tolist``, like a ``numpy`` array. It is copied to an `array.array`
+        if more shapes are added.
+        """
+        page = cls.__new__(cls)
+        page.__shapes = shapes
+        page.__index = None
+        page.__bounds = None if bounds is None else list(bounds)
+        page.__stroke_pad = stroke_pad
+        page.__extents = extents
+        return page
+
+    def _saved_state(self):
+        """
+        Returns the state of the page which `_restore` needs, other than the
+        shapes themselves, as a tuple of :samp:`({extents}, {bounds}, {stroke_pad})`.
+        """
+        return (self.__extents, self.bounds(), self.__stroke_pad)
 
     def add_shape(self, *shapes):
+        _shapes_xforms()
         not_shapes = filter(lambda s : not isinstance(s, pyps.shapes.Shape), shapes)
         if not_shapes:
-            raise TypeError('Only Shapes can be added to a Document: %s' % (', '.join(repr(s) for s in not_shapes)))
+            raise TypeError('Only Shapes can be added to a Page: %s' % (', '.join(repr(s) for s in not_shapes)))
+        #Get every extent before changing anything, so that if one of them
+        # fails, the page is left as it was.
+        new_extents = [self._extent(shape) for shape in shapes]
+
+        index = self.__index
+        extents = self.__extents
+        if not isinstance(extents, array.array):
+            extents = self.__extents = array.array('d', extents.tolist())
+        z = len(self.__shapes)
+        for shape, extent in zip(shapes, new_extents):
+            extents.extend(extent)
+            self._grow_bounds(shape, extent)
+            if index is not None:
+                index.insert(*(extent + (z,)))
+            z += 1
         self.__shapes.extend(shapes)
 
     def get_shapes(self):
@@ -33,3 +103,221 @@ class Document(object):
     def itershapes(self):
         return iter(self.__shapes)
 
+    @staticmethod
+    def _extent(shape):
+        """
+        Returns the current bounding box of the given shape as a tuple of
+        floats, :samp:`({minx}, {miny}, {maxx}, {maxy})`.
+        """
+        return shape.extent()
+
+    def _grow_bounds(self, shape, extent):
+        """
+        Expands the page's aggregate bounding box to include the given
+        extent of the given shape. If the shape is stroked, the extent is first
+        expanded by half the stroke width, since a stroke is centered on the
+        outline of the shape. Transforms don't change the stroke, so the
+        stroke of a transformed shape is that of its leaf shape.
+        """
+        minx, miny, maxx, maxy = extent
+        shape = _shapes_xforms().leaf(shape)
+        if isinstance(shape, pyps.shapes.Paintable) and shape.has_stroke():
+            pad = float(shape.stroke_width) / 2.0
+            if pad > self.__stroke_pad:
+                self.__stroke_pad = pad
+            minx -= pad
+            miny -= pad
+            maxx += pad
+            maxy += pad
+
+        bounds = self.__bounds
+        if bounds is None:
+            self.__bounds = [minx, miny, maxx, maxy]
+        else:
+            if minx < bounds[0]: bounds[0] = minx
+            if miny < bounds[1]: bounds[1] = miny
+            if maxx > bounds[2]: bounds[2] = maxx
+            if maxy > bounds[3]: bounds[3] = maxy
+
+    def bounds(self):
+        """
+        Returns the aggregate bounding box of all shapes on the page, as a
+        tuple of floats, :samp:`({minx}, {miny}, {maxx}, {maxy})`, or |None| if
+        the page is empty. This includes the strokes of paintable shapes.
+
+        The bounds are updated as each shape is added, so this doesn't need to
+        look at the shapes at all.
+        """
+        if self.__bounds is None:
+            return None
+        return tuple(self.__bounds)
+
+    def boundingbox(self):
+        """
+        Like `bounds`, but returns the box as a `~pyps.shapes.BoundingBox`, or
+        |None| if the page is empty.
+        """
+        if self.__bounds is None:
+            return None
+        import pyps.shapes
+        minx, miny, maxx, maxy = self.__bounds
+        return pyps.shapes.BoundingBox((minx, miny), (maxx, maxy))
+
+    def _get_index(self):
+        """
+        Returns the spatial index of shapes, building it the first time it is
+        needed from the extents recorded by `add_shape`. Once built, it is kept
+        up to date by `add_shape`.
+        """
+        if self.__index is None:
+            #Indexing a list is much faster than indexing a numpy array.
+            e = self.__extents
+            if not isinstance(e, array.array):
+                e = e.tolist()
+            self.__index = RTree.bulk_load(
+                (e[4*z], e[4*z + 1], e[4*z + 2], e[4*z + 3], z) for z in xrange(len(self.__shapes))
+            )
+        return self.__index
+
+    def reindex(self):
+        """
+        Recomputes the aggregate bounding box returned by `bounds`, and
+        discards the spatial index used by `shapes_at` and `shapes_intersecting`,
+        so that it is rebuilt from the current bounding boxes of all shapes the
+        next time it is needed.
+
+        Both of these record each shape's bounding box at the time the shape is
+        added, so you need to call this if shapes that are already on the page
+        are moved.
+        """
+        self.__index = None
+        self.__bounds = None
+        self.__stroke_pad = 0.0
+        self.__extents = extents = array.array('d')
+        for shape in self.__shapes:
+            extent = self._extent(shape)
+            extents.extend(extent)
+            self._grow_bounds(shape, extent)
+
+    def shapes_at(self, x, y):
+        """
+        Returns a tuple of all shapes on the page which contain the given
+        point, according to their `~pyps.shapes.Shape.hittest` method.
+
+        Shapes are returned in z-order, which is the order in which they were
+        added to the page. Only shapes whose bounding box contains the point
+        are hit-tested, so this does not need to scan the entire page.
+
+        :param float x: The X coordinate of the point to test.
+        :param float y: The Y coordinate of the point to test.
+        """
+        x = float(x)
+        y = float(y)
+        shapes = self.__shapes
+        hits = sorted(self._get_index().search_point(x, y))
+        return tuple(shapes[z] for z in hits if shapes[z].hittest(x, y))
+
+    def shapes_intersecting(self, pt1, pt2, strokes=False):
+        """
+        Returns a tuple of all shapes on the page whose bounding box
+        intersects the rectangle with opposite corners ``pt1`` and ``pt2``.
+
+        Like `shapes_at`, shapes are returned in z-order.
+
+        :param pt1: One corner of the rectangle.
+        :type pt1: Anything castable by `~pyps.geom.Point`.
+
+        :param pt2: The opposite corner of the rectangle.
+        :type pt2: Anything castable by `~pyps.geom.Point`.
+
+        :param bool strokes: If |TRUE|, the rectangle is first expanded by half
+            the width of the widest stroke on the page, so that every shape
+            whose stroke might reach into the rectangle is included, along
+            with some which don't.
+        """
+        x1, y1 = pyps.geom.Point.cast(pt1).coords()
+        x2, y2 = pyps.geom.Point.cast(pt2).coords()
+        pad = self.__stroke_pad if strokes else 0.0
+        shapes = self.__shapes
+        hits = sorted(self._get_index().search(
+            min(x1, x2) - pad, min(y1, y2) - pad, max(x1, x2) + pad, max(y1, y2) + pad))
+        return tuple(shapes[z] for z in hits)
+
+
+class Document(object):
+    """
+    A document is a sequence of one or more `Page` objects. A new document
+    starts with a single empty page, and more are added with `new_page`.
+
+    The last page is the *current page*. For convenience, and so that single
+    page documents don't need to deal with pages at all, the document's shape
+    methods (`add_shape`, `itershapes`, `bounds`, `shapes_at`, etc.) all
+    act on the current page.
+    """
+
+    def __init__(self):
+        self.__pages = [Page()]
+
+    @classmethod
+    def _restore(cls, pages):
+        """
+        Creates a document holding the given pages, which must not be empty,
+        for `pyps.storage`.
+        """
+        document = cls.__new__(cls)
+        document.__pages = list(pages)
+        return document
+
+    def new_page(self):
+        """
+        Adds a new, empty page to the end of the document, which becomes the
+        current page. Returns the new `Page`.
+        """
+        page = Page()
+        self.__pages.append(page)
+        return page
+
+    def page_count(self):
+        return len(self.__pages)
+
+    def get_page(self, idx):
+        return self.__pages[idx]
+
+    def get_pages(self):
+        return tuple(self.__pages)
+
+    def iterpages(self):
+        return iter(self.__pages)
+
+    def current_page(self):
+        return self.__pages[-1]
+
+    def add_shape(self, *shapes):
+        self.__pages[-1].add_shape(*shapes)
+
+    def get_shapes(self):
+        return self.__pages[-1].get_shapes()
+
+    def shape_count(self):
+        return self.__pages[-1].shape_count()
+
+    def get_shape(self, idx):
+        return self.__pages[-1].get_shape(idx)
+
+    def itershapes(self):
+        return self.__pages[-1].itershapes()
+
+    def bounds(self):
+        return self.__pages[-1].bounds()
+
+    def boundingbox(self):
+        return self.__pages[-1].boundingbox()
+
+    def reindex(self):
+        self.__pages[-1].reindex()
+
+    def shapes_at(self, x, y):
+        return self.__pages[-1].shapes_at(x, y)
+
+    def shapes_intersecting(self, pt1, pt2, strokes=False):
+        return self.__pages[-1].shapes_intersecting(pt1, pt2, strokes)
@@ -3,14 +3,45 @@
 
 import abc
 import collections
-import colour
+import string
 
-class Color(object):
+from pyps.geom import cast_error, SlotPickleMixin
+
+_FIXED_CACHE_LIMIT = 256
+"""
+The number of distinct argument lists for which `Color.Fixed` keeps the
+resolved `FixedColor`, discarding the least recently used beyond that.
+"""
+
+_fixed_cache = collections.OrderedDict()
+
+_HEX_DIGITS = frozenset(string.hexdigits)
+
+
+def _parse_hex(value):
+    """
+    Parses a hex color string of the form ``#rgb`` or ``#rrggbb``, the same
+    as `colour.Color` does, into a tuple of normalized floats. Returns |None|
+    if ``value`` isn't a string of either form.
+    """
+    if not isinstance(value, basestring) or value[:1] != '#' or not _HEX_DIGITS.issuperset(value[1:]):
+        return None
+    digits = value[1:]
+    if len(digits) == 3:
+        return tuple(int(d * 2, 16) / 255.0 for d in digits)
+    if len(digits) == 6:
+        return (int(digits[0:2], 16) / 255.0, int(digits[2:4], 16) / 255.0, int(digits[4:6], 16) / 255.0)
+    return None
+
+
+class Color(SlotPickleMixin):
 
     __metaclass__ = abc.ABCMeta
 
+    __slots__ = ()
+
     @staticmethod
-    def cast(other, error_message=None):
+    def cast(other, error_message=None, *error_args):
         """
         Attempts to cast the given object to an instance of `Color`.
 
@@ -23,31 +54,66 @@ class Color(object):
         :param other:   The object to cast to a `Color`.
 
         :param error_message:   Optional, if given, this is used as the error message
-            if a |TypeError| is generated.
+            if a |TypeError| is generated. If any ``error_args`` are given, it
+            is a format string for them, which is only formatted if the error
+            is actually raised, see `~pyps.geom.cast_error`.
 
         :raises TypeError:  If ``other`` is not castable to a `Color`.
         """
 
-        if isinstance(other, Color):
+        #Check for the most common types directly, before the much slower
+        # checks against abstract base classes.
+        t = type(other)
+        if t is FixedColor:
+            return other
+        elif t is tuple:
+            if len(other) in (3, 4):
+                return FixedColor(*other)
+        elif isinstance(other, Color):
             return other
         elif isinstance(other, collections.Sequence):
             if len(other) in (3, 4):
                 return FixedColor(*other)
-        
-        raise TypeError(error_message or ('Could not cast to Color: %r' % (other,)))
+
+        raise cast_error(other, 'Could not cast to Color: %r', error_message, error_args)
 
     @staticmethod
     def Fixed(*args, **kwargs):
         """
         Generates an instance of `FixedColor` using the same parameters as `colour.Color`.
+
+        Hex strings like ``'#66ff99'`` are parsed directly, anything else is
+        resolved by ``colour``, which is only imported the first time it's
+        needed. The results for the most recently used argument lists are
+        cached, so calling this again with the same arguments returns the
+        same `FixedColor` instance.
         """
-        return FixedColor(*(colour.Color(*args, **kwargs).rgb))
+        try:
+            key = (args, tuple(sorted(kwargs.iteritems()))) if kwargs else (args,)
+            color = _fixed_cache.pop(key, None)
+        except TypeError:
+            #Unhashable arguments can't be cached.
+            key = color = None
+
+        if color is None:
+            rgb = _parse_hex(args[0]) if len(args) == 1 and not kwargs else None
+            if rgb is None:
+                import colour
+                rgb = colour.Color(*args, **kwargs).rgb
+            color = FixedColor(*rgb)
+            if key is not None and len(_fixed_cache) >= _FIXED_CACHE_LIMIT:
+                _fixed_cache.popitem(last=False)
+
+        if key is not None:
+            #Put it back at the most recently used end.
+            _fixed_cache[key] = color
+        return color
 
     @staticmethod
-    def cast_or_none(other, error_message=None):
+    def cast_or_none(other, error_message=None, *error_args):
         if other is None:
             return other
-        return Color.cast(other, error_message)
+        return Color.cast(other, error_message, *error_args)
 
 
     @abc.abstractmethod
@@ -62,16 +128,34 @@ class Color(object):
 
 class FixedColor(Color):
 
+    __slots__ = ('_rgb',)
 
     def __init__(self, r, g, b, divisor=1.0):
-        divisor = float(divisor)
-        self._r = float(r) / divisor
-        self._g = float(g) / divisor
-        self._b = float(b) / divisor
-
-        if not all (0.0 <= c <= 1.0 for c in (self._r, self._g, self._b)):
+        if divisor == 1.0:
+            r = float(r)
+            g = float(g)
+            b = float(b)
+        else:
+            divisor = float(divisor)
+            r = float(r) / divisor
+            g = float(g) / divisor
+            b = float(b) / divisor
+        if not (0.0 <= r <= 1.0 and 0.0 <= g <= 1.0 and 0.0 <= b <= 1.0):
             raise ValueError("RGB Value must have normalized values between 0 and 1.")
+        self._rgb = (r, g, b)
+
+    @classmethod
+    def trusted(cls, r, g, b):
+        """
+        Creates a color from normalized float components which are already
+        known to be valid, skipping the conversions and range checks done by
+        the constructor. This is meant for bulk loaders whose input has
+        already been validated.
+        """
+        color = cls.__new__(cls)
+        color._rgb = (r, g, b)
+        return color
 
     def rgbf(self):
-        return (self._r, self._g, self._b)
+        return self._rgb
 
@@ -4,20 +4,165 @@
 import abc
 import collections
 import math
+import weakref
 
 RADS_PER_DEG = math.pi / 180.0
 
 
-class Point(object):
+def arc_to_beziers(cx, cy, radius, start_deg, stop_deg, ccw=True):
+    """
+    Approximates a circular arc with a sequence of cubic Bezier curves, for
+    output formats that have no arc primitive.
+
+    The arc follows the same rules as the PostScript ``arc`` and ``arcn``
+    operators: for a counter-clockwise arc, ``stop_deg`` is increased by
+    multiples of 360 until it is not less than ``start_deg``, and for a
+    clockwise arc, it is decreased until it is not greater. Each curve covers
+    at most 90 degrees of the arc.
+
+    :returns: A tuple :samp:`({start}, {curves})`, where ``start`` is the
+        :samp:`({x}, {y})` starting point of the arc, and ``curves`` is a list
+        of :samp:`({x1}, {y1}, {x2}, {y2}, {x3}, {y3})` tuples, giving the two
+        control points and the end point of each curve, in order.
+    """
+    if ccw:
+        while stop_deg < start_deg:
+            stop_deg += 360.0
+    else:
+        while stop_deg > start_deg:
+            stop_deg -= 360.0
+
+    sweep = (stop_deg - start_deg) * RADS_PER_DEG
+    count = max(1, int(math.ceil(abs(sweep) / (math.pi / 2.0) - 1e-9)))
+    step = sweep / count
+    k = radius * 4.0 / 3.0 * math.tan(step / 4.0)
+
+    a = start_deg * RADS_PER_DEG
+    cos_a = math.cos(a)
+    sin_a = math.sin(a)
+    start = (cx + radius * cos_a, cy + radius * sin_a)
+    curves = []
+    for i in xrange(count):
+        b = a + step
+        cos_b = math.cos(b)
+        sin_b = math.sin(b)
+        curves.append((
+            cx + radius * cos_a - k * sin_a, cy + radius * sin_a + k * cos_a,
+            cx + radius * cos_b + k * sin_b, cy + radius * sin_b - k * cos_b,
+            cx + radius * cos_b, cy + radius * sin_b,
+        ))
+        a, cos_a, sin_a = b, cos_b, sin_b
+    return start, curves
+
+
+def cast_error(other, default, error_message=None, error_args=()):
+    """
+    Returns the |TypeError| raised by the ``cast`` methods when ``other``
+    can't be cast. If ``error_args`` are given, ``error_message`` is a format
+    string for them, which is only formatted here, when it's actually needed.
+    Otherwise ``error_message`` is used as it is, and if it isn't given, the
+    ``default`` format string is formatted with ``other``.
+    """
+    if error_message is None:
+        return TypeError(default % (other,))
+    if error_args:
+        return TypeError(error_message % error_args)
+    return TypeError(error_message)
+
+
+_slot_names = {}
+
+
+class SlotPickleMixin(object):
+    """
+    Lets instances of classes which use ``__slots__`` be pickled with every
+    pickle protocol. Without this, protocols below 2 refuse to pickle them.
+
+    The state is a dictionary of the values of all slots declared by the class
+    and its bases, along with the instance's ``__dict__``, if it has one.
+    Slots which aren't set are left out, as are those named in
+    ``_transient_slots``, which are set to |None| when the state is restored.
+    """
+
+    __slots__ = ()
+
+    _transient_slots = ()
+
+    def __getstate__(self):
+        state = {}
+        transient = self._transient_slots
+        for name in _get_slot_names(type(self)):
+            if name in transient:
+                continue
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        state.update(getattr(self, '__dict__', ()))
+        #Wrapped in a tuple, because an empty state would never be restored.
+        return (state,)
+
+    def __setstate__(self, state):
+        for name in self._transient_slots:
+            setattr(self, name, None)
+        for name, value in state[0].iteritems():
+            setattr(self, name, value)
+
+
+def _get_slot_names(cls):
+    """
+    Returns a tuple of the names of all slots declared by the given class and
+    its bases, with private names mangled, for `SlotPickleMixin`.
+    """
+    names = _slot_names.get(cls)
+    if names is None:
+        names = []
+        for c in cls.__mro__:
+            slots = c.__dict__.get('__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            for name in slots:
+                if name in ('__dict__', '__weakref__'):
+                    continue
+                if name.startswith('__') and not name.endswith('__'):
+                    name = '_%s%s' % (c.__name__.lstrip('_'), name)
+                names.append(name)
+        names = _slot_names[cls] = tuple(names)
+    return names
+
+
+class Point(SlotPickleMixin):
     """
     Abstract class provides the interface for all points.
     """
 
     __metaclass__ = abc.ABCMeta
 
+    __slots__ = ()
+
     @staticmethod
-    def cast(other, error_message=None):
-        if isinstance(other, Point):
+    def cast(other, error_message=None, *error_args):
+        """
+        Attempts to cast the given object to a `Point`. Points are returned as
+        they are, and sequences of two numbers are made into a `Pt`, as is
+        ``0``, for the origin.
+
+        :param error_message: Optional, the message of the |TypeError| raised
+            if ``other`` can't be cast. If any ``error_args`` are given, this is
+            a format string for them, which is only formatted if the error is
+            actually raised. See `cast_error`.
+
+        :raises TypeError: If ``other`` is not castable to a `Point`.
+        """
+        #Check for the most common types directly, before the much slower
+        # checks against abstract base classes.
+        t = type(other)
+        if t is Pt:
+            return other
+        elif t is tuple:
+            if len(other) == 2:
+                return Pt(*other)
+        elif isinstance(other, Point):
             return other
         elif isinstance(other, collections.Sequence):
             if len(other) == 2:
@@ -26,8 +171,8 @@ class Point(object):
             if other == 0:
                 return Pt(0, 0)
 
-        raise TypeError(error_message or ('Could not cast to a Point: %r' % (other,)))
-            
+        raise cast_error(other, 'Could not cast to a Point: %r', error_message, error_args)
+
 
     @abc.abstractmethod
     def coords(self):
@@ -66,6 +211,29 @@ class Point(object):
     def translate(self, dx=0, dy=0):
         return Translated(self, dx, dy)
 
+    def version(self):
+        """
+        Returns a counter which changes whenever the coordinates of this point
+        change, or |None| if the point cannot tell when that happens, in which
+        case it must be assumed to change at any time.
+
+        The default implementation returns |None|.
+        """
+        return None
+
+    def _observe(self, dependent):
+        """
+        Asks this point to call ``dependent._invalidate()`` whenever its
+        coordinates change. This is how a `DerivedPoint` knows when it is safe
+        to keep using its cached coordinates.
+
+        Returns |TRUE| if the point will do so (or if it never changes), or
+        |FALSE| if it cannot tell when it changes, in which case anything
+        derived from it must not be cached. The default implementation returns
+        |FALSE|.
+        """
+        return False
+
     def pin(self):
         """
         Creates and returns an instance of `Pt` at the current location of this
@@ -79,30 +247,188 @@ class Pt(Point):
     Represents a `Point` at a fixed location.
     """
 
+    #Value types like this get created in huge numbers, so use slots instead of
+    # a per-instance `__dict__`.
+    __slots__ = ('_coords',)
+
     def __init__(self, x, y):
-        self.__x = x
-        self.__y = y
-        self.__coords = (x, y)
+        self._coords = (x, y)
 
     def coords(self):
-        return self.__coords
+        return self._coords
 
     @property
     def x(self):
-        return self.__x
+        return self._coords[0]
 
     @property
     def y(self):
-        return self.__y
+        return self._coords[1]
+
+    def version(self):
+        return 0
+
+    def _observe(self, dependent):
+        #Fixed points never change, so there's nothing to tell the dependent.
+        return True
+
+
+class _ObservablePoint(Point):
+    """
+    Base class for points which keep a version counter and notify their
+    dependents (registered through `Point._observe`) when they change.
+    """
+
+    __slots__ = ('_version', '_dependents')
+
+    #Dependents register themselves again when they're unpickled.
+    _transient_slots = ('_dependents',)
 
+    def __init__(self):
+        self._version = 0
+        self._dependents = None
 
-class Float(object):
+    def version(self):
+        return self._version
+
+    def _observe(self, dependent):
+        #Most points never have dependents, so only create the set when needed.
+        if self._dependents is None:
+            self._dependents = weakref.WeakSet()
+        self._dependents.add(dependent)
+        return True
+
+    def _changed(self):
+        """
+        Called when the coordinates of this point change, to bump the version
+        and invalidate all dependents.
+        """
+        self._version += 1
+        if self._dependents:
+            for dependent in list(self._dependents):
+                dependent._invalidate()
+
+
+class MovablePt(_ObservablePoint):
+    """
+    A `Point` at a location which can be changed, with `move_to` or `move_by`.
+    Any derived points which depend on it are updated when it moves.
+    """
+
+    __slots__ = ('_coords',)
+
+    def __init__(self, x, y):
+        _ObservablePoint.__init__(self)
+        self._coords = (x, y)
+
+    def coords(self):
+        return self._coords
+
+    def move_to(self, x, y):
+        """
+        Moves the point to the given coordinates. If that is where it already
+        is, then nothing happens, and derived points are not invalidated.
+        """
+        coords = (x, y)
+        if coords != self._coords:
+            self._coords = coords
+            self._changed()
+
+    def move_by(self, dx, dy):
+        """
+        Moves the point by the given offsets, like `move_to`.
+        """
+        x, y = self._coords
+        self.move_to(x + dx, y + dy)
+
+
+class DerivedPoint(_ObservablePoint):
+    """
+    Abstract base class for points whose coordinates are computed from other
+    "source" points.
+
+    Computed coordinates are cached. The cache is discarded, and the version
+    of this point bumped, only when one of the source points actually
+    changes, and that invalidation is passed on to points derived from this
+    one. So a chain of derived points is only re-evaluated after something
+    upstream moves, no matter how often it is read.
+
+    If any source point cannot tell when it changes (i.e., its
+    `~Point.version` is |None|), nothing is cached and coordinates are
+    computed every time they are needed.
+
+    Subclasses implement `_compute`, and pass their source points to this
+    class's constructor.
+    """
+
+    __slots__ = ('_cache', '_tracked', '_sources', '__weakref__')
+
+    _transient_slots = ('_dependents', '_cache')
+
+    def __init__(self, *sources):
+        _ObservablePoint.__init__(self)
+        self._cache = None
+        self._sources = sources
+        self._observe_sources()
+
+    def __setstate__(self, state):
+        _ObservablePoint.__setstate__(self, state)
+        self._observe_sources()
+
+    def _observe_sources(self):
+        """
+        Registers this point with each of its source points, and records
+        whether they can all tell when they change.
+        """
+        tracked = True
+        for source in self._sources:
+            if not source._observe(self):
+                tracked = False
+        self._tracked = tracked
+
+    @abc.abstractmethod
+    def _compute(self):
+        """
+        Computes and returns the current coordinates of the point, as for
+        `~Point.coords`.
+        """
+        raise NotImplementedError()
+
+    def coords(self):
+        coords = self._cache
+        if coords is None:
+            coords = self._compute()
+            if self._tracked:
+                self._cache = coords
+        return coords
+
+    def version(self):
+        if self._tracked:
+            return self._version
+        return None
+
+    def _observe(self, dependent):
+        if not self._tracked:
+            return False
+        return _ObservablePoint._observe(self, dependent)
+
+    def _invalidate(self):
+        #If nothing is cached, then nothing downstream can have been computed
+        # from us since we last changed, so there's nothing to propagate.
+        if self._cache is not None:
+            self._cache = None
+            self._changed()
+
+
+class Float(SlotPickleMixin):
     """
     Represents a floating value.
     """
 
     __metaclass__ = abc.ABCMeta
 
+    __slots__ = ()
+
     @abc.abstractmethod
     def __float__(self):
         raise NotImplementedError()
@@ -112,6 +438,8 @@ class Float(object):
 
 
 class FixedFloatMixin(Float):
+    __slots__ = ('_float_value',)
+
     def __init__(self, value):
         self._float_value = float(value)
 
@@ -122,16 +450,33 @@ class Length(Float):
     """
     Represents a length.
     """
+
+    __slots__ = ()
+
     @staticmethod
-    def cast(other, error_message=None):
-        if isinstance(other, Length):
+    def cast(other, error_message=None, *error_args):
+        """
+        Attempts to cast the given object to a `Length`. Lengths are returned
+        as they are, and numbers are made into a `FixedLength`. The error
+        message is handled like for `Point.cast`.
+
+        :raises TypeError: If ``other`` is not castable to a `Length`.
+        """
+        t = type(other)
+        if t is FixedLength:
+            return other
+        elif t is float or t is int:
+            return FixedLength(other)
+        elif isinstance(other, Length):
             return other
         elif isinstance(other, (float, int, long)):
             return FixedLength(other)
-        raise TypeError(error_message or ('Could not cast to a Length: %r' % (other,)))
+        raise cast_error(other, 'Could not cast to a Length: %r', error_message, error_args)
 
 
 class FixedLength(FixedFloatMixin, Length):
+    __slots__ = ()
+
     def __init__(self, length):
         FixedFloatMixin.__init__(self, length)
 
@@ -140,13 +485,28 @@ class Angle(Float):
     """
     Represents an angle in degrees.
     """
+
+    __slots__ = ()
+
     @staticmethod
-    def cast(other, error_message=None):
-        if isinstance(other, Angle):
+    def cast(other, error_message=None, *error_args):
+        """
+        Attempts to cast the given object to an `Angle`, in degrees. Angles
+        are returned as they are, and numbers are made into a `FixedAngle`.
+        The error message is handled like for `Point.cast`.
+
+        :raises TypeError: If ``other`` is not castable to an `Angle`.
+        """
+        t = type(other)
+        if t is FixedAngle:
+            return other
+        elif t is float or t is int:
+            return FixedAngle(other)
+        elif isinstance(other, Angle):
             return other
         elif isinstance(other, (float, int, long)):
             return FixedAngle(other)
-        raise TypeError(error_message or ('Could not cast to a Angle: %r' % (other,)))
+        raise cast_error(other, 'Could not cast to a Angle: %r', error_message, error_args)
 
     def radians(self):
         """
@@ -156,20 +516,26 @@ class Angle(Float):
 
 
 class FixedAngle(FixedFloatMixin, Angle):
+    __slots__ = ()
+
     def __init__(self, angles):
         FixedFloatMixin.__init__(self, angles)
 
 
-class Translated(Point):
+class Translated(DerivedPoint):
     """
     A derived point which is a fixed translation from another Point.
     """
+
+    __slots__ = ('__origin', '__dx', '__dy')
+
     def __init__(self, origin, dx=0, dy=0):
         self.__origin = Point.cast(origin)
         self.__dx = float(dx)
         self.__dy = float(dy)
+        DerivedPoint.__init__(self, self.__origin)
 
-    def coords(self):
+    def _compute(self):
         ox, oy = self.__origin.coords()
         return (ox + self.__dx, oy + self.__dy)
 
@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+The `rtree` module provides a simple in-memory R-tree, for finding items by
+their axis-aligned bounding rectangles without scanning every item.
+
+Rectangles are given as four floats, :samp:`{minx}, {miny}, {maxx}, {maxy}`,
+and items can be any object. The tree only tests rectangles for overlap, so
+any more precise test (like `~pyps.shapes.Shape.hittest`) is left to the
+caller.
+"""
+
+import math
+
+
+class _Node(object):
+    """
+    A single node of an `RTree`. Each entry of a node is a five element list,
+    :samp:`[{minx}, {miny}, {maxx}, {maxy}, {payload}]`, where the payload is
+    an item for a leaf node, or a child `_Node` for an internal node.
+    """
+
+    __slots__ = ('leaf', 'entries')
+
+    def __init__(self, leaf, entries=None):
+        self.leaf = leaf
+        self.entries = entries if entries is not None else []
+
+
+def _enclose(entries):
+    """
+    Returns a new entry list (without a payload) for the rectangle which
+    encloses all of the given entries.
+    """
+    first = entries[0]
+    minx, miny, maxx, maxy = first[0], first[1], first[2], first[3]
+    for e in entries:
+        if e[0] < minx: minx = e[0]
+        if e[1] < miny: miny = e[1]
+        if e[2] > maxx: maxx = e[2]
+        if e[3] > maxy: maxy = e[3]
+    return [minx, miny, maxx, maxy, None]
+
+
+def _area(minx, miny, maxx, maxy):
+    return (maxx - minx) * (maxy - miny)
+
+
+def _enlargement(e, minx, miny, maxx, maxy):
+    """
+    Returns how much the area of entry ``e`` would grow if it were expanded to
+    also enclose the given rectangle.
+    """
+    return _area(min(e[0], minx), min(e[1], miny), max(e[2], maxx), max(e[3], maxy)) - _area(e[0], e[1], e[2], e[3])
+
+
+class RTree(object):
+    """
+    An R-tree of rectangles, supporting incremental insertion with `insert`,
+    bulk construction with `bulk_load`, and overlap queries with `search`.
+
+    Incremental inserts use Guttman's quadratic split. Items are never removed,
+    so nodes are never underfull except as a result of bulk loading.
+    """
+
+    def __init__(self, max_entries=16):
+        if max_entries < 4:
+            raise ValueError('R-tree nodes must hold at least 4 entries: %r' % (max_entries,))
+        self._max_entries = max_entries
+        self._min_entries = max(2, (max_entries * 4) // 10)
+        self._root = _Node(True)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @classmethod
+    def bulk_load(cls, entries, max_entries=16):
+        """
+        Creates a new `RTree` from a sequence of :samp:`({minx}, {miny}, {maxx}, {maxy}, {item})`
+        tuples, using Sort-Tile-Recursive packing. This is much faster than
+        inserting the entries one at a time, and produces a better packed tree.
+        """
+        tree = cls(max_entries)
+        level = [[e[0], e[1], e[2], e[3], e[4]] for e in entries]
+        tree._count = len(level)
+        if not level:
+            return tree
+
+        leaf = True
+        while True:
+            nodes = tree._pack(level, leaf)
+            if len(nodes) == 1:
+                tree._root = nodes[0][4]
+                return tree
+            level = nodes
+            leaf = False
+
+    def _pack(self, entries, leaf):
+        """
+        Packs one level of entries into nodes, returning the list of entries
+        for those nodes, for use as the next level up.
+
+        Nodes are only filled to about 70% of capacity, so that later calls to
+        `insert` don't immediately have to split them.
+        """
+        M = max(self._min_entries, int(self._max_entries * 0.7))
+        node_count = int(math.ceil(len(entries) / float(M)))
+        slice_count = int(math.ceil(math.sqrt(node_count)))
+        slice_size = slice_count * M
+
+        entries.sort(key=lambda e: e[0] + e[2])
+        packed = []
+        for s in xrange(0, len(entries), slice_size):
+            vslice = entries[s:s+slice_size]
+            vslice.sort(key=lambda e: e[1] + e[3])
+            for n in xrange(0, len(vslice), M):
+                group = vslice[n:n+M]
+                parent = _enclose(group)
+                parent[4] = _Node(leaf, group)
+                packed.append(parent)
+        return packed
+
+    def insert(self, minx, miny, maxx, maxy, item):
+        """
+        Adds an item to the tree with the given bounding rectangle.
+        """
+        entry = [minx, miny, maxx, maxy, item]
+
+        #Descend to a leaf, remembering the path so we can adjust bounds
+        # and split on the way back up.
+        path = []
+        node = self._root
+        while not node.leaf:
+            best = None
+            best_growth = best_area = None
+            for e in node.entries:
+                growth = _enlargement(e, minx, miny, maxx, maxy)
+                if best is None or growth < best_growth or (growth == best_growth and _area(*e[:4]) < best_area):
+                    best = e
+                    best_growth = growth
+                    best_area = _area(*e[:4])
+            path.append(best)
+            if minx < best[0]: best[0] = minx
+            if miny < best[1]: best[1] = miny
+            if maxx > best[2]: best[2] = maxx
+            if maxy > best[3]: best[3] = maxy
+            node = best[4]
+
+        node.entries.append(entry)
+        self._count += 1
+
+        #Split overflowing nodes, from the leaf back up to the root.
+        parents = [self._root] + [e[4] for e in path[:-1]]
+        while len(node.entries) > self._max_entries:
+            sibling = self._split(node)
+            if path:
+                pentry = path.pop()
+                pentry[:4] = _enclose(node.entries)[:4]
+                parent = parents.pop()
+                sib_entry = _enclose(sibling.entries)
+                sib_entry[4] = sibling
+                parent.entries.append(sib_entry)
+                node = parent
+            else:
+                old = _enclose(node.entries)
+                old[4] = node
+                new = _enclose(sibling.entries)
+                new[4] = sibling
+                self._root = _Node(False, [old, new])
+                break
+
+    def _split(self, node):
+        """
+        Splits an overflowing node in place using the quadratic split
+        algorithm, returning the new sibling node.
+        """
+        entries = node.entries
+
+        #Pick the two seeds which would waste the most area together.
+        worst = None
+        seeds = (0, 1)
+        for i in xrange(len(entries)):
+            a = entries[i]
+            for j in xrange(i+1, len(entries)):
+                b = entries[j]
+                waste = (_area(min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    - _area(*a[:4]) - _area(*b[:4]))
+                if worst is None or waste > worst:
+                    worst = waste
+                    seeds = (i, j)
+
+        remaining = [e for k, e in enumerate(entries) if k not in seeds]
+        group1 = [entries[seeds[0]]]
+        group2 = [entries[seeds[1]]]
+        bound1 = _enclose(group1)
+        bound2 = _enclose(group2)
+        m = self._min_entries
+
+        while remaining:
+            #Make sure each group gets its minimum share.
+            if len(group1) + len(remaining) <= m:
+                group1.extend(remaining)
+                break
+            if len(group2) + len(remaining) <= m:
+                group2.extend(remaining)
+                break
+
+            #Assign the entry with the strongest preference for one group.
+            best_idx = 0
+            best_diff = None
+            for k, e in enumerate(remaining):
+                diff = abs(_enlargement(bound1, *e[:4]) - _enlargement(bound2, *e[:4]))
+                if best_diff is None or diff > best_diff:
+                    best_diff = diff
+                    best_idx = k
+            e = remaining.pop(best_idx)
+            g1 = _enlargement(bound1, *e[:4])
+            g2 = _enlargement(bound2, *e[:4])
+            if g1 < g2 or (g1 == g2 and len(group1) <= len(group2)):
+                group, bound = group1, bound1
+            else:
+                group, bound = group2, bound2
+            group.append(e)
+            bound[:4] = _enclose([bound, e])[:4]
+
+        node.entries = group1
+        return _Node(node.leaf, group2)
+
+    def search(self, minx, miny, maxx, maxy):
+        """
+        Returns a list of all items whose rectangles intersect (or touch) the
+        given rectangle. The order of the returned items is unspecified.
+        """
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                for e in node.entries:
+                    if e[0] <= maxx and e[2] >= minx and e[1] <= maxy and e[3] >= miny:
+                        found.append(e[4])
+            else:
+                for e in node.entries:
+                    if e[0] <= maxx and e[2] >= minx and e[1] <= maxy and e[3] >= miny:
+                        stack.append(e[4])
+        return found
+
+    def search_point(self, x, y):
+        """
+        Returns a list of all items whose rectangles contain the given point.
+        The order of the returned items is unspecified.
+        """
+        return self.search(x, y, x, y)
+
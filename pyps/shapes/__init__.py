@@ -5,22 +5,68 @@
 The `shapes` module defines the various built in shape objects.
 """
 
-from docit import *
 import math
 import abc
+import array
+import itertools
 
 from pyps import geom
-from pyps.art.color import Color
+from pyps.art.color import Color, FixedColor
 
 
 TAU = 2.0 * math.pi
 
 
+PATH_MOVETO = 0
+PATH_RMOVETO = 1
+PATH_LINETO = 2
+PATH_RLINETO = 3
+PATH_ARC = 4
+PATH_ARCN = 5
+PATH_CURVETO = 6
+"""
+Opcodes for the components of a `Path`. `PATH_ARC` and `PATH_ARCN` are
+counter-clockwise and clockwise arcs, respectively. `PATH_CURVETO` is a cubic
+Bezier curve.
+"""
+
+PATH_ARITY = (2, 2, 2, 2, 5, 5, 6)
+"""
+The number of values each opcode takes from `Path.coordinates`, indexed by
+opcode. Arcs take the center X and Y coordinates, the radius, and the start
+and stop angles, in that order. Curves take the X and Y coordinates of the
+two control points and then the end point, like the PostScript ``curveto``
+operator.
+"""
+
+PATH_COMMANDS = ('M', 'm', 'L', 'l', 'a', 'a', 'C')
+"""
+The command name used in the tuple representation of each opcode.
+"""
+
+CAPABILITY_CIRCLE_BATCH = 'circle-batch'
+"""
+A capability which writers can pass to `Shape.render`, to say that they
+accept `CircleBatch` objects as well as `Path` objects, which
+`CircleArray` renders to instead of one path per circle.
+"""
+
+_DEFAULT_STROKE = FixedColor(0.0, 0.0, 0.0)
+"""
+The stroke color of shapes which aren't given one, shared by all of them.
+"""
+
+_DEFAULT_STROKE_WIDTH = geom.FixedLength(1.0)
+"""
+The stroke width of paint which isn't given one, shared by all of them.
+"""
+
+
 class Paintable(object):
-    def __init__(self, stroke=None, fill=None, stroke_width=1.0):
-        self._stroke = Color.cast_or_none(stroke, 'Paintable stroke must be a color or None: %r' % (stroke,))
-        self._fill = Color.cast_or_none(fill, 'Paintable fill must be a color or None: %r' % (fill,))
-        self._stroke_width = geom.Length.cast(stroke_width, 'Stroke-width must be a length: %r' % (stroke_width,))
+    def __init__(self, stroke=None, fill=None, stroke_width=_DEFAULT_STROKE_WIDTH):
+        self._stroke = Color.cast_or_none(stroke, 'Paintable stroke must be a color or None: %r', stroke)
+        self._fill = Color.cast_or_none(fill, 'Paintable fill must be a color or None: %r', fill)
+        self._stroke_width = geom.Length.cast(stroke_width, 'Stroke-width must be a length: %r', stroke_width)
 
     @property
     def fill(self):
@@ -40,11 +86,39 @@ class Paintable(object):
     def has_stroke(self):
         return self._stroke is not None
 
+    def _paint_is_fixed(self):
+        """
+        Returns |TRUE| if the stroke width is a `~pyps.geom.FixedLength`, and
+        the stroke and fill are each |None| or a `~pyps.art.color.FixedColor`,
+        so that none of them can change without the object being changed.
+        """
+        if not isinstance(self._stroke_width, geom.FixedLength):
+            return False
+        for color in (self._stroke, self._fill):
+            if color is not None and not isinstance(color, FixedColor):
+                return False
+        return True
+
 
 class Path(Paintable):
+    """
+    A path is a sequence of drawing commands, along with the paint used to
+    draw it.
+
+    Iterating over a path, or indexing it, gives each command as a tuple whose
+    first element is a one character command name (``'M'``, ``'m'``, ``'L'``,
+    ``'l'``, or ``'a'``), followed by the command's arguments.
+
+    Internally, commands are stored compactly as one opcode byte each in
+    `opcodes`, with their numeric arguments packed into a single buffer of
+    doubles in `coordinates`. Writers can work on these arrays directly
+    instead of iterating over the command tuples.
+    """
 
     def __init__(self, paint=None, **kwargs):
-        self._components = []
+        self._opcodes = array.array('B')
+        self._coords = array.array('d')
+        self._offsets = None
         if paint is not None:
             kwargs.setdefault('stroke', paint.stroke)
             kwargs.setdefault('stroke_width', paint.stroke_width)
@@ -52,59 +126,319 @@ class Path(Paintable):
         super(Path, self).__init__(**kwargs)
 
     def __str__(self):
-        return '\n    '.join(' '.join(str(x) for x in comp) for comp in self._components)
+        return '\n    '.join(' '.join(str(x) for x in comp) for comp in self)
 
     def __iter__(self):
-        return iter(self._components)
+        coords = self._coords
+        i = 0
+        for op in self._opcodes:
+            n = PATH_ARITY[op]
+            if n == 2:
+                yield (PATH_COMMANDS[op], coords[i], coords[i+1])
+            else:
+                yield self._component(op, i)
+            i += n
 
     def __len__(self):
-        return len(self._components)
+        return len(self._opcodes)
 
     def __getitem__(self, idx):
-        return self._components[idx]
+        if isinstance(idx, slice):
+            return [self[i] for i in xrange(*idx.indices(len(self)))]
+
+        count = len(self._opcodes)
+        if idx < 0:
+            idx += count
+        if not 0 <= idx < count:
+            raise IndexError('Path component index out of range.')
+
+        #Offsets into the coordinate buffer are only needed for random access,
+        # so only build them when asked, and then only for new components.
+        offsets = self._offsets
+        if offsets is None:
+            offsets = self._offsets = array.array('L')
+        if len(offsets) < count:
+            ops = self._opcodes
+            off = offsets[-1] + PATH_ARITY[ops[len(offsets)-1]] if offsets else 0
+            for i in xrange(len(offsets), count):
+                offsets.append(off)
+                off += PATH_ARITY[ops[i]]
+
+        return self._component(self._opcodes[idx], offsets[idx])
+
+    def _component(self, op, offset):
+        """
+        Builds the tuple representation of a single component, given its
+        opcode and the offset of its arguments in the coordinate buffer.
+        """
+        args = tuple(self._coords[offset:offset+PATH_ARITY[op]])
+        if op == PATH_ARC:
+            return ('a',) + args + (True,)
+        elif op == PATH_ARCN:
+            return ('a',) + args + (False,)
+        return (PATH_COMMANDS[op],) + args
+
+    @property
+    def opcodes(self):
+        """
+        The opcodes of the path's components, in order, as an `array.array <python:array>`
+        of unsigned bytes. Each opcode is one of the ``PATH_*`` constants in
+        this module, and consumes `PATH_ARITY[opcode] <PATH_ARITY>` values from
+        `coordinates`.
+
+        This is the path's own storage, not a copy, so it must not be modified.
+        """
+        return self._opcodes
+
+    @property
+    def coordinates(self):
+        """
+        The numeric arguments of all the path's components, in order, as a
+        contiguous `array.array <python:array>` of doubles. This supports the
+        buffer interface, so it can be wrapped without copying, e.g., by
+        ``numpy.frombuffer``.
+
+        This is the path's own storage, not a copy, so it must not be modified.
+        """
+        return self._coords
+
+    def translated(self, dx, dy):
+        """
+        Returns a copy of this path, with the same paint, moved by ``dx`` and
+        ``dy``. Only absolute positions are changed: the end points of
+        absolute move-to and line-to components and the centers of arcs.
+
+        :param float dx: The distance to move the path along the X axis.
+        :param float dy: The distance to move the path along the Y axis.
+
+        :rtype: `Path`
+        """
+        path = self._copy_paint()
+        path._opcodes = array.array('B', self._opcodes)
+        coords = path._coords = array.array('d', self._coords)
+        dx = float(dx)
+        dy = float(dy)
+        i = 0
+        for op in self._opcodes:
+            if op != PATH_RMOVETO and op != PATH_RLINETO:
+                coords[i] += dx
+                coords[i+1] += dy
+            i += PATH_ARITY[op]
+        return path
+
+    def transformed(self, matrix):
+        """
+        Returns a copy of this path, with the same paint, transformed by an
+        affine transformation. Stroke widths are not transformed.
+
+        All of the path's coordinates are transformed together, with a few
+        array operations. Absolute positions get the full transformation, the
+        offsets of relative components get only its linear part. If the
+        transformation preserves circles (that is, it only rotates, reflects,
+        translates, and scales uniformly), arcs are transformed into arcs,
+        otherwise they are first converted to Bezier curves with
+        `~pyps.geom.arc_to_beziers`.
+
+        :param matrix: The transformation, as a 3x3 matrix which maps the
+            column vector :samp:`({x}, {y}, 1)` to the transformed point.
+        :type matrix: A ``numpy`` array, or anything that can be converted to one.
+
+        :rtype: `Path`
+        """
+        import numpy
+        m = numpy.asarray(matrix, dtype=float)
+        a, c, e = m[0]
+        b, d, f = m[1]
+
+        #A similarity has orthogonal columns of equal length. A negative
+        # determinant means it includes a reflection.
+        det = a*d - b*c
+        scale = math.sqrt(abs(det))
+        tolerance = 1e-9 * max(abs(a), abs(b), abs(c), abs(d))
+        similar = abs(a*c + b*d) <= tolerance and abs(a*a + b*b - c*c - d*d) <= tolerance and scale > 0
+
+        source = self
+        if not similar and (PATH_ARC in self._opcodes or PATH_ARCN in self._opcodes):
+            source = self._arcs_to_curves()
+
+        ops = numpy.frombuffer(source._opcodes, dtype=numpy.uint8)
+        coords = numpy.frombuffer(source._coords, dtype=numpy.float64).copy()
+        arity = numpy.array(PATH_ARITY, dtype=numpy.intp)[ops]
+        starts = numpy.cumsum(arity) - arity
+
+        relative = (ops == PATH_RMOVETO) | (ops == PATH_RLINETO)
+        curves = starts[ops == PATH_CURVETO]
+        absolute = numpy.concatenate((starts[~relative], curves + 2, curves + 4))
+        relative = starts[relative]
+
+        xs, ys = coords[absolute], coords[absolute + 1]
+        coords[absolute] = a*xs + c*ys + e
+        coords[absolute + 1] = b*xs + d*ys + f
+        xs, ys = coords[relative], coords[relative + 1]
+        coords[relative] = a*xs + c*ys
+        coords[relative + 1] = b*xs + d*ys
+
+        opcodes = array.array('B', source._opcodes)
+        arcs = (ops == PATH_ARC) | (ops == PATH_ARCN)
+        if arcs.any():
+            #The direction the X axis is mapped to gives the rotation. Under a
+            # reflection, angles are mirrored around it, and the arc's
+            # direction is reversed.
+            rotation = math.degrees(math.atan2(b, a))
+            arcs = starts[arcs]
+            coords[arcs + 2] *= scale
+            if det > 0:
+                coords[arcs + 3] += rotation
+                coords[arcs + 4] += rotation
+            else:
+                coords[arcs + 3] = rotation - coords[arcs + 3]
+                coords[arcs + 4] = rotation - coords[arcs + 4]
+                for idx in numpy.flatnonzero((ops == PATH_ARC) | (ops == PATH_ARCN)):
+                    opcodes[idx] = PATH_ARCN if ops[idx] == PATH_ARC else PATH_ARC
+
+        path = self._copy_paint()
+        path._opcodes = opcodes
+        path._coords = array.array('d', coords.tostring())
+        return path
+
+    def _arcs_to_curves(self):
+        """
+        Returns a copy of this path, with each arc replaced by an equivalent
+        sequence of Bezier curves, and the line or move to its start point
+        which is implied by PostScript's ``arc`` operator.
+        """
+        path = self._copy_paint()
+        coords = self._coords
+        current = False
+        i = 0
+        for op in self._opcodes:
+            n = PATH_ARITY[op]
+            if op == PATH_ARC or op == PATH_ARCN:
+                start, curves = geom.arc_to_beziers(*(tuple(coords[i:i+n]) + (op == PATH_ARC,)))
+                path.add_component(PATH_LINETO if current else PATH_MOVETO, *start)
+                for curve in curves:
+                    path.add_component(PATH_CURVETO, *curve)
+            else:
+                path.add_component(op, *coords[i:i+n])
+            current = True
+            i += n
+        return path
+
+    @classmethod
+    def trusted(cls, stroke=None, fill=None, stroke_width=_DEFAULT_STROKE_WIDTH):
+        """
+        Creates a new, empty path with paint which is already known to be
+        valid, skipping the casts done by the constructor: ``stroke`` and
+        ``fill`` must each be a `~pyps.art.color.Color` or |None|, and
+        ``stroke_width`` a `~pyps.geom.Length`. Together with
+        `add_component`, this is meant for bulk loaders whose input has
+        already been validated.
+        """
+        path = cls.__new__(cls)
+        path._opcodes = array.array('B')
+        path._coords = array.array('d')
+        path._offsets = None
+        path._stroke = stroke
+        path._fill = fill
+        path._stroke_width = stroke_width
+        return path
+
+    def _copy_paint(self):
+        """
+        Returns a new, empty path with the same paint as this one. This skips
+        the checks done by the constructor, since the paint has already been
+        checked.
+        """
+        return Path.trusted(self._stroke, self._fill, self._stroke_width)
 
-    def _add(self, command, *args):
-        self._components.append(tuple([command] + list(args)))
+    def add_component(self, opcode, *args):
+        """
+        Appends a component to the path given its opcode, one of the
+        ``PATH_*`` constants, and its `PATH_ARITY[opcode] <PATH_ARITY>`
+        numeric arguments, in the order they are stored in `coordinates`.
+        Unlike the other methods for adding components, nothing is checked or
+        converted, so this is only for input which is already known to be
+        valid. Returns the path.
+        """
+        self._opcodes.append(opcode)
+        self._coords.extend(args)
         return self
 
     def moveTo(self, pt):
         #moveto
-        pt = geom.Point.cast(pt, 'Move-to argument must be a point: %r' % (pt,))
-        return self._add('M', pt.x, pt.y)
+        pt = geom.Point.cast(pt, 'Move-to argument must be a point: %r', pt)
+        return self.add_component(PATH_MOVETO, *pt.coords())
         
     def lineTo(self, pt):
         #lineto
-        pt = geom.Point.cast(pt, 'Line-to argument must be a point: %r' % (pt,))
-        return self._add('L', pt.x, pt.y)
+        pt = geom.Point.cast(pt, 'Line-to argument must be a point: %r', pt)
+        return self.add_component(PATH_LINETO, *pt.coords())
 
     def move(self, dx, dy):
         #rmoveto
-        dx = geom.Length.cast(dx, 'Move dx argument must be a length: %r' % (dx,))
-        dy = geom.Length.cast(dy, 'Move dy argument must be a length: %r' % (dy,))
-        return self._add('m', float(dx), float(dy))
+        dx = geom.Length.cast(dx, 'Move dx argument must be a length: %r', dx)
+        dy = geom.Length.cast(dy, 'Move dy argument must be a length: %r', dy)
+        return self.add_component(PATH_RMOVETO, float(dx), float(dy))
 
     def line(self, dx, dy):
         #rlineto
         #rmoveto
-        dx = geom.Length.cast(dx, 'Line dx argument must be a length: %r' % (dx,))
-        dy = geom.Length.cast(dy, 'Line dy argument must be a length: %r' % (dy,))
-        return self._add('l', float(dx), float(dy))
+        dx = geom.Length.cast(dx, 'Line dx argument must be a length: %r', dx)
+        dy = geom.Length.cast(dy, 'Line dy argument must be a length: %r', dy)
+        return self.add_component(PATH_RLINETO, float(dx), float(dy))
 
     def arc(self, center, radius, start_deg=0, stop_deg=360, ccw=True):
         #arc
-        center = geom.Point.cast(center, 'Center of arc must be a point: %r' % (center,))
-        radius = geom.Length.cast(radius, 'Radius of arc must be a length: %r' % (radius,))
-        start_deg = geom.Angle.cast(start_deg, 'Start-deg of arc must be an angle: %r' % (start_deg,))
-        stop_deg = geom.Angle.cast(stop_deg, 'Stop-deg of arc must be an angle: %r' % (stop_deg,))
-        return self._add('a', center.x, center.y, float(radius), float(start_deg), float(stop_deg), bool(ccw))
-
-    #def curveTo(self, end, cp1, cp2):
-    #    #curveto
-    #
+        center = geom.Point.cast(center, 'Center of arc must be a point: %r', center)
+        radius = geom.Length.cast(radius, 'Radius of arc must be a length: %r', radius)
+        start_deg = geom.Angle.cast(start_deg, 'Start-deg of arc must be an angle: %r', start_deg)
+        stop_deg = geom.Angle.cast(stop_deg, 'Stop-deg of arc must be an angle: %r', stop_deg)
+        cx, cy = center.coords()
+        return self.add_component(PATH_ARC if ccw else PATH_ARCN, cx, cy, float(radius), float(start_deg), float(stop_deg))
+
+    def curveTo(self, end, cp1, cp2):
+        #curveto
+        end = geom.Point.cast(end, 'Curve-to end must be a point: %r', end)
+        cp1 = geom.Point.cast(cp1, 'Curve-to control point must be a point: %r', cp1)
+        cp2 = geom.Point.cast(cp2, 'Curve-to control point must be a point: %r', cp2)
+        return self.add_component(PATH_CURVETO, *(cp1.coords() + cp2.coords() + end.coords()))
+
     #def curve(self, edx, edy, cp1dx, cp1dy, cp2dx, cp2dy):
     #    #rcurveto
 
 
+class CircleBatch(Paintable):
+    """
+    Many full circles which share the same stroke, returned by
+    `CircleArray.render` in place of a separate `Path` for each circle, to
+    writers which pass `CAPABILITY_CIRCLE_BATCH`. Writers draw each circle
+    as if it were its own path, in order.
+
+    The circles are given by ``numpy`` arrays, which are not copied, and must
+    not be modified: `centers` has a row of :samp:`({x}, {y})` for each
+    circle, `radii` a radius for each, and `fills`, if it isn't |None|, an
+    :samp:`({r}, {g}, {b})` fill color for each, in place of `fill`.
+    """
+
+    def __init__(self, paint, centers, radii, fills=None):
+        super(CircleBatch, self).__init__(stroke=paint.stroke, fill=paint.fill, stroke_width=paint.stroke_width)
+        self.centers = centers
+        self.radii = radii
+        self.fills = fills
+
+    def __len__(self):
+        return len(self.radii)
+
+    def translated(self, dx, dy):
+        """
+        Returns a copy of this batch, with the same paint, with every circle
+        moved by ``dx`` and ``dy``, like `Path.translated`.
+
+        :rtype: `CircleBatch`
+        """
+        return CircleBatch(self, self.centers + (float(dx), float(dy)), self.radii, self.fills)
+
+
 class Shape(object):
     """
     This is the base class for all shapes. It defines the interface for shapes
@@ -113,11 +447,50 @@ class Shape(object):
 
     __metaclass__ = abc.ABCMeta
 
+    _revision = 0
+
     def __init__(self, title=None):
         self._title = title
 
     def set_title(self, title):
         self._title = title
+        self.touch()
+
+    def touch(self):
+        """
+        Marks the shape as changed, so that anything cached from it, like a
+        writer's rendered output, is discarded. Shapes call this themselves
+        when they're changed through their own methods, but it needs to be
+        called if they are changed some other way.
+        """
+        self._revision += 1
+
+    def revision(self):
+        """
+        Returns a hashable value which changes whenever the output of `render`
+        might change, or |None| if the shape cannot tell when that happens, in
+        which case its output must never be cached.
+
+        The default implementation returns |None|. Subclasses which can track
+        their changes, including changes to any points they depend on (see
+        `~pyps.geom.Point.version`), should override it.
+        """
+        return None
+
+    def symbol(self):
+        """
+        Returns a hashable key for the shape's output relative to an anchor
+        point, along with that point, as a tuple :samp:`({key}, ({x}, {y}))`,
+        or |None| if the shape can't tell without being rendered. Two shapes
+        with equal keys must render to the same paths apart from their
+        position, and the first point of the first path must be the anchor.
+        This is used by `~pyps.writers.postscript.EPSWriter` to write repeated
+        shapes as instances of a symbol, without rendering each one.
+
+        The default implementation returns |None|. Subclasses which override
+        `render` need to override this too, if they inherit an implementation.
+        """
+        return None
 
     def title(self):
         return self._title
@@ -144,6 +517,32 @@ class Shape(object):
         """
         raise NotImplementedError()
 
+    def hittest_many(self, xs, ys):
+        """
+        Like `hittest`, but tests many points at once. The default
+        implementation simply calls `hittest` for each point, subclasses
+        should override it with a vectorized implementation if they can.
+
+        :param xs: The X coordinates of the points to test.
+        :type xs: A ``numpy`` array, or anything that can be converted to one.
+
+        :param ys: The Y coordinates of the points to test, the same shape as
+            ``xs``.
+        :type ys: A ``numpy`` array, or anything that can be converted to one.
+
+        :returns:
+            A boolean ``numpy`` array the same shape as ``xs`` which is |TRUE|
+            for each point contained by this shape.
+        """
+        import numpy
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype=float), numpy.asarray(ys, dtype=float))
+        hittest = self.hittest
+        mask = numpy.fromiter(
+            (hittest(x, y) for x, y in itertools.izip(xs.flat, ys.flat)),
+            dtype=bool, count=xs.size
+        )
+        return mask.reshape(xs.shape)
+
     @abc.abstractmethod
     def boundingbox(self):
         """
@@ -156,6 +555,19 @@ class Shape(object):
         """
         raise NotImplementedError()
 
+    def extent(self):
+        """
+        Returns the current corners of the shape's `boundingbox` as a tuple of
+        floats, :samp:`({minx}, {miny}, {maxx}, {maxy})`. This is what pages
+        and writers use, since it doesn't need to create a `BoundingBox` with
+        its derived points. The default implementation gets it from
+        `boundingbox`, but subclasses can override it to be faster.
+        """
+        bbox = self.boundingbox()
+        minx, miny = bbox.lowerleft.coords()
+        maxx, maxy = bbox.upperright.coords()
+        return (float(minx), float(miny), float(maxx), float(maxy))
+
     def boundingpoly(self, complexity=0.5):
         """
         Returns a polygon which entirely contains this shape. This is a
@@ -196,7 +608,7 @@ class Shape(object):
 class PaintableShape(Shape, Paintable):
     def __init__(self, title=None, **kwargs):
         Shape.__init__(self, title)
-        kwargs.setdefault('stroke', (0, 0, 0))
+        kwargs.setdefault('stroke', _DEFAULT_STROKE)
         Paintable.__init__(self, **kwargs)
 
 
@@ -283,7 +695,7 @@ class BoundingBox(object):
     # save key strokes. So why not put in the effort once at coding time and
     # improve performance a bit.
 
-    class _LowerLeft(geom.Point):
+    class _LowerLeft(geom.DerivedPoint):
         """
         Simple dynamic point that represents the lower left point of the box
         defined by two opposite points, ``pt1`` and ``pt2``.
@@ -291,6 +703,8 @@ class BoundingBox(object):
         The lower left has minimum X coordinate and minimum Y coordinate of
         the given points.
         """
+        __slots__ = ('_pt1', '_pt2')
+
         def __init__(self, pt1, pt2):
             """
             :param pt1: One of two opposite points that define the box.
@@ -302,60 +716,70 @@ class BoundingBox(object):
             """
             self._pt1 = pt1
             self._pt2 = pt2
+            geom.DerivedPoint.__init__(self, pt1, pt2)
 
-        def coords(self):
+        def _compute(self):
             """
-            Implements `geom.Point.coords <geom.Point.coords>` by dynamically choosing
-            the correct limiting coordinates of the box.
+            Implements `geom.DerivedPoint._compute <geom.DerivedPoint._compute>`
+            by choosing the correct limiting coordinates of the box.
             """
             c1 = self._pt1.coords()
             c2 = self._pt2.coords()
             return min(c1[0], c2[0]), min(c1[1], c2[1])
 
-    class _UpperLeft(geom.Point):
+    class _UpperLeft(geom.DerivedPoint):
         """
         Like `_LowerLeft`, but representing the *upper* left point of the box.
 
         The upper left has minimum X coordinate and maximum Y coordinate of
         the given points.
         """
+        __slots__ = ('_pt1', '_pt2')
+
         def __init__(self, pt1, pt2):
             self._pt1 = pt1
             self._pt2 = pt2
+            geom.DerivedPoint.__init__(self, pt1, pt2)
 
-        def coords(self):
+        def _compute(self):
             c1 = self._pt1.coords()
             c2 = self._pt2.coords()
             return min(c1[0], c2[0]), max(c1[1], c2[1])
 
-    class _LowerRight(geom.Point):
+    class _LowerRight(geom.DerivedPoint):
         """
         Like `_LowerLeft`, but representing the lower *right* point of the box.
 
         The lower right has maximum X coordinate and minimum Y coordinate of
         the given points.
         """
+        __slots__ = ('_pt1', '_pt2')
+
         def __init__(self, pt1, pt2):
             self._pt1 = pt1
             self._pt2 = pt2
+            geom.DerivedPoint.__init__(self, pt1, pt2)
 
-        def coords(self):
+        def _compute(self):
             c1 = self._pt1.coords()
             c2 = self._pt2.coords()
             return max(c1[0], c2[0]), min(c1[1], c2[1])
 
-    class _UpperRight(geom.Point):
+    class _UpperRight(geom.DerivedPoint):
         """
         Like `_LowerLeft`, but representing the *upper* *right* point of the box.
 
         The upper right has maximum X coordinate and maximum Y coordinate of
         the given points.
         """
+        __slots__ = ('_pt1', '_pt2')
+
         def __init__(self, pt1, pt2):
             self._pt1 = pt1
             self._pt2 = pt2
+            geom.DerivedPoint.__init__(self, pt1, pt2)
 
-        def coords(self):
+        def _compute(self):
             c1 = self._pt1.coords()
             c2 = self._pt2.coords()
             return max(c1[0], c2[0]), max(c1[1], c2[1])
@@ -364,10 +788,7 @@ class BoundingBox(object):
 class Circle(PaintableShape):
 
     def __init__(self, center, radius, **kwargs):
-        try:
-            center = geom.Point.cast(center)
-        except TypeError:
-            raise TypeError('Center point must be a point: %r' % (center,))
+        center = geom.Point.cast(center, 'Center point must be a point: %r', center)
 
         if not isinstance(radius, (float, int, long)):
             raise TypeError('Radius must be numeric: %r' % (radius,))
@@ -379,6 +800,30 @@ class Circle(PaintableShape):
 
         super(Circle, self).__init__(**kwargs)
 
+    @classmethod
+    def trusted(cls, center, radius, fill=None, stroke=_DEFAULT_STROKE,
+            stroke_width=_DEFAULT_STROKE_WIDTH, title=None):
+        """
+        Creates a circle from arguments which are already known to be valid,
+        skipping all of the casts and checks done by the constructor. This is
+        meant for bulk loaders which have validated their input already, and
+        is several times faster than the constructor.
+
+        :param center: The center, which must be a `~pyps.geom.Point`.
+        :param float radius: The radius, which must be greater than zero.
+        :param fill: A `~pyps.art.color.Color`, or |None|.
+        :param stroke: A `~pyps.art.color.Color`, or |None|.
+        :param stroke_width: A `~pyps.geom.Length`.
+        """
+        circle = cls.__new__(cls)
+        circle._title = title
+        circle._center = center
+        circle._radius = float(radius)
+        circle._stroke = stroke
+        circle._fill = fill
+        circle._stroke_width = stroke_width
+        return circle
+
     @property
     def center(self):
         return self._center
@@ -398,16 +843,223 @@ class Circle(PaintableShape):
     def getArea(self):
         return math.pi * (self._radius * self._radius)
 
+    def revision(self):
+        version = self._center.version()
+        if version is None or not self._paint_is_fixed():
+            return None
+        return (self._revision, version)
+
+    def symbol(self):
+        fill = self._fill
+        stroke = self._stroke
+        key = (type(self), self._radius, fill.rgbf() if fill else None,
+            stroke.rgbf() if stroke else None, float(self._stroke_width))
+        return key, self._center.coords()
+
     def hittest(self, x, y):
         dx = self._center.x - x
         dy = self._center.y - y
         return dx*dx + dy*dy <= self._radius * self._radius
 
+    def hittest_many(self, xs, ys):
+        import numpy
+        cx, cy = self._center.coords()
+        dx = numpy.asarray(xs, dtype=float) - cx
+        dy = numpy.asarray(ys, dtype=float) - cy
+        return dx*dx + dy*dy <= self._radius * self._radius
+
     def boundingbox(self):
         lowerleft = self._center.translate(-(self._radius), -(self._radius))
         upperright = self._center.translate(self._radius, self._radius)
         return BoundingBox(lowerleft, upperright)
 
+    def extent(self):
+        cx, cy = self._center.coords()
+        r = self._radius
+        return (cx - r, cy - r, cx + r, cy + r)
+
     def render(self, capabilities=[]):
-        return [Path(paint=self).arc(self._center, self._radius)]
+        cx, cy = self._center.coords()
+        path = Path.trusted(self._stroke, self._fill, self._stroke_width)
+        return [path.add_component(PATH_ARC, cx, cy, self._radius, 0.0, 360.0)]
+
+
+class CircleArray(PaintableShape):
+    """
+    Many circles held as a single shape, with their centers, radii, and
+    optionally their fill colors stored in ``numpy`` arrays, instead of as a
+    `Circle` object for each one. This is for things like scatter plots,
+    which can have millions of points.
+
+    All of the circles share the same stroke, and unless ``fills`` is given,
+    the same fill. They are drawn in order, each painted as a separate path,
+    so the result looks the same as for the equivalent sequence of `Circle`
+    shapes. Writers which accept `CircleBatch` objects (see
+    `CAPABILITY_CIRCLE_BATCH`) get them all at once, others get a `Path` for
+    each circle.
+
+    The arrays are copied, and can't be changed afterwards.
 
+    :param centers: The center of each circle.
+    :type centers: An array of :samp:`({x}, {y})` pairs, or anything that can
+        be converted to one.
+
+    :param radii: The radius of each circle, or a single radius for all of
+        them.
+
+    :param fills: Optional, a fill color for each circle, as :samp:`({r}, {g}, {b})`
+        with normalized values, in place of the ``fill`` keyword argument.
+
+    :raises ValueError: If there are no circles, if the arrays don't have
+        matching shapes, or if any radius isn't positive or any color
+        component is outside of the range 0.0 to 1.0.
+    """
+
+    def __init__(self, centers, radii, fills=None, **kwargs):
+        import numpy
+        centers = numpy.array(centers, dtype=float)
+        if centers.ndim != 2 or centers.shape[1] != 2 or not len(centers):
+            raise ValueError('Centers must be a non-empty array of (x, y) pairs, got shape %r.' % (centers.shape,))
+        count = len(centers)
+
+        radii = numpy.array(radii, dtype=float)
+        if radii.ndim == 0:
+            radii = numpy.repeat(radii, count)
+        if radii.shape != (count,):
+            raise ValueError('Radii must be a single radius, or one for each of %d circles.' % (count,))
+        if not (radii > 0).all():
+            raise ValueError('Radii must be greater than zero.')
+
+        if fills is not None:
+            fills = numpy.array(fills, dtype=float)
+            if fills.shape != (count, 3):
+                raise ValueError('Fills must be an (r, g, b) color for each of %d circles.' % (count,))
+            if not ((fills >= 0.0) & (fills <= 1.0)).all():
+                raise ValueError('RGB Value must have normalized values between 0 and 1.')
+            fills.flags.writeable = False
+
+        centers.flags.writeable = False
+        radii.flags.writeable = False
+        self._centers = centers
+        self._radii = radii
+        self._fills = fills
+        self._by_x = None
+
+        super(CircleArray, self).__init__(**kwargs)
+
+    @classmethod
+    def trusted(cls, centers, radii, fills=None, fill=None, stroke=_DEFAULT_STROKE,
+            stroke_width=_DEFAULT_STROKE_WIDTH, title=None):
+        """
+        Like `Circle.trusted`, creates a circle array from arguments which are
+        already known to be valid, without checking or copying them. The
+        arrays must be read-only ``numpy`` arrays of floats, with the shapes
+        described for the constructor, and ``radii`` must have one radius for
+        each circle. This lets a bulk loader use arrays that are mapped from a
+        file directly, see `pyps.storage`.
+        """
+        array = cls.__new__(cls)
+        array._title = title
+        array._centers = centers
+        array._radii = radii
+        array._fills = fills
+        array._by_x = None
+        array._stroke = stroke
+        array._fill = fill
+        array._stroke_width = stroke_width
+        return array
+
+    def __len__(self):
+        return len(self._radii)
+
+    @property
+    def centers(self):
+        """
+        The centers of the circles, as a read-only ``numpy`` array with an
+        :samp:`({x}, {y})` row for each circle.
+        """
+        return self._centers
+
+    @property
+    def radii(self):
+        """
+        The radii of the circles, as a read-only ``numpy`` array.
+        """
+        return self._radii
+
+    @property
+    def fills(self):
+        """
+        The fill color of each circle, as a read-only ``numpy`` array with an
+        :samp:`({r}, {g}, {b})` row for each circle, or |None| if they all use
+        the shape's `fill`.
+        """
+        return self._fills
+
+    def has_fill(self):
+        return self._fills is not None or self._fill is not None
+
+    def revision(self):
+        if not self._paint_is_fixed():
+            return None
+        return (self._revision,)
+
+    def _get_by_x(self):
+        """
+        Returns the circles sorted by the X coordinates of their centers, as a
+        tuple of :samp:`({xs}, {ys}, {radii}, {max_radius})`, building it the
+        first time it is needed. Only the circles whose centers are within the
+        largest radius of a point, along the X axis, can contain it, and
+        those are found with a binary search.
+        """
+        if self._by_x is None:
+            import numpy
+            order = numpy.argsort(self._centers[:, 0], kind='mergesort')
+            self._by_x = (
+                self._centers[order, 0], self._centers[order, 1], self._radii[order],
+                float(self._radii.max())
+            )
+        return self._by_x
+
+    def hittest(self, x, y):
+        return bool(self.hittest_many([x], [y])[0])
+
+    def hittest_many(self, xs, ys):
+        import numpy
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype=float), numpy.asarray(ys, dtype=float))
+        cxs, cys, radii, reach = self._get_by_x()
+        px = xs.ravel()
+        py = ys.ravel()
+        starts = numpy.searchsorted(cxs, px - reach, 'left').tolist()
+        stops = numpy.searchsorted(cxs, px + reach, 'right').tolist()
+        mask = numpy.zeros(len(px), dtype=bool)
+        for i, (x, y, start, stop) in enumerate(zip(px.tolist(), py.tolist(), starts, stops)):
+            if start < stop:
+                dx = cxs[start:stop] - x
+                dy = cys[start:stop] - y
+                r = radii[start:stop]
+                mask[i] = (dx*dx + dy*dy <= r*r).any()
+        return mask.reshape(xs.shape)
+
+    def boundingbox(self):
+        xs = self._centers[:, 0]
+        ys = self._centers[:, 1]
+        r = self._radii
+        return BoundingBox(
+            (float((xs - r).min()), float((ys - r).min())),
+            (float((xs + r).max()), float((ys + r).max()))
+        )
+
+    def render(self, capabilities=[]):
+        if CAPABILITY_CIRCLE_BATCH in capabilities:
+            return [CircleBatch(self, self._centers, self._radii, self._fills)]
+
+        template = Path(paint=self)
+        fills = self._fills.tolist() if self._fills is not None else None
+        paths = []
+        for i, ((cx, cy), r) in enumerate(zip(self._centers.tolist(), self._radii.tolist())):
+            path = template._copy_paint()
+            if fills is not None:
+                path._fill = FixedColor(*fills[i])
+            paths.append(path.add_component(PATH_ARC, cx, cy, r, 0.0, 360.0))
+        return paths
@@ -1,11 +1,69 @@
 #! /usr/bin/env python
 # vim: set fileencoding=utf-8: set encoding=utf-8:
 
-from .. import Shape, BoundingBox
+import abc
+import math
+
+from . import Shape, BoundingBox, CAPABILITY_CIRCLE_BATCH
 
 from pyps import geom
 
-class Translate(Shape):
+
+def leaf(shape):
+    """
+    Returns the shape at the bottom of any chain of transforms applied to
+    ``shape``, or ``shape`` itself if it isn't a `Transform`.
+    """
+    while isinstance(shape, Transform):
+        shape = shape.leaf
+    return shape
+
+
+class Transform(Shape):
+    """
+    Abstract base class for shapes which draw another shape transformed by an
+    affine transformation.
+
+    Transforms apply to the geometry of the transformed shape, not to its
+    paint, so stroke widths are not changed.
+    """
+
+    @abc.abstractproperty
+    def leaf(self):
+        """
+        The shape which is actually drawn, after collapsing any nested
+        transforms.
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def matrix(self):
+        """
+        Returns the transformation applied to `leaf` as a 3x3 ``numpy`` array,
+        which maps the column vector :samp:`({x}, {y}, 1)` in the coordinates
+        of the leaf to global coordinates.
+        """
+        raise NotImplementedError()
+
+
+class Translate(Transform):
+    """
+    A shape which draws another shape moved by a given offset.
+
+    Chains of nested translations are flattened when they're created: the
+    `leaf` shape at the bottom of the chain is wrapped directly, with the
+    offsets of every level added together. So no matter how deeply
+    translations are nested, hit tests and rendering only go through a single
+    level of translation.
+
+    :param dx: The distance to move the shape along the X axis.
+    :type dx: Anything castable by `~pyps.geom.Length`.
+
+    :param dy: The distance to move the shape along the Y axis.
+    :type dy: Anything castable by `~pyps.geom.Length`.
+
+    :param shape: The `Shape` to move.
+    """
 
     def __init__(self, dx, dy, shape):
         self._dx = geom.Length.cast(dx, "Translation dx must be a length.")
@@ -15,26 +73,277 @@ class Translate(Shape):
             raise TypeError('Translation can only be applied to a Shape: %r' % (shape,))
         self._shape = shape
 
+        if isinstance(shape, Translate):
+            self._leaf = shape._leaf
+            self._dxs = shape._dxs + (self._dx,)
+            self._dys = shape._dys + (self._dy,)
+        else:
+            self._leaf = shape
+            self._dxs = (self._dx,)
+            self._dys = (self._dy,)
+
+        #Fixed lengths can be summed once and for all, other lengths have to be
+        # summed each time, in case they change.
+        if all(isinstance(d, geom.FixedLength) for d in self._dxs + self._dys):
+            self._offset = (sum(float(d) for d in self._dxs), sum(float(d) for d in self._dys))
+        else:
+            self._offset = None
+
         super(Translate, self).__init__()
 
+    def matrix(self):
+        import numpy
+        dx, dy = self.offset()
+        return numpy.array([[1.0, 0.0, dx], [0.0, 1.0, dy], [0.0, 0.0, 1.0]])
+
+    @property
+    def shape(self):
+        """
+        The shape this translation was applied to, which may itself be a
+        translation.
+        """
+        return self._shape
+
+    @property
+    def leaf(self):
+        """
+        The shape at the bottom of the chain of nested translations, which is
+        what is actually hit tested and rendered.
+        """
+        return self._leaf
+
+    def revision(self):
+        if self._offset is None:
+            return None
+        leaf = self._leaf.revision()
+        if leaf is None:
+            return None
+        return (self._revision, leaf)
+
+    def offset(self):
+        """
+        Returns the total translation applied to the `leaf` shape, as a tuple
+        of floats :samp:`({dx}, {dy})`.
+        """
+        if self._offset is not None:
+            return self._offset
+        return (sum(float(d) for d in self._dxs), sum(float(d) for d in self._dys))
+
     def to_local(self, x, y):
-        return (x - self.dx, y - self.dy)
+        """
+        Converts global coordinates to the coordinates of the `leaf` shape.
+        """
+        dx, dy = self.offset()
+        return (x - dx, y - dy)
 
     def to_global(self, pt):
-        return geom.Point.cast(pt).translate(self._dx, self._dy)
+        """
+        Returns a point which converts the given point, in the coordinates of
+        the `leaf` shape, to global coordinates.
+        """
+        return geom.Point.cast(pt).translate(*self.offset())
 
     def hittest(self, x, y):
-        return self._shape.hittest(*(self.to_local(x,y)))
+        dx, dy = self.offset()
+        return self._leaf.hittest(x - dx, y - dy)
+
+    def hittest_many(self, xs, ys):
+        import numpy
+        dx, dy = self.offset()
+        return self._leaf.hittest_many(numpy.asarray(xs, dtype=float) - dx, numpy.asarray(ys, dtype=float) - dy)
 
     def boundingbox(self):
-        #FIXME XXX: Need to dynamically translate, because as the wrapped shape changes, lowerleft Point object may not stay the same.
-        return BoundingBox(lowerleft, upperright)
+        #The corners follow the leaf shape as it changes, but the offset is
+        # fixed when the box is created.
+        dx, dy = self.offset()
+        bbox = self._leaf.boundingbox()
+        return BoundingBox(
+            bbox.lowerleft.translate(dx, dy),
+            bbox.upperright.translate(dx, dy)
+        )
 
-    def boundingpoly(self, complexity=0.5):
-        #TODO: Implement
-        pass
+    def extent(self):
+        dx, dy = self.offset()
+        minx, miny, maxx, maxy = self._leaf.extent()
+        return (minx + dx, miny + dy, maxx + dx, maxy + dy)
 
     def render(self, capabilities=[]):
-        #TODO: Implement
-        pass
+        dx, dy = self.offset()
+        return [path.translated(dx, dy) for path in self._leaf.render(capabilities)]
+
+
+class Matrix(Transform):
+    """
+    A shape which draws another shape transformed by an arbitrary affine
+    transformation.
+
+    Nested transforms are collapsed when they're created, by multiplying
+    their matrices together, so the `leaf` shape is always wrapped directly.
+    The exception is a `Translate` with lengths that aren't fixed, which is
+    left in place so that it follows changes to its lengths.
+
+    Rendering transforms all of the coordinates of each of the leaf shape's
+    paths at once, with `~pyps.shapes.Path.transformed`.
+
+    :param matrix: The transformation. Either a 3x3 matrix which maps the
+        column vector :samp:`({x}, {y}, 1)` to the transformed point, or a
+        sequence of six numbers :samp:`[{a} {b} {c} {d} {e} {f}]`, in the same
+        order as a PostScript matrix, which maps :samp:`({x}, {y})` to
+        :samp:`({a}{x} + {c}{y} + {e}, {b}{x} + {d}{y} + {f})`.
+
+    :param shape: The `Shape` to transform.
+    """
+
+    def __init__(self, matrix, shape):
+        import numpy
+        m = numpy.array(matrix, dtype=float)
+        if m.shape == (6,):
+            a, b, c, d, e, f = m
+            m = numpy.array([[a, c, e], [b, d, f], [0.0, 0.0, 1.0]])
+        elif m.shape != (3, 3):
+            raise ValueError('Transformation matrix must be 3x3, or have six elements: %r' % (matrix,))
+
+        if not isinstance(shape, Shape):
+            raise TypeError('Transformation can only be applied to a Shape: %r' % (shape,))
+        self._shape = shape
+
+        if isinstance(shape, Matrix) or (isinstance(shape, Translate) and shape._offset is not None):
+            m = numpy.dot(m, shape.matrix())
+            shape = shape.leaf
+        self._leaf = shape
+        self._matrix = m
+        self._inverse = None
+
+        super(Matrix, self).__init__()
+
+    @property
+    def shape(self):
+        """
+        The shape this transformation was applied to, which may itself be a
+        transformation.
+        """
+        return self._shape
+
+    @property
+    def leaf(self):
+        return self._leaf
+
+    def matrix(self):
+        return self._matrix.copy()
+
+    def revision(self):
+        leaf = self._leaf.revision()
+        if leaf is None:
+            return None
+        return (self._revision, leaf)
+
+    def _get_inverse(self):
+        """
+        Returns the inverse of the matrix, or |None| if it is singular.
+        """
+        if self._inverse is None:
+            import numpy
+            try:
+                self._inverse = numpy.linalg.inv(self._matrix)
+            except numpy.linalg.LinAlgError:
+                self._inverse = False
+        return self._inverse if self._inverse is not False else None
+
+    def to_local(self, x, y):
+        """
+        Converts global coordinates to the coordinates of the `leaf` shape.
+
+        :raises ValueError: If the transformation is singular, like a scaling
+            by zero, so that global coordinates don't correspond to a single
+            point of the leaf shape.
+        """
+        m = self._get_inverse()
+        if m is None:
+            raise ValueError('Singular transformation has no inverse: %r' % (self._matrix.tolist(),))
+        return (m[0, 0]*x + m[0, 1]*y + m[0, 2], m[1, 0]*x + m[1, 1]*y + m[1, 2])
+
+    def to_global(self, pt):
+        """
+        Converts the given point, in the coordinates of the `leaf` shape, to a
+        point in global coordinates.
+        """
+        x, y = geom.Point.cast(pt).coords()
+        m = self._matrix
+        return geom.Pt(m[0, 0]*x + m[0, 1]*y + m[0, 2], m[1, 0]*x + m[1, 1]*y + m[1, 2])
+
+    def hittest(self, x, y):
+        #A singular transformation flattens the shape to a line or a point,
+        # which has no area to hit.
+        if self._get_inverse() is None:
+            return False
+        return self._leaf.hittest(*self.to_local(x, y))
+
+    def hittest_many(self, xs, ys):
+        import numpy
+        m = self._get_inverse()
+        xs = numpy.asarray(xs, dtype=float)
+        ys = numpy.asarray(ys, dtype=float)
+        if m is None:
+            return numpy.zeros(numpy.broadcast(xs, ys).shape, dtype=bool)
+        return self._leaf.hittest_many(m[0, 0]*xs + m[0, 1]*ys + m[0, 2], m[1, 0]*xs + m[1, 1]*ys + m[1, 2])
+
+    def boundingbox(self):
+        #The box around the transformed corners of the leaf's box. Unlike for
+        # translations, this doesn't follow changes to the leaf shape.
+        import numpy
+        bbox = self._leaf.boundingbox()
+        corners = numpy.array([
+            bbox.lowerleft.coords() + (1.0,), bbox.lowerright.coords() + (1.0,),
+            bbox.upperleft.coords() + (1.0,), bbox.upperright.coords() + (1.0,),
+        ]).T
+        xs, ys = numpy.dot(self._matrix[:2], corners)
+        return BoundingBox((xs.min(), ys.min()), (xs.max(), ys.max()))
+
+    def render(self, capabilities=[]):
+        #Circles don't stay circles under every transformation, so always ask
+        # for paths.
+        capabilities = [c for c in capabilities if c != CAPABILITY_CIRCLE_BATCH]
+        m = self._matrix
+        return [path.transformed(m) for path in self._leaf.render(capabilities)]
+
+
+class Scale(Matrix):
+    """
+    A shape which draws another shape scaled about the origin, or about a
+    given center point.
+
+    :param float sx: The factor to scale X coordinates by.
+    :param float sy: The factor to scale Y coordinates by.
+    :param shape: The `Shape` to scale.
+    :param center: Optional, the point which stays fixed, by default the
+        origin.
+    :type center: Anything castable by `~pyps.geom.Point`.
+    """
+
+    def __init__(self, sx, sy, shape, center=(0, 0)):
+        cx, cy = geom.Point.cast(center, 'Center of scaling must be a point: %r', center).coords()
+        sx = float(sx)
+        sy = float(sy)
+        super(Scale, self).__init__((sx, 0.0, 0.0, sy, cx - sx*cx, cy - sy*cy), shape)
+
+
+class Rotate(Matrix):
+    """
+    A shape which draws another shape rotated counter-clockwise about the
+    origin, or about a given center point.
+
+    :param degrees: The angle to rotate by.
+    :type degrees: Anything castable by `~pyps.geom.Angle`.
+    :param shape: The `Shape` to rotate.
+    :param center: Optional, the point to rotate around, by default the
+        origin.
+    :type center: Anything castable by `~pyps.geom.Point`.
+    """
 
+    def __init__(self, degrees, shape, center=(0, 0)):
+        angle = geom.Angle.cast(degrees, 'Rotation must be an angle: %r', degrees)
+        cx, cy = geom.Point.cast(center, 'Center of rotation must be a point: %r', center).coords()
+        cos = math.cos(angle.radians())
+        sin = math.sin(angle.radians())
+        super(Rotate, self).__init__(
+            (cos, sin, -sin, cos, cx - cos*cx + sin*cy, cy - sin*cx - cos*cy), shape)
@@ -0,0 +1,502 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+The `storage` module saves documents in a compact binary format, and loads
+them back by memory-mapping the file, so that reopening even a very large
+document is nearly instant.
+
+The shapes of each page are stored column by column, instead of as pickled
+objects:
+
+* A *kinds* column holds the type of each shape.
+* A *paints* column holds each shape's index into a table of the distinct
+  combinations of stroke, fill and stroke width in the document.
+* A *values* column holds the numbers which describe each shape's geometry.
+  An *offsets* column locates each shape's values in it, much like the
+  opcodes and coordinates of a `~pyps.shapes.Path`.
+* An *extents* column holds the bounding box each shape had when it was
+  added to the page.
+
+The shapes on the page come first in every column, in z-order. They are
+followed by the shapes wrapped by transforms, other than those which are on
+the page themselves. Each of these is stored once, however many transforms
+wrap it, so a shape which is shared by transforms on a page is still shared
+when the page is loaded. A small JSON footer at the end of the file locates
+each column, and holds the paint table and anything else that isn't
+numeric, like shape titles.
+
+When a document is loaded, its columns are mapped from the file as read-only
+``numpy`` arrays, and nothing else is read. Pages are restored from their
+stored bounds and extents, so their bounding boxes and spatial indexes (see
+`~pyps.Page.shapes_at`) don't need the shapes at all. Each shape is only
+created, with the `trusted <pyps.shapes.Circle.trusted>` constructors, the
+first time it is accessed, and is kept from then on.
+
+The saved document is a snapshot:
+
+* Points and lengths which can change, like a `~pyps.geom.MovablePt`, are
+  stored as their current values.
+* Transforms are stored as a single transformation of their leaf shape.
+  A `~pyps.shapes.xforms.Translate` is loaded as a `Translate`, and any other
+  `~pyps.shapes.xforms.Matrix` is loaded as a `Matrix`.
+* Each page is stored separately, so a shape which is on more than one page
+  is loaded as a separate shape for each page.
+
+`~pyps.shapes.Circle`, `~pyps.shapes.CircleArray`, and transforms of those
+can be saved. Other shapes, including subclasses of these, raise a
+|TypeError|, because the format can't hold whatever else they need.
+"""
+
+import array
+import itertools
+import json
+import mmap
+import struct
+import sys
+
+from pyps import Page, Document
+from pyps import geom
+from pyps.art.color import FixedColor
+from pyps.shapes import Circle, CircleArray
+from pyps.shapes.xforms import Translate, Matrix
+
+
+MAGIC = 'PYPSDOC\0'
+"""
+The eight bytes at the start and the end of every saved document.
+"""
+
+VERSION = 1
+"""
+The version of the format written by `save`. `load` only accepts files with
+this version.
+"""
+
+KIND_CIRCLE = 1
+"""
+The kind of a `~pyps.shapes.Circle`, whose values are
+:samp:`{cx} {cy} {radius}`.
+"""
+
+KIND_CIRCLE_ARRAY = 2
+"""
+The kind of a `~pyps.shapes.CircleArray` of :samp:`{n}` circles, whose values
+are :samp:`{n} {has_fills}` followed by the :samp:`2{n}` center coordinates,
+the :samp:`{n}` radii and, if :samp:`{has_fills}` is 1, the :samp:`3{n}` fill
+color components.
+"""
+
+KIND_TRANSLATE = 3
+"""
+The kind of a `~pyps.shapes.xforms.Translate`, whose values are
+:samp:`{dx} {dy} {leaf}`, where :samp:`{leaf}` is the index of the translated
+shape.
+"""
+
+KIND_MATRIX = 4
+"""
+The kind of a `~pyps.shapes.xforms.Matrix`, whose values are the top two rows
+of its 3x3 matrix, followed by the index of the transformed shape.
+"""
+
+_FOOTER = struct.Struct('<Q8s')
+
+_BLOCK = 4096
+
+
+def _pad(size):
+    #Columns start on eight byte boundaries, so that numpy can map them
+    # directly.
+    return -size % 8
+
+def _bytes(values, typecode):
+    """
+    Returns the bytes of the given `array.array`, in little-endian order.
+    """
+    if sys.byteorder != 'little':
+        values = array.array(typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+def _rgb(color):
+    return None if color is None else color.rgbf()
+
+
+class _PageWriter(object):
+    """
+    Writes the columns of a single page, for `save`.
+
+    The nodes stored for a page are its own shapes, followed by the distinct
+    shapes wrapped by transforms which aren't on the page themselves. The
+    constructor checks every node and finds the wrapped shapes, so nothing
+    needs to be written to find out that a page can't be saved. Each column
+    is then written a block of nodes at a time.
+
+    :raises TypeError: If the page has a shape which can't be saved.
+    """
+
+    def __init__(self, page, paints):
+        self._page = page
+        self._paints = paints
+        self.titles = {}
+        count = page.shape_count()
+
+        #Wrapped shapes are found by identity, so a shape wrapped by several
+        # transforms is only stored once.
+        wrapped = []
+        positions = {}
+        def check(shape):
+            leaf = self._check(shape)
+            if leaf is not None and id(leaf) not in positions:
+                positions[id(leaf)] = None
+                wrapped.append(leaf)
+        for shape in page.itershapes():
+            check(shape)
+        i = 0
+        while i < len(wrapped):
+            check(wrapped[i])
+            i += 1
+
+        if wrapped:
+            for i, shape in enumerate(page.itershapes()):
+                if id(shape) in positions:
+                    positions[id(shape)] = i
+        self._extra = [shape for shape in wrapped if positions[id(shape)] is None]
+        for i, shape in enumerate(self._extra):
+            positions[id(shape)] = count + i
+        self._positions = positions
+        self.nodes = count + len(self._extra)
+
+    @staticmethod
+    def _check(shape):
+        """
+        Raises a |TypeError| if the given shape can't be saved, and returns
+        the shape it wraps, if it's a transform, or |None|.
+        """
+        t = type(shape)
+        if t is Circle or t is CircleArray:
+            return None
+        if t is Translate or isinstance(shape, Matrix):
+            return shape.leaf
+        raise TypeError('Shape can not be saved: %r' % (shape,))
+
+    def _blocks(self):
+        """
+        Yields lists of up to `_BLOCK` nodes at a time, in order.
+        """
+        block = []
+        for shape in itertools.chain(self._page.itershapes(), self._extra):
+            block.append(shape)
+            if len(block) == _BLOCK:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    def _paint(self, shape):
+        #Nodes have all been checked, so anything else is a transform.
+        t = type(shape)
+        if t is not Circle and t is not CircleArray:
+            return -1
+        key = (_rgb(shape.stroke), _rgb(shape.fill), float(shape.stroke_width))
+        table, indices = self._paints
+        idx = indices.get(key)
+        if idx is None:
+            idx = indices[key] = len(table)
+            table.append(key)
+        return idx
+
+    @staticmethod
+    def _count(shape):
+        """
+        Returns the number of values stored for the given node.
+        """
+        t = type(shape)
+        if t is Circle or t is Translate:
+            return 3
+        elif t is CircleArray:
+            return 2 + len(shape) * (3 if shape.fills is None else 6)
+        return 7
+
+    def _add_values(self, values, shape):
+        t = type(shape)
+        if t is Circle:
+            cx, cy = shape.center.coords()
+            values.extend((cx, cy, shape.radius))
+        elif t is CircleArray:
+            fills = shape.fills
+            values.extend((len(shape), 0.0 if fills is None else 1.0))
+            values.fromstring(shape.centers.astype(float).tostring())
+            values.fromstring(shape.radii.astype(float).tostring())
+            if fills is not None:
+                values.fromstring(fills.astype(float).tostring())
+        elif t is Translate:
+            dx, dy = shape.offset()
+            values.extend((dx, dy, self._positions[id(shape.leaf)]))
+        else:
+            values.extend(shape.matrix()[:2].ravel().tolist())
+            values.append(self._positions[id(shape.leaf)])
+
+    def kinds(self):
+        kinds = {Circle: KIND_CIRCLE, CircleArray: KIND_CIRCLE_ARRAY, Translate: KIND_TRANSLATE}
+        titles = self.titles
+        i = 0
+        for block in self._blocks():
+            for shape in block:
+                if shape.title():
+                    titles[str(i)] = shape.title()
+                i += 1
+            yield array.array('B', [kinds.get(type(shape), KIND_MATRIX) for shape in block]).tostring()
+
+    def paints(self):
+        for block in self._blocks():
+            yield _bytes(array.array('i', [self._paint(shape) for shape in block]), 'i')
+
+    def offsets(self):
+        import numpy
+        total = 0
+        yield numpy.zeros(1, dtype='<i8').tostring()
+        for block in self._blocks():
+            offsets = []
+            for shape in block:
+                total += self._count(shape)
+                offsets.append(total)
+            yield numpy.array(offsets, dtype='<i8').tostring()
+        self.value_count = total
+
+    def values(self):
+        for block in self._blocks():
+            values = array.array('d')
+            for shape in block:
+                self._add_values(values, shape)
+            yield _bytes(values, 'd')
+
+    def extents(self, extents):
+        import numpy
+        for first in xrange(0, len(extents), 4 * _BLOCK):
+            yield numpy.asarray(extents[first:first + 4 * _BLOCK], dtype='<f8').tostring()
+
+
+def save(document, ostream):
+    """
+    Writes the given `~pyps.Document` to ``ostream``, which must be opened in
+    binary mode, in the format described for the module. Every shape is
+    checked before anything is written, so a |TypeError| for a shape which
+    can't be saved leaves ``ostream`` untouched. The columns are then written
+    a block of shapes at a time, followed by the footer, so the document is
+    never held in memory a second time.
+
+    :raises TypeError: If the document has a shape which can't be saved.
+    """
+    paints = ([], {})
+    pages = [(page, _PageWriter(page, paints)) for page in document.iterpages()]
+
+    position = [0]
+    def write(data):
+        ostream.write(data)
+        position[0] += len(data)
+    def column(chunks):
+        offset = position[0]
+        for chunk in chunks:
+            write(chunk)
+        write('\0' * _pad(position[0]))
+        return offset
+
+    write(MAGIC)
+    footer = {'version': VERSION, 'paints': paints[0], 'pages': []}
+    for page, writer in pages:
+        extents, bounds, stroke_pad = page._saved_state()
+        columns = {}
+        columns['kinds'] = column(writer.kinds())
+        columns['paints'] = column(writer.paints())
+        columns['offsets'] = column(writer.offsets())
+        columns['values'] = column(writer.values())
+        columns['extents'] = column(writer.extents(extents))
+        footer['pages'].append({
+            'shapes': page.shape_count(),
+            'nodes': writer.nodes,
+            'values': writer.value_count,
+            'bounds': bounds,
+            'stroke_pad': stroke_pad,
+            'titles': writer.titles,
+            'columns': columns,
+        })
+
+    data = json.dumps(footer, separators=(',', ':'))
+    write(data)
+    write(_FOOTER.pack(len(data), MAGIC))
+
+
+class _LazyShapes(object):
+    """
+    The shapes of a loaded page, which are created from the page's columns
+    the first time each one is accessed. This is the sequence of shapes held
+    by the `~pyps.Page`, so it supports what the page needs of a list.
+    """
+
+    def __init__(self, paints, columns, count, titles):
+        self._paints = paints
+        self._kinds, self._paint, self._offsets, self._values = columns
+        self._titles = titles
+        self._shapes = [None] * count
+        self._stored = count
+        #Shapes wrapped by transforms, by index.
+        self._leaves = {}
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __getitem__(self, idx):
+        shape = self._shapes[idx]
+        if shape is None:
+            if idx < 0:
+                idx += len(self._shapes)
+            shape = self._shapes[idx] = self._load(idx)
+        return shape
+
+    def __iter__(self):
+        #Shapes are created a block at a time, which is much faster than one
+        # at a time for long runs of circles.
+        shapes = self._shapes
+        stored = self._stored
+        for first in xrange(0, len(shapes), _BLOCK):
+            last = min(first + _BLOCK, len(shapes))
+            if first < stored and None in shapes[first:last]:
+                self._load_block(first, min(last, stored))
+            for i in xrange(first, last):
+                yield shapes[i]
+
+    def extend(self, shapes):
+        self._shapes.extend(shapes)
+
+    def _leaf(self, idx):
+        #A wrapped shape can also be on the page itself.
+        if idx < self._stored:
+            return self[idx]
+        shape = self._leaves.get(idx)
+        if shape is None:
+            shape = self._leaves[idx] = self._load(idx)
+        return shape
+
+    def _load_block(self, first, last):
+        """
+        Creates any of the shapes from index ``first`` up to ``last`` which
+        haven't been created yet.
+        """
+        import numpy
+        shapes = self._shapes
+        paints = self._paints
+        titles = self._titles
+        values = self._values
+        circles = numpy.flatnonzero(self._kinds[first:last] == KIND_CIRCLE)
+        starts = self._offsets[first:last][circles]
+        for i, cx, cy, radius, paint in zip(
+                (circles + first).tolist(), values[starts].tolist(), values[starts + 1].tolist(),
+                values[starts + 2].tolist(), self._paint[first:last][circles].tolist()):
+            if shapes[i] is None:
+                stroke, fill, stroke_width = paints[paint]
+                shapes[i] = Circle.trusted(geom.Pt(cx, cy), radius, fill, stroke, stroke_width,
+                    titles.get(str(i)) if titles else None)
+
+        for i in xrange(first, last):
+            if shapes[i] is None:
+                shapes[i] = self._load(i)
+
+    def _load(self, idx):
+        kind = self._kinds[idx]
+        start = int(self._offsets[idx])
+        stop = int(self._offsets[idx + 1])
+        title = self._titles.get(str(idx))
+
+        if kind == KIND_CIRCLE:
+            cx, cy, radius = self._values[start:stop].tolist()
+            stroke, fill, stroke_width = self._paints[self._paint[idx]]
+            return Circle.trusted(geom.Pt(cx, cy), radius, fill=fill, stroke=stroke,
+                stroke_width=stroke_width, title=title)
+
+        elif kind == KIND_CIRCLE_ARRAY:
+            values = self._values
+            count = int(values[start])
+            start += 2
+            centers = values[start:start + 2*count].reshape(count, 2)
+            radii = values[start + 2*count:start + 3*count]
+            fills = None
+            if values[start - 1]:
+                fills = values[start + 3*count:start + 6*count].reshape(count, 3)
+            stroke, fill, stroke_width = self._paints[self._paint[idx]]
+            return CircleArray.trusted(centers, radii, fills, fill=fill, stroke=stroke,
+                stroke_width=stroke_width, title=title)
+
+        elif kind == KIND_TRANSLATE:
+            dx, dy, leaf = self._values[start:stop].tolist()
+            shape = Translate(dx, dy, self._leaf(int(leaf)))
+
+        elif kind == KIND_MATRIX:
+            values = self._values[start:stop].tolist()
+            a, b, c, d, e, f = values[:6]
+            shape = Matrix([[a, b, c], [d, e, f], [0.0, 0.0, 1.0]], self._leaf(int(values[6])))
+
+        else:
+            raise ValueError('Unknown kind of shape %d at index %d.' % (kind, idx))
+
+        if title is not None:
+            shape.set_title(title)
+        return shape
+
+
+def _column(buf, dtype, offset, count):
+    import numpy
+    if not count:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+
+def _color(rgb):
+    return None if rgb is None else FixedColor.trusted(*rgb)
+
+def load(filename):
+    """
+    Loads a document saved by `save` from the file with the given name, by
+    memory-mapping it. Only the footer and the paint table are read right
+    away; each shape is read from the file when it's first accessed. The file
+    must not be changed while the document is in use.
+
+    :returns: The loaded `~pyps.Document`.
+
+    :raises ValueError: If the file is not a saved document, or has a
+        different `VERSION`.
+    """
+    with open(filename, 'rb') as ifile:
+        buf = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    size = len(buf)
+    if size < len(MAGIC) + _FOOTER.size or buf[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a saved pyps document: %r' % (filename,))
+    length, magic = _FOOTER.unpack_from(buf, size - _FOOTER.size)
+    start = size - _FOOTER.size - length
+    if magic != MAGIC or start < len(MAGIC):
+        raise ValueError('Saved pyps document is truncated: %r' % (filename,))
+    footer = json.loads(buf[start:start + length])
+    if footer.get('version') != VERSION:
+        raise ValueError('Unsupported version of saved pyps document: %r' % (footer.get('version'),))
+
+    paints = [
+        (_color(stroke), _color(fill), geom.FixedLength(stroke_width))
+        for stroke, fill, stroke_width in footer['paints']
+    ]
+
+    pages = []
+    for p in footer['pages']:
+        nodes = p['nodes']
+        offsets = p['columns']
+        columns = (
+            _column(buf, 'u1', offsets['kinds'], nodes),
+            _column(buf, '<i4', offsets['paints'], nodes),
+            _column(buf, '<i8', offsets['offsets'], nodes + 1),
+            _column(buf, '<f8', offsets['values'], p['values']),
+        )
+        shapes = _LazyShapes(paints, columns, p['shapes'], p['titles'])
+        extents = _column(buf, '<f8', offsets['extents'], 4 * p['shapes'])
+        pages.append(Page._restore(shapes, extents, p['bounds'], p['stroke_pad']))
+
+    return Document._restore(pages)
@@ -2,11 +2,465 @@
 # vim: set fileencoding=utf-8: set encoding=utf-8:
 
 import abc
+import collections
+import math
+import operator
+import timeit
+import weakref
+
+from pyps.art.color import FixedColor
+from pyps.shapes import Paintable, CircleArray
+from pyps.shapes.xforms import leaf
+
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+"""
+The default number of bytes a `BufferedSink` collects before writing them to
+its underlying stream.
+"""
+
 
 class Writer(object):
     __metaclass__ = abc.ABCMeta
 
+    capabilities = ()
+    """
+    The capabilities the writer passes to `~pyps.shapes.Shape.render`, which
+    tell shapes what they can render to besides `~pyps.shapes.Path` objects,
+    like `~pyps.shapes.CAPABILITY_CIRCLE_BATCH`.
+    """
+
     @abc.abstractmethod
     def write(self, ostream, document):
         raise NotImplementedError()
 
+
+class BufferedSink(object):
+    """
+    A file-like object which collects many small strings and writes them to
+    an underlying stream in blocks of about ``buffer_size`` bytes.
+
+    Writers use this to stream their output as it is produced, so the memory
+    used for output is bounded by the buffer size, not by the size of the
+    document, while still making relatively few calls to the underlying
+    stream's ``write`` method.
+    """
+
+    def __init__(self, ostream, buffer_size=DEFAULT_BUFFER_SIZE):
+        self._ostream = ostream
+        self._buffer_size = buffer_size
+        self._chunks = []
+        self._pending = 0
+        self.bytes_written = 0
+        """
+        The total number of bytes written to the underlying stream so far. This
+        does not include anything still in the buffer.
+        """
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._pending += len(data)
+        if self._pending >= self._buffer_size:
+            self.flush()
+
+    def tell(self):
+        """
+        Returns the total number of bytes written to the sink so far, including
+        anything still in the buffer.
+        """
+        return self.bytes_written + self._pending
+
+    def flush(self):
+        """
+        Writes everything in the buffer to the underlying stream. This does not
+        flush the underlying stream itself.
+        """
+        if self._chunks:
+            data = ''.join(self._chunks)
+            self._ostream.write(data)
+            self.bytes_written += len(data)
+            self._chunks = []
+            self._pending = 0
+
+
+class WriteStats(object):
+    """
+    Simple statistics about a single call to a writer's ``write`` method,
+    which is what the method returns.
+    """
+
+    def __init__(self):
+        self.shapes = 0
+        """ The number of shapes written. """
+
+        self.culled = 0
+        """ The number of shapes skipped because they were outside the viewport. """
+
+        self.subpixel = 0
+        """
+        The number of shapes smaller than a device pixel, which were written
+        as dots or skipped, instead of being rendered. See `LevelOfDetail`.
+        """
+
+        self.bytes = 0
+        """ The number of bytes written to the output stream. """
+
+        self.seconds = 0.0
+        """ The wall-clock time taken to write the document, in seconds. """
+
+        self._start = None
+
+    def start(self):
+        self._start = timeit.default_timer()
+
+    def stop(self):
+        self.seconds = timeit.default_timer() - self._start
+
+    def throughput(self):
+        """
+        Returns the average rate at which output was written, in megabytes
+        (10\ :sup:`6` bytes) per second.
+        """
+        if self.seconds <= 0:
+            return float('inf') if self.bytes else 0.0
+        return self.bytes / self.seconds / 1e6
+
+    def __str__(self):
+        return '%d shapes, %d bytes in %.3f s (%.2f MB/s)' % (self.shapes, self.bytes, self.seconds, self.throughput())
+
+
+class ShapeRecord(object):
+    """
+    Instrumentation for a single shape output by a writer, as collected by a
+    `WriteProfile`.
+    """
+
+    __slots__ = ('shape', 'page', 'render_seconds', 'seconds', 'bytes', 'paths', 'components')
+
+    def __init__(self, shape, page, render_seconds, seconds, bytes, paths, components):
+        self.shape = shape
+        """ The shape itself. """
+
+        self.page = page
+        """ The number of the page the shape is on, counting from 1. """
+
+        self.render_seconds = render_seconds
+        """ The time spent in the shape's `~pyps.shapes.Shape.render` method. """
+
+        self.seconds = seconds
+        """ The total time spent on the shape, including `render_seconds`. """
+
+        self.bytes = bytes
+        """ The number of bytes of output generated for the shape. """
+
+        self.paths = paths
+        """ The number of paths the shape rendered to. """
+
+        self.components = components
+        """ The total number of path components in those paths. """
+
+    def __repr__(self):
+        return '<ShapeRecord %s: %d bytes, %d components in %.6f s>' % (
+            type(self.shape).__name__, self.bytes, self.components, self.seconds)
+
+
+class WriteProfile(object):
+    """
+    Collects detailed instrumentation from a writer, for finding the shapes,
+    and the types of shapes, that are responsible for large or slow output.
+
+    Pass an instance to a writer's ``write`` method with the ``profile``
+    argument. The writer creates a `ShapeRecord` for each shape it outputs,
+    which is passed to ``callback``, if given, and kept in `records` if
+    ``keep_records`` is |TRUE|. Totals over all shapes are accumulated as
+    well. The same profile can be used for several calls to ``write``.
+
+    Writers use a separate code path for profiling, so there is no cost at
+    all when no profile is given.
+    """
+
+    def __init__(self, callback=None, keep_records=True):
+        self._callback = callback
+        self._keep_records = keep_records
+
+        self.records = []
+        """ A `ShapeRecord` for each shape written, in output order. """
+
+        self.shapes = 0
+        """ The number of shapes written. """
+
+        self.bytes = 0
+        """ The number of bytes of output generated for shapes. """
+
+        self.render_seconds = 0.0
+        """ The total time spent in shapes' `~pyps.shapes.Shape.render` methods. """
+
+        self.component_seconds = 0.0
+        """ The total time spent formatting path components. """
+
+        self.components = 0
+        """ The total number of path components written. """
+
+        self.color_seconds = 0.0
+        """ The total time spent in the writer's ``render_color`` method. """
+
+        self.color_calls = 0
+        """ The number of calls to the writer's ``render_color`` method. """
+
+    def add(self, record):
+        """
+        Adds a `ShapeRecord` to the profile. This is called by writers.
+        """
+        self.shapes += 1
+        self.bytes += record.bytes
+        self.render_seconds += record.render_seconds
+        self.components += record.components
+        if self._keep_records:
+            self.records.append(record)
+        if self._callback is not None:
+            self._callback(record)
+
+    def largest(self, count=10, key='bytes'):
+        """
+        Returns a list of the ``count`` records in `records` with the greatest
+        value of the attribute named by ``key``, such as ``"bytes"`` or
+        ``"seconds"``, largest first.
+        """
+        return sorted(self.records, key=operator.attrgetter(key), reverse=True)[:count]
+
+    def by_type(self):
+        """
+        Summarizes `records` by the type of shape. Returns a `dict` mapping the
+        name of each type of shape to a `dict` with the total ``count``,
+        ``bytes``, ``seconds``, ``render_seconds``, and ``components`` of
+        shapes of that type.
+        """
+        summary = {}
+        for record in self.records:
+            name = type(record.shape).__name__
+            totals = summary.get(name)
+            if totals is None:
+                totals = summary[name] = dict(count=0, bytes=0, seconds=0.0, render_seconds=0.0, components=0)
+            totals['count'] += 1
+            totals['bytes'] += record.bytes
+            totals['seconds'] += record.seconds
+            totals['render_seconds'] += record.render_seconds
+            totals['components'] += record.components
+        return summary
+
+
+class FragmentCache(object):
+    """
+    A cache of the output generated for individual shapes, so that writing a
+    document again after only a few of its shapes have changed doesn't need
+    to render the rest of them again.
+
+    Fragments are stored for each shape along with the shape's
+    `~pyps.shapes.Shape.revision` at the time it was rendered, and are only
+    reused while the revision stays the same. Shapes are identified by
+    identity, and only weakly referenced, so fragments for shapes which no
+    longer exist are discarded.
+
+    The total size of the stored fragments is kept under ``max_bytes`` by
+    discarding the least recently used ones.
+
+    Pass an instance to a writer which supports it, like
+    `~pyps.writers.postscript.EPSWriter`, with its ``cache`` argument.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+
+        self.bytes = 0
+        """ The total size of all fragments currently in the cache. """
+
+        self.hits = 0
+        """ The number of times a fragment was found by `get`. """
+
+        self.misses = 0
+        """ The number of times `get` found no fragment. """
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, shape, revision, key=None):
+        """
+        Returns the fragment stored for the given shape at the given revision,
+        or |None| if there is none. The ``key`` is an extra hashable value
+        which must match the one the fragment was stored with, which writers
+        use to tell apart output generated with different options.
+        """
+        entries = self._entries
+        ident = id(shape)
+        entry = entries.get(ident)
+        if entry is None or entry[0]() is not shape or entry[1] != (revision, key):
+            self.misses += 1
+            return None
+        #Move the entry to the most recently used end.
+        del entries[ident]
+        entries[ident] = entry
+        self.hits += 1
+        return entry[2]
+
+    def put(self, shape, revision, fragment, key=None):
+        """
+        Stores the fragment generated for the given shape at the given
+        revision, replacing any previous fragment for the shape.
+        """
+        entries = self._entries
+        ident = id(shape)
+        old = entries.pop(ident, None)
+        if old is not None:
+            self.bytes -= len(old[2])
+        if len(fragment) > self._max_bytes:
+            return
+        cache = weakref.ref(self)
+        def discard(ref):
+            if cache() is not None:
+                cache()._discard(ident, ref)
+        ref = weakref.ref(shape, discard)
+        entries[ident] = (ref, (revision, key), fragment)
+        self.bytes += len(fragment)
+        while self.bytes > self._max_bytes:
+            evicted = entries.popitem(last=False)[1]
+            self.bytes -= len(evicted[2])
+
+    def _discard(self, ident, ref):
+        #Called when a shape is garbage collected. Its id may have been reused
+        # by a new shape since, so only remove the entry if it's still for the
+        # dead one.
+        entry = self._entries.get(ident)
+        if entry is not None and entry[0] is ref:
+            del self._entries[ident]
+            self.bytes -= len(entry[2])
+
+    def clear(self):
+        """
+        Discards all fragments.
+        """
+        self._entries.clear()
+        self.bytes = 0
+
+
+def device_precision(dpi):
+    """
+    Returns the number of decimal places that coordinates, in points, need to
+    be written with to place them within a tenth of a device pixel at the
+    given resolution, in dots per inch. This is 1 at 72 dpi, 2 at 300 and 600
+    dpi, and 3 at 1200 dpi.
+    """
+    return max(0, int(math.ceil(math.log10(10.0 * dpi / 72.0) - 1e-9)))
+
+
+class LevelOfDetail(object):
+    """
+    Finds the shapes which are smaller than a device pixel at a target
+    resolution, for writers which don't need to render those in full.
+
+    A shape is smaller than a pixel if its bounding box, as returned by
+    `~pyps.shapes.Shape.extent`, widened by its stroke width, is less than a pixel wide and high. All that
+    can be seen of such a shape is a single pixel of its color, so writers can
+    paint a *dot*, a square the size of a pixel, instead. Dots are aligned to
+    a grid of pixels starting at the origin, and only the last of the dots in
+    the same cell is kept, which merges runs of tiny overlapping shapes. The
+    color of a dot is the fill color of the shape, or its stroke color if it
+    isn't filled.
+
+    Only shapes whose paint is known, because they are (or transform) a
+    `~pyps.shapes.Paintable`, are drawn as dots. Other shapes are always
+    rendered.
+
+    :param float dpi: The target resolution, in dots per inch.
+
+    :param bool dots: If |TRUE|, shapes smaller than a pixel are drawn as
+        dots, otherwise they are skipped entirely.
+
+    :raises ValueError: If ``dpi`` is not greater than zero.
+    """
+
+    def __init__(self, dpi, dots=True):
+        dpi = float(dpi)
+        if not dpi > 0:
+            raise ValueError('Resolution must be greater than zero: %r' % (dpi,))
+        self.dpi = dpi
+        """ The target resolution, in dots per inch. """
+
+        self.pixel = 72.0 / dpi
+        """ The size of a device pixel, in points. """
+
+        self.dots = dots
+        """ Whether shapes smaller than a pixel are drawn as dots. """
+
+    def dot(self, shape):
+        """
+        Returns |None| if the given shape needs to be rendered. Otherwise, the
+        shape is smaller than a pixel, and this returns a tuple of the grid
+        cell it covers, :samp:`({column}, {row})`, and the color of its dot, or
+        |None| if it isn't painted at all.
+        """
+        #Checking for a paintable shape first avoids the much slower check
+        # for a transform, in the common case.
+        paint = shape if isinstance(shape, Paintable) else leaf(shape)
+        if not isinstance(paint, Paintable):
+            return None
+
+        minx, miny, maxx, maxy = shape.extent()
+        stroke = paint.stroke
+        pad = float(paint.stroke_width) if stroke else 0.0
+        pixel = self.pixel
+        if maxx - minx + pad >= pixel or maxy - miny + pad >= pixel:
+            return None
+
+        color = paint.fill
+        if color is None and isinstance(paint, CircleArray) and paint.fills is not None:
+            #The last circle is the one on top.
+            color = FixedColor.trusted(*paint.fills[-1].tolist())
+        if color is None:
+            color = stroke
+        cell = (int(math.floor((minx + maxx) / (2.0 * pixel))), int(math.floor((miny + maxy) / (2.0 * pixel))))
+        return cell, color
+
+    def filter(self, shapes, write_dots, stats):
+        """
+        Returns an iterator over the given shapes which leaves out those that
+        are smaller than a pixel, counting them in the ``subpixel`` attribute
+        of the given `WriteStats`.
+
+        If `dots` is |TRUE|, each run of consecutive shapes which are left out
+        is passed to the ``write_dots`` callable, just before the next shape
+        is returned, or at the end. This puts the dots in the right place in
+        the output, as long as the caller writes each shape before asking for
+        the next. The dots are passed as a list of :samp:`({color}, {points})`
+        tuples, one for each color, where :samp:`{points}` is a list of the
+        lower left corners of the dots in that color, in points.
+        """
+        dot = self.dot
+        cells = {}
+        for shape in shapes:
+            found = dot(shape)
+            if found is None:
+                if cells:
+                    self._flush(cells, write_dots)
+                    cells = {}
+                yield shape
+            else:
+                stats.subpixel += 1
+                cell, color = found
+                if color is not None and self.dots:
+                    cells[cell] = color
+        if cells:
+            self._flush(cells, write_dots)
+
+    def _flush(self, cells, write_dots):
+        pixel = self.pixel
+        groups = {}
+        order = []
+        for (col, row), color in cells.iteritems():
+            rgb = color.rgbf()
+            group = groups.get(rgb)
+            if group is None:
+                group = groups[rgb] = (color, [])
+                order.append(group)
+            group[1].append((col * pixel, row * pixel))
+        write_dots(order)
@@ -0,0 +1,282 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+The `pdf` module provides a writer for Portable Document Format (PDF) files.
+"""
+
+import math
+import zlib
+
+from pyps import geom
+from pyps.writers import (Writer, BufferedSink, WriteStats, LevelOfDetail, device_precision,
+    DEFAULT_BUFFER_SIZE)
+
+from pyps.shapes import (Path, PATH_ARITY, PATH_MOVETO, PATH_RMOVETO,
+    PATH_LINETO, PATH_RLINETO, PATH_ARC, PATH_CURVETO)
+
+
+DEFAULT_MEDIABOX = (0, 0, 612, 792)
+"""
+The media box used for pages which have no shapes: US Letter, in points.
+"""
+
+
+def _num(value, digits=4):
+    """
+    Formats a number compactly for PDF content, with up to ``digits`` decimal
+    places.
+    """
+    s = ('%.*f' % (digits, value)).rstrip('0').rstrip('.')
+    if s == '-0':
+        return '0'
+    return s
+
+
+class _DeflateSink(object):
+    """
+    A file-like object which compresses everything written to it and passes
+    the compressed data on to another sink. Data is collected into blocks of
+    about ``block_size`` bytes before compressing, so that the compressor
+    isn't called for every tiny string.
+    """
+
+    def __init__(self, sink, level=6, block_size=DEFAULT_BUFFER_SIZE):
+        self._sink = sink
+        self._compressor = zlib.compressobj(level)
+        self._block_size = block_size
+        self._chunks = []
+        self._pending = 0
+        self.compressed_bytes = 0
+        """ The total number of compressed bytes passed to the sink. """
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._pending += len(data)
+        if self._pending >= self._block_size:
+            self._compress(self._compressor.compress(''.join(self._chunks)))
+            self._chunks = []
+            self._pending = 0
+
+    def _compress(self, data):
+        if data:
+            self._sink.write(data)
+            self.compressed_bytes += len(data)
+
+    def close(self):
+        """
+        Compresses anything still buffered and flushes the compressor.
+        """
+        self._compress(self._compressor.compress(''.join(self._chunks)))
+        self._compress(self._compressor.flush())
+        self._chunks = []
+        self._pending = 0
+
+
+class _PlainSink(object):
+    """
+    Like `_DeflateSink`, but passes data through unchanged.
+    """
+
+    def __init__(self, sink):
+        self._sink = sink
+        self.compressed_bytes = 0
+
+    def write(self, data):
+        self._sink.write(data)
+        self.compressed_bytes += len(data)
+
+    def close(self):
+        pass
+
+
+class PDFWriter(Writer):
+    """
+    A writer for PDF files, with one PDF page for each `~pyps.Page` of the
+    document.
+
+    Shapes are rendered through the same `~pyps.shapes.Shape.render` pipeline
+    as for `~pyps.writers.postscript.EPSWriter`. Since PDF has no arc
+    operator, arcs are approximated with Bezier curves.
+
+    Objects are written to the output as soon as they are complete, and the
+    cross-reference table is written at the end, so the document is never
+    held in memory. Each page's content stream is compressed with the
+    ``FlateDecode`` filter as it is generated.
+
+    :param bool compress: Whether or not to compress page content streams.
+    :param int level: The zlib compression level, from 1 (fastest) to 9 (smallest).
+
+    :param float dpi: Optional, the resolution of the device the output is
+        meant for, as for `~pyps.writers.postscript.EPSWriter`. Shapes smaller
+        than a device pixel are drawn as single dots, and coordinates are
+        written with the precision the device needs, instead of four decimal
+        places.
+
+    :param bool dots: If |FALSE|, shapes smaller than a device pixel are
+        skipped rather than drawn as dots. This only applies with ``dpi``.
+    """
+
+    def __init__(self, compress=True, level=6, dpi=None, dots=True):
+        self._compress = compress
+        self._level = level
+        self._lod = None
+        self._digits = 4
+        if dpi is not None:
+            self._lod = LevelOfDetail(dpi, dots)
+            self._digits = device_precision(self._lod.dpi)
+
+    def render_color(self, color):
+        return ' '.join(_num(c) for c in color.rgbf())
+
+    def _write_path(self, write, path):
+        """
+        Renders the given path as PDF content stream operators, passing each
+        piece to the ``write`` callable as it is produced.
+        """
+        if not isinstance(path, Path):
+            raise TypeError('Render returned non-Path: %r' % (path,))
+
+        coords = path.coordinates
+        digits = self._digits
+        current = None
+        i = 0
+        for op in path.opcodes:
+            n = PATH_ARITY[op]
+            if op == PATH_MOVETO or op == PATH_LINETO:
+                current = (coords[i], coords[i+1])
+                write('%s %s %s\n' % (_num(current[0], digits), _num(current[1], digits), 'm' if op == PATH_MOVETO else 'l'))
+            elif op == PATH_RMOVETO or op == PATH_RLINETO:
+                if current is None:
+                    raise ValueError('Relative path component with no current point.')
+                current = (current[0] + coords[i], current[1] + coords[i+1])
+                write('%s %s %s\n' % (_num(current[0], digits), _num(current[1], digits), 'm' if op == PATH_RMOVETO else 'l'))
+            elif op == PATH_CURVETO:
+                curve = coords[i:i+n]
+                write('%s %s %s %s %s %s c\n' % tuple(_num(v, digits) for v in curve))
+                current = (curve[4], curve[5])
+            else:
+                cx, cy, r, start_deg, stop_deg = coords[i:i+n]
+                start, curves = geom.arc_to_beziers(cx, cy, r, start_deg, stop_deg, op == PATH_ARC)
+                #Like PostScript, an arc is joined to the current point by a line.
+                write('%s %s %s\n' % (_num(start[0], digits), _num(start[1], digits), 'm' if current is None else 'l'))
+                for curve in curves:
+                    write('%s %s %s %s %s %s c\n' % tuple(_num(v, digits) for v in curve))
+                current = curves[-1][4:]
+            i += n
+
+        fill = path.fill
+        stroke = path.stroke
+        if fill:
+            write('%s rg\n' % (self.render_color(fill),))
+        if stroke:
+            write('%s RG %s w\n' % (self.render_color(stroke), _num(float(path.stroke_width))))
+
+        if fill and stroke:
+            write('B\n')
+        elif fill:
+            write('f\n')
+        elif stroke:
+            write('S\n')
+        else:
+            write('n\n')
+
+    def _write_dots(self, write, dots):
+        """
+        Writes the dots drawn in place of shapes smaller than a device pixel,
+        as passed by `~pyps.writers.LevelOfDetail.filter`, as a single filled
+        path of pixel sized rectangles for each color.
+        """
+        size = '%g %g re\n' % (self._lod.pixel, self._lod.pixel)
+        digits = self._digits
+        for color, points in dots:
+            write('%s rg\n' % (self.render_color(color),))
+            write(''.join('%s %s %s' % (_num(x, digits), _num(y, digits), size) for x, y in points))
+            write('f\n')
+
+    def _mediabox(self, bounds):
+        if bounds is None:
+            return DEFAULT_MEDIABOX
+        minx, miny, maxx, maxy = bounds
+        return (int(math.floor(minx)), int(math.floor(miny)), int(math.ceil(maxx)), int(math.ceil(maxy)))
+
+    def write(self, ostream, document, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Writes the given document to ``ostream`` as a PDF file. The stream
+        must be opened in binary mode.
+
+        :param int buffer_size: The number of bytes to collect before writing
+            them to ``ostream``.
+
+        :returns: A `~pyps.writers.WriteStats` describing the output.
+        """
+        stats = WriteStats()
+        stats.start()
+
+        sink = BufferedSink(ostream, buffer_size)
+        write = sink.write
+
+        #Offsets of each object, by object number. The catalog and the page tree
+        # are always objects 1 and 2, which lets pages refer to their parent
+        # before the page tree, which needs to list all pages, is written.
+        offsets = [0, None, None]
+        page_refs = []
+
+        def begin_object(number):
+            offsets[number] = sink.tell()
+            write('%d 0 obj\n' % (number,))
+
+        def new_object():
+            offsets.append(None)
+            return len(offsets) - 1
+
+        write('%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+        begin_object(1)
+        write('<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+
+        for page in document.iterpages():
+            content_num = new_object()
+            length_num = new_object()
+            page_num = new_object()
+
+            begin_object(content_num)
+            if self._compress:
+                write('<< /Length %d 0 R /Filter /FlateDecode >>\nstream\n' % (length_num,))
+                content = _DeflateSink(sink, self._level, buffer_size)
+            else:
+                write('<< /Length %d 0 R >>\nstream\n' % (length_num,))
+                content = _PlainSink(sink)
+            shapes = page.itershapes()
+            if self._lod is not None:
+                shapes = self._lod.filter(shapes, lambda dots: self._write_dots(content.write, dots), stats)
+            for shape in shapes:
+                for path in shape.render():
+                    self._write_path(content.write, path)
+                stats.shapes += 1
+            content.close()
+            write('\nendstream\nendobj\n')
+
+            begin_object(length_num)
+            write('%d\nendobj\n' % (content.compressed_bytes,))
+
+            begin_object(page_num)
+            write('<< /Type /Page /Parent 2 0 R /MediaBox [%d %d %d %d] /Contents %d 0 R >>\nendobj\n'
+                % (self._mediabox(page.bounds()) + (content_num,)))
+            page_refs.append(page_num)
+
+        begin_object(2)
+        write('<< /Type /Pages /Kids [%s] /Count %d >>\nendobj\n' % (
+            ' '.join('%d 0 R' % (num,) for num in page_refs), len(page_refs)))
+
+        xref_offset = sink.tell()
+        write('xref\n0 %d\n0000000000 65535 f \n' % (len(offsets),))
+        for offset in offsets[1:]:
+            write('%010d 00000 n \n' % (offset,))
+        write('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(offsets), xref_offset))
+        sink.flush()
+
+        stats.bytes = sink.bytes_written
+        stats.stop()
+        return stats
+
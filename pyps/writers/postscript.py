@@ -1,70 +1,933 @@
 #! /usr/bin/env python
 # vim: set fileencoding=utf-8: set encoding=utf-8:
 
-from pyps.writers import Writer
+import math
+import struct
+import timeit
 
-from pyps.shapes import Path
+from pyps.writers import (Writer, BufferedSink, WriteStats, ShapeRecord, LevelOfDetail,
+    device_precision, DEFAULT_BUFFER_SIZE)
+
+from pyps.shapes import (Path, CircleBatch, PATH_ARITY, PATH_RMOVETO, PATH_RLINETO,
+    CAPABILITY_CIRCLE_BATCH)
+
+
+_COMPONENT_FORMATS = (
+    '%f %f moveto',
+    '%f %f rmoveto',
+    '%f %f lineto',
+    '%f %f rlineto',
+    '%s %s %s %s %s arc',
+    '%s %s %s %s %s arcn',
+    '%f %f %f %f %f %f curveto',
+)
+"""
+Format strings for each `~pyps.shapes.Path` opcode, indexed by opcode.
+"""
+
+_OPERATORS = ('moveto', 'rmoveto', 'lineto', 'rlineto', 'arc', 'arcn', 'curveto')
+"""
+The PostScript operator for each `~pyps.shapes.Path` opcode, indexed by
+opcode.
+"""
+
+_TEMPLATES = tuple(('%s ' * n) + name for n, name in zip(PATH_ARITY, _OPERATORS))
+"""
+The `NumberEncoder` template for each `~pyps.shapes.Path` opcode, indexed by
+opcode.
+"""
+
+_CACHE_LIMIT = 1024
+"""
+The number of entries an `EPSWriter` keeps in each of its caches of formatted
+colors, line widths, and component templates, after which they are cleared.
+"""
+
+_TEXT_BLOCK = 1024
+"""
+The number of path components formatted at once by a `NumberEncoder`, which
+bounds the size of the strings built for very long paths.
+"""
+
+_BINARY_BLOCK = 64
+"""
+The number of path components in each binary number array. At six numbers
+per component at most, this keeps well within the minimum operand stack size
+of 500 when the array is unpacked.
+"""
+
+_CIRCLE_BLOCK = 64
+"""
+The number of circles whose numbers are pushed onto the operand stack at once
+when writing a `~pyps.shapes.CircleBatch`. Like `_BINARY_BLOCK`, this keeps
+within the minimum operand stack size, at six numbers per circle at most.
+"""
+
+_DOT_BLOCK = 128
+"""
+The number of dots whose corners are pushed onto the operand stack at once
+when writing the dots of a `~pyps.writers.LevelOfDetail`.
+"""
+
+_NUMPY_ROUNDING = 16
+"""
+The number of values above which `NumberEncoder` rounds with ``numpy``,
+rather than one at a time.
+"""
+
+
+class NumberEncoder(object):
+    """
+    Formats numbers compactly for PostScript code, with at most a fixed
+    number of decimal places, and no trailing zeros.
+
+    Numbers are formatted in batches, with templates that have a ``%s`` slot
+    followed by a space for each number, so that a whole path can be
+    formatted with a single string operation. The numbers are rounded first,
+    with halves rounded away from zero, and then formatted with exactly the
+    required number of decimal places. Trailing zeros, and then any decimal
+    point left at the end of a number, are removed from the whole batch at
+    once.
+
+    :param int precision: The maximum number of digits after the decimal
+        point.
+    """
+
+    def __init__(self, precision=3):
+        self._precision = int(precision)
+        self._slot = '%%.%df' % (self._precision,)
+
+    @property
+    def precision(self):
+        return self._precision
+
+    def encode(self, template, values):
+        """
+        Formats the given numbers into a template, in which each number has a
+        ``%s`` slot, which must be followed by a space.
+        """
+        #Both branches do the same float operations, so they round every
+        # value identically. Adding zero turns negative zero into zero.
+        scale = 10.0 ** self._precision
+        if len(values) > _NUMPY_ROUNDING:
+            import numpy
+            a = numpy.asarray(values, dtype=float)
+            rounded = (numpy.copysign(numpy.floor(numpy.abs(a) * scale + 0.5), a) / scale + 0.0).tolist()
+        else:
+            floor = math.floor
+            copysign = math.copysign
+            rounded = [copysign(floor(abs(v) * scale + 0.5), v) / scale + 0.0 for v in values]
+        code = template.replace('%s', self._slot) % tuple(rounded)
+        if self._precision > 0:
+            #Every number has the same number of decimal places, so each pass
+            # takes at most one zero off the end of each number, and never
+            # reaches the digits before the decimal point.
+            for i in xrange(self._precision):
+                code = code.replace('0 ', ' ')
+            code = code.replace('. ', ' ')
+        return code
+
+    def format_many(self, values):
+        """
+        Returns a list of strings, one for each of the given numbers.
+        """
+        return self.encode('%s ' * len(values), values).split()
+
+    def format(self, value):
+        """
+        Returns a single number formatted as a string.
+        """
+        return self.format_many((value,))[0]
+
+    def join(self, values):
+        """
+        Returns the given numbers formatted as a single string, separated by
+        spaces.
+        """
+        return self.encode('%s ' * len(values), values)[:-1]
 
 
 class EPSWriter(Writer):
     """
     A writer for generated Encapsulated PostScript files.
+
+    :param bool symbols: If |TRUE|, shapes which render to the same paths,
+        apart from their position, are written as instances of a shared
+        PostScript procedure. See `_write_shapes_instanced`.
+
+    :param int precision: If given, all numbers are written with at most this
+        many decimal places, and no trailing zeros, using a `NumberEncoder`.
+        By default, coordinates are written with exactly six decimal places,
+        and arc parameters and colors at full precision.
+
+    :param bool binary: If |TRUE|, path coordinates are written as PostScript
+        Level 2 binary number arrays, holding 32-bit IEEE floats. This is
+        smaller and faster to write and to interpret, but the output is no
+        longer plain text, so it must be written to a binary stream, and
+        coordinates have only about seven significant digits.
+
+    :param cache: Optional, a `~pyps.writers.FragmentCache` to keep the code
+        generated for each shape in, so that shapes which haven't changed
+        since a previous call to `write` don't need to be rendered again. See
+        `_write_shapes_cached`.
+
+    :param float dpi: Optional, the resolution of the device the output is
+        meant for, in dots per inch. Shapes smaller than a device pixel are
+        then drawn as single dots, see `~pyps.writers.LevelOfDetail`, and
+        unless a ``precision`` is given, all numbers are written with the
+        precision that the device needs, from
+        `~pyps.writers.device_precision`.
+
+    :param bool dots: If |FALSE|, shapes smaller than a device pixel are
+        skipped rather than drawn as dots. This only applies with ``dpi``.
     """
 
+    capabilities = (CAPABILITY_CIRCLE_BATCH,)
+
+    def __init__(self, symbols=False, precision=None, binary=False, cache=None, dpi=None, dots=True):
+        self._symbols = symbols
+        self._cache = cache
+        self._lod = None
+        if dpi is not None:
+            self._lod = LevelOfDetail(dpi, dots)
+            if precision is None:
+                precision = device_precision(self._lod.dpi)
+        self._encoder = NumberEncoder(precision) if precision is not None else None
+        self._binary = binary
+        self._templates = {}
+        self._colors = {}
+        self._widths = {}
+
     def render_color(self, color):
+        if self._encoder is not None:
+            #Documents generally use only a handful of colors, so remember
+            # how each one is formatted.
+            rgb = color.rgbf()
+            code = self._colors.get(rgb)
+            if code is None:
+                if len(self._colors) >= _CACHE_LIMIT:
+                    self._colors.clear()
+                code = self._colors[rgb] = self._encoder.join(rgb)
+            return code
         return ' '.join(str(c) for c in color.rgbf())
 
+    def _format_width(self, width):
+        """
+        Formats a line width with the writer's `NumberEncoder`. Like colors,
+        the formatted widths are cached.
+        """
+        code = self._widths.get(width)
+        if code is None:
+            if len(self._widths) >= _CACHE_LIMIT:
+                self._widths.clear()
+            code = self._widths[width] = self._encoder.format(width)
+        return code
+
+    def _header_comments(self):
+        """
+        Returns any additional DSC header comments required by the writer's
+        options.
+        """
+        if self._binary:
+            return '%%DocumentData: Binary\n'
+        return ''
+
     def render_path(self, path):
+        """
+        Returns the PostScript code for the given path as a single string. This
+        is the same code that `write` streams to its output for the path.
+        """
+        parts = []
+        self._write_path(parts.append, path)
+        return ''.join(parts)
+
+    def _write_path(self, write, path):
+        """
+        Renders the given path as PostScript code, passing each piece of the
+        code to the ``write`` callable as it is produced. This also accepts a
+        `~pyps.shapes.CircleBatch`, see `_write_circle_batch`.
+        """
+        if isinstance(path, CircleBatch):
+            return self._write_circle_batch(write, path, self.render_color)
+        self._write_components(write, path)
+        self._write_paint(write, path, self.render_color)
+
+    def _write_components(self, write, path):
+        """
+        Writes the components of the given path, which is the first part of
+        `_write_path`.
+        """
         if not isinstance(path, Path):
             raise TypeError('Render returned non-Path: %r' % (path,))
+        if self._binary:
+            return self._write_components_binary(write, path)
+        if self._encoder is not None:
+            return self._write_components_encoded(write, path)
+
+        #Work directly on the path's packed arrays, rather than building a
+        # tuple for each component.
+        coords = path.coordinates
+        formats = _COMPONENT_FORMATS
+        sep = ''
+        i = 0
+        for op in path.opcodes:
+            n = PATH_ARITY[op]
+            write(sep)
+            if n == 2:
+                write(formats[op] % (coords[i], coords[i+1]))
+            else:
+                write(formats[op] % tuple(coords[i:i+n]))
+            i += n
+            sep = '\n '
+
+    def _write_components_encoded(self, write, path):
+        """
+        Like `_write_components`, but formats the numbers with the writer's
+        `NumberEncoder`, a block of components at a time, each with a single
+        template for the whole block.
+        """
+        coords = path.coordinates
+        opcodes = path.opcodes
+        encode = self._encoder.encode
+        if len(opcodes) <= _TEXT_BLOCK:
+            write(encode(self._template(opcodes), coords))
+            return
+
+        sep = ''
+        i = 0
+        for b in xrange(0, len(opcodes), _TEXT_BLOCK):
+            block = opcodes[b:b+_TEXT_BLOCK]
+            end = i + sum(PATH_ARITY[op] for op in block)
+            write(sep)
+            write(encode(self._template(block), coords[i:end]))
+            sep = '\n '
+            i = end
 
-        ps = ''
-        ps += '\n '.join(self._render_path_component(comp) for comp in path)
+    def _template(self, opcodes):
+        """
+        Returns the `NumberEncoder` template for a sequence of path
+        components. Templates for short sequences, which tend to be repeated
+        from shape to shape, are cached.
+        """
+        if len(opcodes) > 8:
+            return '\n '.join(_TEMPLATES[op] for op in opcodes)
+        key = opcodes.tostring()
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= _CACHE_LIMIT:
+                self._templates.clear()
+            template = self._templates[key] = '\n '.join(_TEMPLATES[op] for op in opcodes)
+        return template
 
+    def _write_components_binary(self, write, path):
+        """
+        Like `_write_components`, but writes the numbers for each block of
+        components as a binary homogeneous number array, followed by
+        ``aload pop`` to push them all, and then the operators.
+
+        The operators take their operands from the top of the stack, so the
+        components are stored in the array in reverse order, with the first
+        component's numbers last.
+        """
+        coords = path.coordinates
+        opcodes = path.opcodes
+        operators = _OPERATORS
+        sep = ''
+        i = 0
+        for b in xrange(0, len(opcodes), _BINARY_BLOCK):
+            block = opcodes[b:b+_BINARY_BLOCK]
+            slices = []
+            for op in block:
+                n = PATH_ARITY[op]
+                slices.append(coords[i:i+n])
+                i += n
+            values = []
+            for s in reversed(slices):
+                values.extend(s)
+            #Token 149 is a homogeneous number array, representation 48 is
+            # big-endian IEEE single precision.
+            write(sep)
+            write(struct.pack('>BBH%df' % (len(values),), 149, 48, len(values), *values))
+            write(' aload pop ' + ' '.join(operators[op] for op in block))
+            sep = '\n '
+
+    def _write_paint(self, write, path, render_color):
+        """
+        Writes the code to fill and stroke the given path, which is the second
+        part of `_write_path`. Colors are formatted with the ``render_color``
+        callable.
+        """
         fill = path.fill
         stroke = path.stroke
 
         if fill:
-            ps += '\n %s setrgbcolor gsave fill grestore' % (self.render_color(fill))
+            write('\n %s setrgbcolor gsave fill grestore' % (render_color(fill)))
+        if stroke:
+            if self._encoder is not None:
+                width = self._format_width(float(path.stroke_width))
+            else:
+                width = '%f' % (float(path.stroke_width),)
+            write('\n %s setrgbcolor %s setlinewidth stroke' % (render_color(stroke), width))
+
+    def _write_circle_batch(self, write, batch, render_color):
+        """
+        Writes a `~pyps.shapes.CircleBatch`. A procedure which draws and
+        paints a single circle is defined in a temporary dictionary, and the
+        numbers for each block of `_CIRCLE_BLOCK` circles are pushed, last
+        circle first, followed by a loop which calls the procedure for each of
+        them. Each circle is painted the same way as a path drawn by
+        `_write_path`, so the output looks the same as for separate circles.
+        Colors are formatted with the ``render_color`` callable.
+        """
+        import numpy
+        fill = batch.fill
+        stroke = batch.stroke
+        columns = [batch.centers, batch.radii[:, None]]
+
+        proc = 'newpath 0 360 arc'
+        if batch.fills is not None:
+            columns.append(batch.fills)
+            proc = 'setrgbcolor %s gsave fill grestore' % (proc,)
+        elif fill:
+            proc += ' %s setrgbcolor gsave fill grestore' % (render_color(fill),)
         if stroke:
-            ps += '\n %s setrgbcolor %f setlinewidth stroke' % (self.render_color(stroke), path.stroke_width)
+            if self._encoder is not None:
+                width = self._format_width(float(batch.stroke_width))
+            else:
+                width = '%f' % (float(batch.stroke_width),)
+            proc += ' %s setrgbcolor %s setlinewidth stroke' % (render_color(stroke), width)
+        write('1 dict begin /c { %s } bind def' % (proc,))
 
+        data = numpy.hstack(columns)
+        encoder = self._encoder
+        for b in xrange(0, len(data), _CIRCLE_BLOCK):
+            values = data[b:b+_CIRCLE_BLOCK][::-1].ravel()
+            write('\n ')
+            if self._binary:
+                write(struct.pack('>BBH', 149, 48, len(values)))
+                write(values.astype('>f4').tostring())
+                write(' aload pop')
+            elif encoder is not None:
+                write(encoder.join(values.tolist()))
+            else:
+                write(('%s ' * len(values))[:-1] % tuple(values.tolist()))
+            write(' %d { c } repeat' % (min(_CIRCLE_BLOCK, len(data) - b),))
+        write('\n end')
+
+    def _write_dots(self, write, dots):
+        """
+        Writes the dots drawn in place of shapes smaller than a device pixel,
+        as passed by `~pyps.writers.LevelOfDetail.filter`. For each color, the
+        corners of each block of `_DOT_BLOCK` dots are pushed, followed by a
+        loop which fills a pixel sized square at each of them.
+        """
+        encoder = self._encoder
+        fill = '{ %g dup rectfill }' % (self._lod.pixel,)
+        for color, points in dots:
+            write('%s setrgbcolor\n' % (self.render_color(color),))
+            for b in xrange(0, len(points), _DOT_BLOCK):
+                block = points[b:b+_DOT_BLOCK]
+                values = []
+                for pt in block:
+                    values.extend(pt)
+                write(encoder.join(values))
+                write(' %d %s repeat\n' % (len(block), fill))
+        write('\n')
+
+    def _render_bounds(self, bounds, comment='BoundingBox', hires=True):
+        """
+        Returns the DSC bounding box comments for the given bounds, as returned
+        by `pyps.Page.bounds`. The ``%%BoundingBox`` comment (or whatever
+        ``comment`` is given) has integer coordinates, rounded outwards, so if
+        ``hires`` is |TRUE|, it is followed by an exact ``%%HiResBoundingBox``.
+        """
+        if bounds is None:
+            return '%%%%%s: 0 0 0 0\n' % (comment,)
+        minx, miny, maxx, maxy = bounds
+        ps = '%%%%%s: %d %d %d %d\n' % (comment, math.floor(minx), math.floor(miny), math.ceil(maxx), math.ceil(maxy))
+        if hires:
+            ps += '%%%%HiResBoundingBox: %f %f %f %f\n' % (minx, miny, maxx, maxy)
         return ps
 
-    def _render_path_component(self, comp):
-            command = comp[0]
-            if command == 'M':
-                return '%f %f moveto' % comp[1:]
-            elif command == 'm':
-                return '%f %f rmoveto' % comp[1:]
-            elif command == 'L':
-                return '%f %f lineto' % comp[1:]
-            elif command == 'l':
-                return '%f %f rlineto' % comp[1:]
-            elif command == 'a':
-                cx, cy, r, b, e, ccw = comp[1:]
-                op = 'arc' if ccw else 'arcn'
-                return '%s %s %s %s %s %s' % (cx, cy, r, b, e, op)
+    def _visible_shapes(self, page, viewport):
+        """
+        Returns the shapes on the given page which need to be written to show
+        the given viewport, in z-order, along with the number of shapes that
+        were left out, as a tuple. Shapes are found with
+        `pyps.Page.shapes_intersecting`, so shapes outside of the viewport are
+        never looked at. If ``viewport`` is |None|, all shapes are returned.
+        """
+        if viewport is None:
+            return page.itershapes(), 0
+        minx, miny, maxx, maxy = viewport
+        shapes = page.shapes_intersecting((minx, miny), (maxx, maxy), strokes=True)
+        return shapes, page.shape_count() - len(shapes)
+
+    def _write_viewport_shapes(self, write, page, viewport, stats, verbose=False, profile=None, number=1):
+        """
+        Writes the shapes on the given page which are visible in the viewport,
+        if there is one, clipped to the viewport. If the writer has a ``dpi``,
+        shapes smaller than a device pixel are written as dots by
+        `_write_dots`. The counts of written, culled and sub-pixel shapes are
+        added to ``stats``.
+        """
+        shapes, culled = self._visible_shapes(page, viewport)
+        if self._lod is not None:
+            shapes = self._lod.filter(shapes, lambda dots: self._write_dots(write, dots), stats)
+        if viewport is not None:
+            write('gsave\n%f %f %f %f rectclip\n' % (
+                viewport[0], viewport[1], viewport[2] - viewport[0], viewport[3] - viewport[1]))
+        stats.shapes += self._write_shapes(write, shapes, verbose, profile, number)
+        stats.culled += culled
+        if viewport is not None:
+            write('grestore\n')
+
+    def _write_shapes(self, write, shapes, verbose=False, profile=None, page=1):
+        """
+        Renders each of the given shapes, passing the PostScript code to the
+        ``write`` callable as it is produced. Returns the number of shapes.
+
+        If a `~pyps.writers.WriteProfile` is given, this is done by
+        `_write_shapes_profiled` instead, and the shapes are recorded as being
+        on the given ``page`` number. If the writer was created with
+        ``symbols``, it is done by `_write_shapes_instanced`, and if it was
+        created with a ``cache``, by `_write_shapes_cached`.
+        """
+        if self._symbols:
+            return self._write_shapes_instanced(write, shapes, verbose, profile, page)
+        if profile is not None:
+            return self._write_shapes_profiled(write, shapes, verbose, profile, page)
+        if self._cache is not None:
+            return self._write_shapes_cached(write, shapes, verbose)
+
+        write_path = self._write_path
+        count = 0
+        for shape in shapes:
+            if verbose:
+                write("%% Shape: %s\n" % str(shape))
+            sep = 'newpath '
+            for p in shape.render(self.capabilities):
+                write(sep)
+                write_path(write, p)
+                sep = '\nnewpath '
+            write("\n\n")
+            count += 1
+        return count
+
+    def _write_shapes_cached(self, write, shapes, verbose):
+        """
+        Like `_write_shapes`, but reuses the code generated for each shape
+        from the writer's `~pyps.writers.FragmentCache`, as long as the shape's
+        `~pyps.shapes.Shape.revision` hasn't changed, and stores it there
+        otherwise. Shapes whose revision is |None| are always rendered.
+
+        The cache is not used when profiling or writing symbols. When pages
+        are rendered by worker processes, each worker uses a copy of the
+        cache, so fragments they render are not kept.
+        """
+        cache = self._cache
+        key = self._cache_key()
+        write_path = self._write_path
+        count = 0
+        for shape in shapes:
+            if verbose:
+                write("%% Shape: %s\n" % str(shape))
+            revision = shape.revision()
+            fragment = None
+            if revision is not None:
+                fragment = cache.get(shape, revision, key)
+            if fragment is None:
+                parts = []
+                sep = 'newpath '
+                for p in shape.render(self.capabilities):
+                    parts.append(sep)
+                    write_path(parts.append, p)
+                    sep = '\nnewpath '
+                parts.append("\n\n")
+                fragment = ''.join(parts)
+                if revision is not None:
+                    cache.put(shape, revision, fragment, key)
+            write(fragment)
+            count += 1
+        return count
+
+    def _cache_key(self):
+        """
+        Returns the extra key that fragments are cached with, which identifies
+        the options that affect how shapes are written.
+        """
+        return (type(self), self._encoder.precision if self._encoder is not None else None, self._binary)
+
+    def _write_shapes_profiled(self, write, shapes, verbose, profile, page):
+        """
+        Like `_write_shapes`, but measures each shape, and adds a
+        `~pyps.writers.ShapeRecord` for it to ``profile``. The output is
+        exactly the same.
+        """
+        timer = timeit.default_timer
+        written = [0]
+
+        def counting_write(data):
+            written[0] += len(data)
+            write(data)
+
+        render_color = self.render_color
+        def timed_render_color(color):
+            start = timer()
+            try:
+                return render_color(color)
+            finally:
+                profile.color_seconds += timer() - start
+                profile.color_calls += 1
+
+        count = 0
+        for shape in shapes:
+            start = timer()
+            written[0] = 0
+            if verbose:
+                counting_write("%% Shape: %s\n" % str(shape))
+            paths = list(shape.render(self.capabilities))
+            rendered = timer()
+
+            components = 0
+            sep = 'newpath '
+            for p in paths:
+                counting_write(sep)
+                begin = timer()
+                if isinstance(p, CircleBatch):
+                    self._write_circle_batch(counting_write, p, timed_render_color)
+                    profile.component_seconds += timer() - begin
+                    components += len(p)
+                else:
+                    self._write_components(counting_write, p)
+                    profile.component_seconds += timer() - begin
+                    components += len(p.opcodes)
+                    self._write_paint(counting_write, p, timed_render_color)
+                sep = '\nnewpath '
+            counting_write("\n\n")
+
+            profile.add(ShapeRecord(shape, page, rendered - start, timer() - start, written[0], len(paths), components))
+            count += 1
+        return count
+
+    def _write_shapes_instanced(self, write, shapes, verbose, profile, page):
+        """
+        Like `_write_shapes`, but writes repeated shapes as instances of
+        PostScript procedures.
+
+        Each shape is keyed by its `~pyps.shapes.Shape.symbol`, if it has one,
+        before it is rendered. Otherwise, it is rendered, and its paths are
+        moved so that the first point of the first path is at the origin, and
+        keyed by the code they are written as, so shapes share a procedure
+        exactly when they would be written the same. The first time a key is
+        seen, the moved paths are written inline, translated back into place.
+        The second time, they are defined as a procedure, and from then on the
+        shape is written as a call to that procedure, wrapped in ``gsave``,
+        ``translate``, and ``grestore``. Shapes keyed by their symbol are not
+        rendered at all once their procedure is defined. This works in a
+        single pass, so output is still streamed.
+
+        Procedures are only shared within a single call, which is one page.
+
+        If a ``profile`` is given, a `~pyps.writers.ShapeRecord` is added for
+        each shape, but time spent formatting path components and colors is
+        not measured separately. Shapes which were not rendered are recorded
+        with no paths.
+        """
+        timer = timeit.default_timer
+        written = [0]
+        if profile is not None:
+            def counting_write(data):
+                written[0] += len(data)
+                write(data)
+        else:
+            counting_write = write
+
+        #Keys of each shape seen so far, mapped to the name of its procedure,
+        # or to None if it has only been seen once.
+        symbols = {}
+        names = 0
+        count = 0
+        encoder = self._encoder
+        for shape in shapes:
+            if profile is not None:
+                start = timer()
+                written[0] = 0
+            if verbose:
+                counting_write("%% Shape: %s\n" % str(shape))
+
+            #Shapes with a symbol only need to be rendered until their
+            # procedure is defined.
+            symbol = shape.symbol()
+            if symbol is not None:
+                key, anchor = symbol
+                key = ('symbol', key)
+                name = symbols.get(key, False)
+            if symbol is None or not name:
+                paths = list(shape.render(self.capabilities))
+            else:
+                paths = []
+            if profile is not None:
+                rendered = timer()
+
+            #Anything which isn't a path, like a batch of circles, is written
+            # as it is.
+            if symbol is None:
+                anchor = None
+                if paths and all(isinstance(p, Path) for p in paths):
+                    if paths[0].opcodes and paths[0].opcodes[0] not in (PATH_RMOVETO, PATH_RLINETO):
+                        anchor = tuple(paths[0].coordinates[0:2])
+
+            if anchor is None:
+                sep = 'newpath '
+                for p in paths:
+                    counting_write(sep)
+                    self._write_path(counting_write, p)
+                    sep = '\nnewpath '
+                counting_write("\n\n")
             else:
-                raise ValueError('Unknown path component command: %r' % (command,))
-                
-
-    
-    def write(self, ostream, document, verbose=False):
-        ostream.write(r"""%!PS-Adobe-3.0 EPSF-3.0
-%%BoundingBox 0 0 100 100
-%%Creator: pyps
+                x, y = anchor
+                if symbol is None or not name:
+                    parts = []
+                    sep = 'newpath '
+                    for p in paths:
+                        parts.append(sep)
+                        self._write_path(parts.append, p.translated(-x, -y))
+                        sep = '\nnewpath '
+                    code = ''.join(parts)
+                    if symbol is None:
+                        key = code
+                        name = symbols.get(key, False)
+                if encoder is not None:
+                    x, y = encoder.format_many((x, y))
+                else:
+                    x, y = '%f' % (x,), '%f' % (y,)
+                if name:
+                    counting_write('gsave %s %s translate %s grestore\n\n' % (x, y, name))
+                elif name is False:
+                    symbols[key] = None
+                    counting_write('gsave %s %s translate\n%s\ngrestore\n\n' % (x, y, code))
+                else:
+                    name = symbols[key] = 'S%d' % (names,)
+                    names += 1
+                    counting_write('/%s {\n%s\n} bind def\n' % (name, code))
+                    counting_write('gsave %s %s translate %s grestore\n\n' % (x, y, name))
+
+            if profile is not None:
+                components = sum(len(p) for p in paths)
+                profile.add(ShapeRecord(shape, page, rendered - start, timer() - start, written[0], len(paths), components))
+            count += 1
+        return count
+
+    def write(self, ostream, document, verbose=False, buffer_size=DEFAULT_BUFFER_SIZE, profile=None, viewport=None):
+        """
+        Writes the given document to ``ostream`` as Encapsulated PostScript.
+
+        Output is streamed through a `~pyps.writers.BufferedSink` as each path
+        component is rendered, so no more than about ``buffer_size`` bytes of
+        output are held in memory at once, regardless of the size of the
+        document or of any of its paths.
+
+        :param bool verbose: If |TRUE|, a comment is written before each shape,
+            giving the shape's string value.
+
+        :param int buffer_size: The number of bytes to collect before writing
+            them to ``ostream``.
+
+        :param profile: Optional, a `~pyps.writers.WriteProfile` to collect
+            timings and sizes for each shape. Profiling slows writing down
+            somewhat, but doesn't change the output.
+
+        :param viewport: Optional, a rectangle :samp:`({minx}, {miny}, {maxx}, {maxy})`
+            to crop the output to. It becomes the bounding box of the output,
+            everything is clipped to it, and shapes which can't be seen in it
+            are skipped without being rendered at all. See `_visible_shapes`.
+
+        :returns: A `~pyps.writers.WriteStats` describing the output, including
+            its throughput.
+
+        :raises ValueError: If the document has more than one page, which can't
+            be represented in EPS. Use `PSWriter` for those.
+        """
+        if document.page_count() > 1:
+            raise ValueError('EPS output can only hold a single page, document has %d.' % (document.page_count(),))
+
+        viewport = _viewport(viewport)
+
+        stats = WriteStats()
+        stats.start()
+
+        sink = BufferedSink(ostream, buffer_size)
+        write = sink.write
+
+        write(r"""%!PS-Adobe-3.0 EPSF-3.0
+""")
+        write(self._render_bounds(document.bounds() if viewport is None else viewport))
+        write(self._header_comments())
+        write(r"""%%Creator: pyps
 %%Pages: 1
 
 """)
 
-        for shape in document.itershapes():
-            if verbose:
-                ostream.write("%% Shape: %s\n" % str(shape))
-            ostream.write("\n".join(('newpath %s' % self.render_path(p)) for p in shape.render()))
-            ostream.write("\n\n")
+        self._write_viewport_shapes(write, document.current_page(), viewport, stats, verbose, profile)
+
+        write(r"""
+%%EOF
+""")
+        sink.flush()
 
-        ostream.write(r"""
+        stats.bytes = sink.bytes_written
+        stats.stop()
+        return stats
+
+
+def _viewport(viewport):
+    """
+    Checks and normalizes the ``viewport`` argument of the writers, returning
+    a tuple of floats :samp:`({minx}, {miny}, {maxx}, {maxy})`, or |None|.
+    """
+    if viewport is None:
+        return None
+    try:
+        x1, y1, x2, y2 = (float(v) for v in viewport)
+    except (TypeError, ValueError):
+        raise ValueError('Viewport must be a rectangle (minx, miny, maxx, maxy): %r' % (viewport,))
+    return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+
+class PSWriter(EPSWriter):
+    """
+    A writer for multi-page PostScript documents, with each `~pyps.Page` of
+    the document output as a separate page, delimited by DSC ``%%Page``
+    comments.
+
+    Pages can optionally be rendered in parallel by a pool of worker
+    processes, see `write`.
+    """
+
+    def _write_page(self, write, page, number, stats, verbose=False, profile=None, viewport=None):
+        """
+        Renders a single page, including its DSC comments and the closing
+        ``showpage``, passing the code to the ``write`` callable as it is
+        produced. Pages are numbered from 1. The numbers of shapes written,
+        culled and sub-pixel shapes are added to ``stats``.
+        """
+        write('%%%%Page: %d %d\n' % (number, number))
+        write(self._render_bounds(page.bounds() if viewport is None else viewport, 'PageBoundingBox', False))
+        write('\n')
+        self._write_viewport_shapes(write, page, viewport, stats, verbose, profile, number)
+        write('showpage\n\n')
+
+    def _render_page(self, page, number, verbose=False, viewport=None):
+        """
+        Like `_write_page`, but returns the code as a single string, along
+        with a `~pyps.writers.WriteStats` holding the counts of shapes, as a
+        tuple.
+        """
+        parts = []
+        stats = WriteStats()
+        self._write_page(parts.append, page, number, stats, verbose, viewport=viewport)
+        return ''.join(parts), stats
+
+    def write(self, ostream, document, verbose=False, buffer_size=DEFAULT_BUFFER_SIZE, processes=None, profile=None, viewport=None):
+        """
+        Writes the given document to ``ostream`` as PostScript, one page per
+        `~pyps.Page` in the document.
+
+        :param bool verbose: If |TRUE|, a comment is written before each shape,
+            giving the shape's string value.
+
+        :param int buffer_size: The number of bytes to collect before writing
+            them to ``ostream``.
+
+        :param int processes: If given and greater than 1, pages are rendered
+            in parallel by a `multiprocessing.Pool <python:multiprocessing.pool.Pool>`
+            of this many worker processes. Each worker renders whole pages to
+            strings, which are written to ``ostream`` in page order as they
+            become available. Where the platform forks new processes, the
+            document is inherited by the workers rather than copied to them,
+            otherwise the document and this writer must be picklable.
+
+        :param profile: Optional, a `~pyps.writers.WriteProfile` to collect
+            timings and sizes for each shape. Pages are always rendered in
+            this process when profiling, regardless of ``processes``.
+
+        :param viewport: Optional, a rectangle to crop every page to, as for
+            `EPSWriter.write`.
+
+        :returns: A `~pyps.writers.WriteStats` describing the output, including
+            its throughput.
+        """
+        viewport = _viewport(viewport)
+
+        stats = WriteStats()
+        stats.start()
+
+        sink = BufferedSink(ostream, buffer_size)
+        write = sink.write
+
+        bounds = None
+        for page in document.iterpages():
+            pbounds = page.bounds()
+            if pbounds is None:
+                continue
+            if bounds is None:
+                bounds = pbounds
+            else:
+                bounds = (
+                    min(bounds[0], pbounds[0]), min(bounds[1], pbounds[1]),
+                    max(bounds[2], pbounds[2]), max(bounds[3], pbounds[3]),
+                )
+
+        write(r"""%!PS-Adobe-3.0
+""")
+        write(self._render_bounds(bounds if viewport is None else viewport))
+        write(self._header_comments())
+        write(r"""%%%%Creator: pyps
+%%%%Pages: %d
+%%%%EndComments
+
+""" % (document.page_count(),))
+
+        if processes is not None and processes > 1 and document.page_count() > 1 and profile is None:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes, _init_page_worker, (self, document, verbose, viewport))
+            try:
+                for fragment, page_stats in pool.imap(_render_page_worker, xrange(document.page_count())):
+                    write(fragment)
+                    stats.shapes += page_stats.shapes
+                    stats.culled += page_stats.culled
+                    stats.subpixel += page_stats.subpixel
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            for idx, page in enumerate(document.iterpages()):
+                self._write_page(write, page, idx + 1, stats, verbose, profile, viewport)
+
+        write(r"""%%Trailer
 %%EOF
 """)
+        sink.flush()
+
+        stats.bytes = sink.bytes_written
+        stats.stop()
+        return stats
+
+
+_page_worker_state = None
+"""
+The writer, document, verbose flag, and viewport used by `_render_page_worker`
+in each worker process of `PSWriter.write`. This is set by `_init_page_worker`.
+"""
+
+def _init_page_worker(writer, document, verbose, viewport):
+    global _page_worker_state
+    _page_worker_state = (writer, document, verbose, viewport)
 
+def _render_page_worker(idx):
+    writer, document, verbose, viewport = _page_worker_state
+    return writer._render_page(document.get_page(idx), idx + 1, verbose, viewport)
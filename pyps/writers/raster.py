@@ -0,0 +1,323 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+"""
+The `raster` module provides a writer which scan-converts documents into
+RGB images, held in ``numpy`` arrays, without any external programs.
+"""
+
+import math
+
+import numpy
+
+from pyps.writers import Writer
+
+from pyps.shapes import (Path, PATH_ARITY, PATH_MOVETO, PATH_RMOVETO,
+    PATH_LINETO, PATH_RLINETO, PATH_ARC, PATH_CURVETO)
+
+
+_JOIN_SIDES = 8
+"""
+The number of sides of the polygons used to round the joins and caps of
+stroked lines.
+"""
+
+
+class RasterWriter(Writer):
+    """
+    A writer which renders pages into RGB images.
+
+    Paths are flattened to polygons (arcs are split into line segments short
+    enough to be indistinguishable at the output resolution) and filled with
+    the non-zero winding rule, like PostScript's ``fill``. Strokes are drawn
+    by filling the outline of each segment, with rounded joins and caps.
+
+    :param float dpi: The output resolution. At the default of 72, one pixel is
+        one point.
+
+    :param background: The color of unpainted pixels.
+    :type background: Anything castable by `~pyps.art.color.Color`.
+
+    :param int supersample: If greater than 1, each pixel is rendered as a
+        ``supersample`` by ``supersample`` block of samples which are averaged
+        together, to anti-alias the output.
+    """
+
+    def __init__(self, dpi=72.0, background=(1.0, 1.0, 1.0), supersample=1):
+        from pyps.art.color import Color
+        self._scale = float(dpi) / 72.0
+        self._background = Color.cast(background, 'Background must be a color: %r', background)
+        self._supersample = max(1, int(supersample))
+
+    def render(self, page, bounds=None):
+        """
+        Renders a page into an image.
+
+        :param page: The `~pyps.Page` to render. If this is a `~pyps.Document`,
+            its current page is rendered.
+
+        :param bounds: Optional, the region of the page to render, as a tuple
+            :samp:`({minx}, {miny}, {maxx}, {maxy})`. By default this is the
+            page's bounds, rounded outwards to whole points, like the
+            ``%%BoundingBox`` of an EPS file.
+
+        :returns: An array of unsigned bytes with shape :samp:`({height}, {width}, 3)`,
+            with the top row of the image first.
+        """
+        if hasattr(page, 'current_page'):
+            page = page.current_page()
+        if bounds is None:
+            bounds = page.bounds()
+            if bounds is None:
+                bounds = (0, 0, 1, 1)
+            bounds = (math.floor(bounds[0]), math.floor(bounds[1]), math.ceil(bounds[2]), math.ceil(bounds[3]))
+        minx, miny, maxx, maxy = [float(b) for b in bounds]
+
+        ss = self._supersample
+        scale = self._scale * ss
+        width = max(1, int(math.ceil((maxx - minx) * self._scale)))
+        height = max(1, int(math.ceil((maxy - miny) * self._scale)))
+        canvas = _Canvas(width * ss, height * ss, minx, maxy, scale, self._background.rgbf())
+
+        for shape in page.itershapes():
+            for path in shape.render():
+                canvas.paint_path(path)
+
+        pixels = canvas.pixels
+        if ss > 1:
+            pixels = pixels.reshape(height, ss, width, ss, 3).mean(axis=(1, 3))
+        return numpy.clip(numpy.round(pixels * 255.0), 0, 255).astype(numpy.uint8)
+
+    def write(self, ostream, document):
+        """
+        Renders each page of the document with `render`, and writes the images
+        to ``ostream`` as a sequence of binary PPM (``P6``) images. The stream
+        must be opened in binary mode.
+        """
+        for page in document.iterpages():
+            image = self.render(page)
+            height, width = image.shape[:2]
+            ostream.write('P6\n%d %d\n255\n' % (width, height))
+            ostream.write(image.tobytes())
+
+
+class _Canvas(object):
+    """
+    The floating point RGB samples of an image being rendered, along with the
+    transform from page coordinates to sample coordinates.
+    """
+
+    def __init__(self, width, height, left, top, scale, background):
+        self.width = width
+        self.height = height
+        self._left = left
+        self._top = top
+        self._scale = scale
+        self.pixels = numpy.empty((height, width, 3), dtype=float)
+        self.pixels[:, :] = background
+
+    def _to_device(self, x, y):
+        return ((x - self._left) * self._scale, (self._top - y) * self._scale)
+
+    def _arc_points(self, cx, cy, r, start_deg, stop_deg, ccw):
+        """
+        Returns a list of device coordinates along an arc, including both of
+        its ends, following the sweep rules of the PostScript ``arc`` and
+        ``arcn`` operators.
+        """
+        if ccw:
+            while stop_deg < start_deg:
+                stop_deg += 360.0
+        else:
+            while stop_deg > start_deg:
+                stop_deg -= 360.0
+        sweep = math.radians(stop_deg - start_deg)
+        r_dev = r * self._scale
+
+        #Choose segments so the chord never strays more than a tenth of a
+        # sample from the true arc.
+        if r_dev > 0.1:
+            step = 2.0 * math.acos(1.0 - 0.1 / r_dev)
+            count = max(4, int(math.ceil(abs(sweep) / step)))
+        else:
+            count = 4
+        angles = numpy.linspace(math.radians(start_deg), math.radians(start_deg) + sweep, count + 1)
+        xs = (cx + r * numpy.cos(angles) - self._left) * self._scale
+        ys = (self._top - (cy + r * numpy.sin(angles))) * self._scale
+        return zip(xs.tolist(), ys.tolist())
+
+    def _curve_points(self, start, x1, y1, x2, y2, x3, y3):
+        """
+        Returns a list of device coordinates along a cubic Bezier curve from
+        the ``start`` point, not including the start point itself.
+        """
+        p = numpy.array([start, (x1, y1), (x2, y2), (x3, y3)], dtype=float) * self._scale
+        #Wang's formula: the number of segments needed for the chords to stay
+        # within a tenth of a sample of the curve.
+        dd = max(numpy.hypot(*(p[0] - 2*p[1] + p[2])), numpy.hypot(*(p[1] - 2*p[2] + p[3])))
+        count = max(1, int(math.ceil(math.sqrt(0.75 * dd / 0.1))))
+        t = numpy.linspace(0.0, 1.0, count + 1)[1:, None]
+        s = 1.0 - t
+        pts = s*s*s*p[0] + 3*s*s*t*p[1] + 3*s*t*t*p[2] + t*t*t*p[3]
+        xs = pts[:, 0] - self._left * self._scale
+        ys = self._top * self._scale - pts[:, 1]
+        return zip(xs.tolist(), ys.tolist())
+
+    def _subpaths(self, path):
+        """
+        Flattens a path into a list of subpaths, each a list of device
+        coordinates of its vertices.
+        """
+        subpaths = []
+        current = None
+        points = None
+        coords = path.coordinates
+        i = 0
+        for op in path.opcodes:
+            n = PATH_ARITY[op]
+            if op == PATH_MOVETO or op == PATH_RMOVETO:
+                if op == PATH_MOVETO:
+                    current = (coords[i], coords[i+1])
+                elif current is None:
+                    raise ValueError('Relative path component with no current point.')
+                else:
+                    current = (current[0] + coords[i], current[1] + coords[i+1])
+                points = [self._to_device(*current)]
+                subpaths.append(points)
+            elif op == PATH_LINETO or op == PATH_RLINETO:
+                if op == PATH_LINETO:
+                    current = (coords[i], coords[i+1])
+                elif current is None:
+                    raise ValueError('Relative path component with no current point.')
+                else:
+                    current = (current[0] + coords[i], current[1] + coords[i+1])
+                if points is None:
+                    raise ValueError('Line-to with no current point.')
+                points.append(self._to_device(*current))
+            elif op == PATH_CURVETO:
+                if points is None:
+                    raise ValueError('Curve-to with no current point.')
+                points.extend(self._curve_points(current, *coords[i:i+n]))
+                current = (coords[i+4], coords[i+5])
+            else:
+                cx, cy, r, start_deg, stop_deg = coords[i:i+n]
+                arc = self._arc_points(cx, cy, r, start_deg, stop_deg, op == PATH_ARC)
+                #Like PostScript, an arc is joined to the current point by a line.
+                if points is None:
+                    points = []
+                    subpaths.append(points)
+                points.extend(arc)
+                end = math.radians(stop_deg)
+                current = (cx + r * math.cos(end), cy + r * math.sin(end))
+            i += n
+        return [numpy.array(p, dtype=float) for p in subpaths if p]
+
+    def _fill_mask(self, polygons):
+        """
+        Returns a boolean mask of the samples inside the given polygons, by the
+        non-zero winding rule. Each polygon is an array of vertices, and is
+        implicitly closed.
+
+        The polygons are scan-converted all at once: every edge is intersected
+        with the center line of every row it spans, the crossings are sorted
+        by row and X coordinate, and spans between crossings are painted where
+        the running winding number is non-zero.
+        """
+        height, width = self.height, self.width
+        mask = numpy.zeros((height, width), dtype=bool)
+
+        starts = []
+        ends = []
+        for poly in polygons:
+            if len(poly) < 2:
+                continue
+            starts.append(poly)
+            ends.append(numpy.roll(poly, -1, axis=0))
+        if not starts:
+            return mask
+        p0 = numpy.concatenate(starts)
+        p1 = numpy.concatenate(ends)
+
+        x0, y0 = p0[:, 0], p0[:, 1]
+        x1, y1 = p1[:, 0], p1[:, 1]
+        keep = y0 != y1
+        x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+        direction = numpy.where(y1 > y0, 1, -1)
+
+        #Rows whose sample centers (at row + 0.5) fall in [min(y), max(y)).
+        ylo = numpy.minimum(y0, y1)
+        yhi = numpy.maximum(y0, y1)
+        first = numpy.clip(numpy.ceil(ylo - 0.5), 0, height).astype(int)
+        last = numpy.clip(numpy.ceil(yhi - 0.5), 0, height).astype(int)
+        counts = last - first
+        valid = counts > 0
+        if not valid.any():
+            return mask
+        x0, y0, x1, y1 = x0[valid], y0[valid], x1[valid], y1[valid]
+        direction, first, counts = direction[valid], first[valid], counts[valid]
+
+        edge = numpy.repeat(numpy.arange(len(counts)), counts)
+        offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        rows = first[edge] + offsets
+        yc = rows + 0.5
+        xs = x0[edge] + (yc - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+        dirs = direction[edge]
+
+        order = numpy.lexsort((xs, rows))
+        rows, xs, dirs = rows[order], xs[order], dirs[order]
+
+        #Closed polygons cross each row a net zero times, so a running sum over
+        # all crossings resets to zero at the end of each row.
+        winding = numpy.cumsum(dirs)
+        inside = winding[:-1] != 0
+        span_rows = rows[:-1][inside]
+        span_start = numpy.clip(numpy.ceil(xs[:-1][inside] - 0.5), 0, width).astype(int)
+        span_end = numpy.clip(numpy.ceil(xs[1:][inside] - 0.5), 0, width).astype(int)
+        nonempty = span_end > span_start
+        if not nonempty.any():
+            return mask
+
+        #Paint the spans with a difference array, then integrate along rows.
+        diff = numpy.zeros((height, width + 1), dtype=numpy.int32)
+        numpy.add.at(diff, (span_rows[nonempty], span_start[nonempty]), 1)
+        numpy.add.at(diff, (span_rows[nonempty], span_end[nonempty]), -1)
+        mask = numpy.cumsum(diff, axis=1)[:, :width] > 0
+        return mask
+
+    def _stroke_polygons(self, subpaths, line_width):
+        """
+        Returns a list of polygons whose union is the stroke of the given
+        subpaths: a rectangle around each segment, and a small regular polygon
+        at each vertex to round the joins and caps. All of the polygons have
+        the same orientation, so that they combine under the non-zero rule.
+        """
+        hw = max(line_width * self._scale, 1.0) / 2.0
+        polygons = []
+        angles = numpy.linspace(0, 2.0 * math.pi, _JOIN_SIDES, endpoint=False)
+        #Circumscribe the joins, so they're never narrower than the segments.
+        join = numpy.column_stack((numpy.cos(angles), numpy.sin(angles))) * (hw / math.cos(math.pi / _JOIN_SIDES))
+        for points in subpaths:
+            d = points[1:] - points[:-1]
+            lengths = numpy.hypot(d[:, 0], d[:, 1])
+            nz = lengths > 0
+            if nz.any():
+                a, b = points[:-1][nz], points[1:][nz]
+                normal = numpy.column_stack((-d[nz, 1], d[nz, 0])) * (hw / lengths[nz])[:, None]
+                quads = numpy.stack((a - normal, b - normal, b + normal, a + normal), axis=1)
+                polygons.extend(quads)
+            polygons.extend(pt + join for pt in points)
+        return polygons
+
+    def paint_path(self, path):
+        if not isinstance(path, Path):
+            raise TypeError('Render returned non-Path: %r' % (path,))
+
+        subpaths = self._subpaths(path)
+        if not subpaths:
+            return
+        if path.fill:
+            self.pixels[self._fill_mask(subpaths)] = path.fill.rgbf()
+        if path.stroke:
+            polygons = self._stroke_polygons(subpaths, float(path.stroke_width))
+            self.pixels[self._fill_mask(polygons)] = path.stroke.rgbf()
+
@@ -14,6 +14,7 @@ import pyps.version as proj_version
 requires = [
     'docit',
     'colour',
+    'numpy',
 ]
 
 setup(
@@ -33,7 +34,7 @@ setup(
     include_package_data = True,
     
     #Automaticaly search for modules, identified by __init__.py
-    packages = find_packages('.', exclude=["tests"]),
+    packages = find_packages('.', exclude=["tests", "benchmarks"]),
 
     #Other pypi packages that are dependencies for this package.
     # To specify a particular version, do like 'package (>=1.2.3)'
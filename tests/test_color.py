@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import colour
+
+from pyps.art import color
+from pyps.art.color import Color, FixedColor
+
+
+def _close(rgb1, rgb2):
+    return all(abs(a - b) < 1e-9 for a, b in zip(rgb1, rgb2))
+
+def test_fixed_hex():
+    for value in ('#66ff99', '#6f9', '#000000', '#FFF', '#a1B2c3'):
+        c = Color.Fixed(value)
+        ok_(isinstance(c, FixedColor))
+        ok_(_close(c.rgbf(), colour.Color(value).rgb), value)
+    eq_(Color.Fixed('#336699').rgbf(), (0.2, 0.4, 0.6))
+
+def test_fixed_matches_colour():
+    for args, kwargs in [
+        (('red',), {}),
+        (('navy',), {}),
+        ((), {'red': 0.2, 'green': 0.5, 'blue': 1.0}),
+        ((), {'hue': 0.3, 'saturation': 0.5, 'luminance': 0.4}),
+        ((), {'rgb': [0.1, 0.2, 0.3]}),
+    ]:
+        ok_(_close(Color.Fixed(*args, **kwargs).rgbf(), colour.Color(*args, **kwargs).rgb), (args, kwargs))
+
+def test_fixed_invalid():
+    #Strings which aren't valid hex colors are left for colour to reject.
+    assert_raises((ValueError, AttributeError), Color.Fixed, '#12345')
+    assert_raises((ValueError, AttributeError), Color.Fixed, '#ggg')
+    assert_raises(ValueError, Color.Fixed, 'not a color')
+
+def test_fixed_is_shared():
+    eq_(Color.Fixed('#6f9') is Color.Fixed('#6f9'), True)
+    eq_(Color.Fixed('green') is Color.Fixed('green'), True)
+    c = Color.Fixed(red=0.1, green=0.2, blue=0.3)
+    ok_(Color.Fixed(blue=0.3, green=0.2, red=0.1) is c)
+    ok_(Color.Fixed('#123') is not Color.Fixed('#112233'))
+
+def test_fixed_cache_is_bounded():
+    color._fixed_cache.clear()
+    first = Color.Fixed('#000001')
+    for i in xrange(2, color._FIXED_CACHE_LIMIT + 10):
+        Color.Fixed('#%06x' % (i,))
+    eq_(len(color._fixed_cache), color._FIXED_CACHE_LIMIT)
+    ok_(Color.Fixed('#000001') is not first)
+    eq_(Color.Fixed('#000001').rgbf(), first.rgbf())
+
+def test_cast():
+    c = FixedColor(0.1, 0.2, 0.3)
+    ok_(Color.cast(c) is c)
+    eq_(Color.cast((0.1, 0.2, 0.3)).rgbf(), (0.1, 0.2, 0.3))
+    eq_(Color.cast([255, 0, 0, 255]).rgbf(), (1.0, 0.0, 0.0))
+    eq_(Color.cast_or_none(None), None)
+    with assert_raises(TypeError) as cm:
+        Color.cast('not a color', 'Bad color %s: %r', 'fill', 5)
+    eq_(str(cm.exception), 'Bad color fill: 5')
+    assert_raises(TypeError, Color.cast, (0.1, 0.2))
+
+def test_trusted():
+    c = FixedColor.trusted(0.1, 0.2, 0.3)
+    ok_(isinstance(c, FixedColor))
+    eq_(c.rgbf(), FixedColor(0.1, 0.2, 0.3).rgbf())
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import random
+import subprocess
+import sys
+
+import pyps
+from pyps.shapes import Circle
+from pyps.geom.rtree import RTree
+
+
+def _random_circles(count, seed=27182818):
+    rand = random.Random(seed)
+    return [
+        Circle((rand.uniform(0, 1000), rand.uniform(0, 1000)), rand.uniform(1, 20))
+        for i in xrange(count)
+    ]
+
+def _scan_at(shapes, x, y):
+    return tuple(s for s in shapes if s.hittest(x, y))
+
+
+def test_rtree_insert_and_bulk_load_agree():
+    rand = random.Random(1414)
+    entries = []
+    for i in xrange(500):
+        x, y = rand.uniform(0, 100), rand.uniform(0, 100)
+        entries.append((x, y, x + rand.uniform(0, 5), y + rand.uniform(0, 5), i))
+
+    inserted = RTree(max_entries=6)
+    for e in entries:
+        inserted.insert(*e)
+    bulk = RTree.bulk_load(entries, max_entries=6)
+
+    eq_(len(inserted), 500)
+    eq_(len(bulk), 500)
+    for i in xrange(50):
+        x, y = rand.uniform(0, 100), rand.uniform(0, 100)
+        expected = sorted(e[4] for e in entries if e[0] <= x+3 and e[2] >= x and e[1] <= y+3 and e[3] >= y)
+        eq_(sorted(inserted.search(x, y, x+3, y+3)), expected)
+        eq_(sorted(bulk.search(x, y, x+3, y+3)), expected)
+
+def test_shapes_at_matches_scan():
+    circles = _random_circles(2000)
+    doc = pyps.Document()
+    doc.add_shape(*circles)
+
+    rand = random.Random(161803)
+    for i in xrange(200):
+        x, y = rand.uniform(0, 1000), rand.uniform(0, 1000)
+        eq_(doc.shapes_at(x, y), _scan_at(circles, x, y))
+
+def test_shapes_at_stays_current():
+    circles = _random_circles(300)
+    doc = pyps.Document()
+    doc.add_shape(*circles[:100])
+    eq_(doc.shapes_at(-50, -50), ())
+
+    #Added after the index was built.
+    doc.add_shape(*circles[100:])
+    top = Circle((-50, -50), 5)
+    doc.add_shape(top)
+    eq_(doc.shapes_at(-50, -50), (top,))
+
+    rand = random.Random(4669)
+    for i in xrange(100):
+        x, y = rand.uniform(0, 1000), rand.uniform(0, 1000)
+        eq_(doc.shapes_at(x, y), _scan_at(circles, x, y))
+
+def test_shapes_at_z_order():
+    doc = pyps.Document()
+    bottom = Circle((10, 10), 5)
+    middle = Circle((11, 10), 5)
+    top = Circle((12, 10), 5)
+    doc.add_shape(bottom, middle)
+    doc.shapes_at(0, 0)
+    doc.add_shape(top)
+    eq_(doc.shapes_at(11, 10), (bottom, middle, top))
+
+def test_shapes_intersecting():
+    doc = pyps.Document()
+    a = Circle((10, 10), 5)
+    b = Circle((100, 100), 5)
+    c = Circle((30, 10), 5)
+    doc.add_shape(a, b, c)
+
+    eq_(doc.shapes_intersecting((0, 0), (50, 20)), (a, c))
+    eq_(doc.shapes_intersecting((50, 20), (0, 0)), (a, c))
+    eq_(doc.shapes_intersecting((96, 96), (200, 200)), (b,))
+    eq_(doc.shapes_intersecting((200, 200), (300, 300)), ())
+
+def test_shapes_intersecting_strokes():
+    doc = pyps.Document()
+    thick = Circle((10, 10), 5, stroke_width=6)
+    plain = Circle((40, 10), 5, stroke=None)
+    doc.add_shape(thick, plain)
+
+    eq_(doc.shapes_intersecting((17, 0), (20, 20)), ())
+    eq_(doc.shapes_intersecting((17, 0), (20, 20), strokes=True), (thick,))
+    eq_(doc.shapes_intersecting((19, 0), (20, 20), strokes=True), ())
+    eq_(doc.shapes_intersecting((17, 0), (33, 20), strokes=True), (thick, plain))
+
+def test_bounds_are_incremental():
+    doc = pyps.Document()
+    eq_(doc.bounds(), None)
+    eq_(doc.boundingbox(), None)
+
+    doc.add_shape(Circle((10, 20), 5, stroke=None))
+    eq_(doc.bounds(), (5.0, 15.0, 15.0, 25.0))
+
+    #Strokes are centered on the outline.
+    doc.add_shape(Circle((100, 0), 10, stroke_width=4))
+    eq_(doc.bounds(), (5.0, -12.0, 112.0, 25.0))
+
+    bbox = doc.boundingbox()
+    eq_(bbox.lowerleft.coords(), (5.0, -12.0))
+    eq_(bbox.upperright.coords(), (112.0, 25.0))
+
+def test_reindex_recomputes_bounds():
+    from pyps import geom
+    center = geom.MovablePt(0, 0)
+    doc = pyps.Document()
+    doc.add_shape(Circle(center, 5, stroke=None))
+    eq_(doc.bounds(), (-5.0, -5.0, 5.0, 5.0))
+
+    center.move_to(100, 100)
+    eq_(doc.bounds(), (-5.0, -5.0, 5.0, 5.0))
+    doc.reindex()
+    eq_(doc.bounds(), (95.0, 95.0, 105.0, 105.0))
+    eq_(len(doc.shapes_at(100, 100)), 1)
+
+def test_pages():
+    doc = pyps.Document()
+    eq_(doc.page_count(), 1)
+    first = Circle((10, 10), 5)
+    doc.add_shape(first)
+
+    page = doc.new_page()
+    eq_(doc.page_count(), 2)
+    ok_(doc.current_page() is page)
+    eq_(doc.shape_count(), 0)
+    eq_(doc.bounds(), None)
+
+    second = Circle((50, 50), 5)
+    doc.add_shape(second)
+    eq_(page.get_shapes(), (second,))
+    eq_(doc.get_page(0).get_shapes(), (first,))
+    eq_(doc.shapes_at(50, 50), (second,))
+    eq_(doc.get_page(0).shapes_at(10, 10), (first,))
+    eq_(list(doc.iterpages()), list(doc.get_pages()))
+
+
+
+def test_import_is_lazy():
+    #Heavy dependencies aren't loaded until they're needed, which is checked
+    # in a fresh interpreter so nothing is already imported.
+    script = "import sys, pyps.writers.postscript; print sorted(m for m in ('numpy', 'colour', 'docit', 'multiprocessing') if m in sys.modules)"
+    output = subprocess.check_output([sys.executable, '-c', script])
+    eq_(output.strip(), '[]')
+
+def test_add_shape_failure_leaves_page_unchanged():
+    from pyps.shapes import Shape
+
+    class BadShape(Shape):
+        def hittest(self, x, y):
+            return False
+        def boundingbox(self):
+            raise ValueError('No bounding box.')
+        def render(self, capabilities=[]):
+            return []
+
+    doc = pyps.Document()
+    doc.shapes_at(0, 0)
+    assert_raises(ValueError, doc.add_shape, Circle((0, 0), 1), BadShape())
+    eq_(doc.shape_count(), 0)
+    eq_(doc.bounds(), None)
+
+    circle = Circle((100, 100), 1)
+    doc.add_shape(circle)
+    eq_(doc.shapes_at(100, 100), (circle,))
+    eq_(doc.shapes_at(0, 0), ())
+    eq_(doc.bounds(), (98.5, 98.5, 101.5, 101.5))
@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import pickle
+
+import pyps
+from pyps import geom
+from pyps.art.color import FixedColor
+
+
+def _value_objects():
+    return [
+        geom.Pt(1, 2),
+        geom.FixedLength(3),
+        geom.FixedAngle(45),
+        geom.Translated((1, 2), 3, 4),
+        FixedColor(0.2, 0.4, 0.6),
+    ]
+
+
+def test_value_types_are_compact():
+    for obj in _value_objects():
+        ok_(not hasattr(obj, '__dict__'), 'Value object has a __dict__: %r' % (obj,))
+
+def test_value_types_pickle():
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        for obj in _value_objects() + [geom.FixedLength(0)]:
+            copy = pickle.loads(pickle.dumps(obj, protocol))
+            eq_(type(copy), type(obj))
+            if isinstance(obj, geom.Point):
+                eq_(copy.coords(), obj.coords())
+            elif isinstance(obj, FixedColor):
+                eq_(copy.rgbf(), obj.rgbf())
+            else:
+                eq_(float(copy), float(obj))
+
+def test_document_pickle():
+    from pyps.shapes import Circle
+    doc = pyps.Document()
+    doc.add_shape(Circle((1, 2), 3, fill=(1, 0, 0), stroke_width=0.5))
+    doc.add_shape(Circle(geom.Translated((4, 5), 1, 1), 2))
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(doc, protocol))
+        shapes = copy.get_page(0).get_shapes()
+        eq_([s.center.coords() for s in shapes], [(1, 2), (5.0, 6.0)])
+        eq_(shapes[0].fill.rgbf(), (1.0, 0.0, 0.0))
+        eq_(float(shapes[0].stroke_width), 0.5)
+        eq_(copy.get_page(0).bounds(), doc.get_page(0).bounds())
+
+def test_pt_coords():
+    pt = geom.Pt(3, 4.5)
+    eq_(pt.coords(), (3, 4.5))
+    eq_((pt.x, pt.y), (3, 4.5))
+    eq_(geom.Translated(pt, 1, -1).coords(), (4.0, 3.5))
+
+class _CountingTranslated(geom.Translated):
+    __slots__ = ('count',)
+
+    def __init__(self, *args):
+        self.count = 0
+        geom.Translated.__init__(self, *args)
+
+    def _compute(self):
+        self.count += 1
+        return geom.Translated._compute(self)
+
+class _Untracked(geom.Point):
+    def __init__(self, x, y):
+        self.xy = (x, y)
+
+    def coords(self):
+        return self.xy
+
+
+def test_derived_points_are_cached():
+    origin = geom.MovablePt(1, 2)
+    first = _CountingTranslated(origin, 1, 1)
+    second = _CountingTranslated(first, 10, 10)
+
+    for i in xrange(5):
+        eq_(second.coords(), (12.0, 13.0))
+        eq_((second.x, second.y), (12.0, 13.0))
+    eq_(first.count, 1)
+    eq_(second.count, 1)
+
+def test_derived_points_follow_moves():
+    origin = geom.MovablePt(1, 2)
+    chain = [origin]
+    for i in xrange(20):
+        chain.append(_CountingTranslated(chain[-1], 1, 0))
+    tip = chain[-1]
+    eq_(tip.coords(), (21.0, 2.0))
+    version = tip.version()
+
+    origin.move_to(5, 5)
+    eq_(tip.coords(), (25.0, 5.0))
+    ok_(tip.version() != version)
+    eq_(tip.count, 2)
+
+    #Moving to the same place doesn't invalidate anything.
+    version = tip.version()
+    origin.move_to(5, 5)
+    eq_(tip.coords(), (25.0, 5.0))
+    eq_(tip.version(), version)
+    eq_(tip.count, 2)
+
+    origin.move_by(-5, 0)
+    eq_(tip.coords(), (20.0, 5.0))
+
+def test_bounding_box_corners_follow_moves():
+    from pyps.shapes import BoundingBox
+    pt = geom.MovablePt(0, 0)
+    bbox = BoundingBox(pt, geom.Translated(pt, 10, -5))
+    eq_(bbox.lowerleft.coords(), (0, -5.0))
+    eq_(bbox.upperright.coords(), (10.0, 0))
+
+    pt.move_to(-10, 10)
+    eq_(bbox.lowerleft.coords(), (-10, 5.0))
+    eq_(bbox.upperright.coords(), (0.0, 10))
+    eq_(bbox.width(), 10)
+
+def test_observed_points_pickle():
+    #Dependents and cached coordinates aren't pickled, so a point which has
+    # had a bounding box taken from it can still be pickled.
+    from pyps.shapes import Circle
+    circle = Circle(geom.MovablePt(1, 2), 3)
+    eq_(circle.boundingbox().upperright.coords(), (4.0, 5.0))
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        eq_(pickle.loads(pickle.dumps(circle, protocol)).center.coords(), (1, 2))
+
+        #Derived points observe their sources again when they're loaded.
+        origin = geom.MovablePt(1, 2)
+        tip = _CountingTranslated(_CountingTranslated(origin, 1, 1), 1, 1)
+        eq_(tip.coords(), (3.0, 4.0))
+        tip = pickle.loads(pickle.dumps(tip, protocol))
+        eq_(tip.coords(), (3.0, 4.0))
+        tip._sources[0]._sources[0].move_to(0, 0)
+        eq_(tip.coords(), (2.0, 2.0))
+
+def test_untracked_points_are_not_cached():
+    pt = _Untracked(1, 1)
+    derived = _CountingTranslated(pt, 1, 1)
+    eq_(derived.version(), None)
+    eq_(derived.coords(), (2.0, 2.0))
+
+    pt.xy = (3, 3)
+    eq_(derived.coords(), (4.0, 4.0))
+    eq_(derived.count, 2)
+
+
+class _NoRepr(object):
+    def __repr__(self):
+        raise AssertionError('Error message formatted eagerly.')
+
+def test_cast_fast_paths():
+    pt = geom.Pt(1, 2)
+    ok_(geom.Point.cast(pt) is pt)
+    eq_(geom.Point.cast((1, 2)).coords(), (1.0, 2.0))
+    eq_(geom.Point.cast([1, 2]).coords(), (1.0, 2.0))
+    eq_(geom.Point.cast(0).coords(), (0.0, 0.0))
+    eq_(float(geom.Length.cast(3)), 3.0)
+    eq_(float(geom.Length.cast(3L)), 3.0)
+    eq_(float(geom.Angle.cast(2.5)), 2.5)
+    length = geom.FixedLength(4)
+    ok_(geom.Length.cast(length) is length)
+
+def test_cast_error_messages():
+    #Messages with arguments are only formatted when the cast fails.
+    arg = _NoRepr()
+    geom.Point.cast((1, 2), 'Bad point: %r', arg)
+    geom.Length.cast(1, 'Bad length: %r', arg)
+    geom.Angle.cast(1, 'Bad angle: %r', arg)
+
+    with assert_raises(TypeError) as cm:
+        geom.Point.cast((1, 2, 3), 'Bad point %d: %r', 7, 'x')
+    eq_(str(cm.exception), "Bad point 7: 'x'")
+    with assert_raises(TypeError) as cm:
+        geom.Length.cast('x', 'Bad length: 100%')
+    eq_(str(cm.exception), 'Bad length: 100%')
+    with assert_raises(TypeError) as cm:
+        geom.Angle.cast('x')
+    eq_(str(cm.exception), "Could not cast to a Angle: 'x'")
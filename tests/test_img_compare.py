@@ -3,7 +3,9 @@
 
 from nose.tools import *
 import os.path
+import math
 import random
+import numpy
 from PIL import Image, ImageDraw, ImageFilter
 
 from tools import img_compare
@@ -174,3 +176,49 @@ def test_heavily_blurred_images():
     ok_(not img_compare.similar(im1, im2), "Images are similar.")
 
 
+
+def test_multiscale_agrees():
+    im1 = _load_test_image()
+    cases = [
+        im1.copy(),
+        im1.rotate(180),
+        im1.filter(ImageFilter.GaussianBlur(5)),
+        im1.filter(ImageFilter.GaussianBlur(50)),
+    ]
+    random.seed(2718)
+    for pct in (0.01, 0.5):
+        im2 = im1.copy()
+        _add_noise(im2, pct)
+        cases.append(im2)
+
+    for im2 in cases:
+        eq_(img_compare.similar(im1, im2, multiscale=True), img_compare.similar(im1, im2))
+
+    #The large image is downsampled further, so compare it too.
+    im1 = _load_large_test_image()
+    for im2 in (im1.copy(), im1.rotate(180), im1.filter(ImageFilter.GaussianBlur(5)), im1.filter(ImageFilter.GaussianBlur(50))):
+        eq_(img_compare.similar(im1, im2, multiscale=True), img_compare.similar(im1, im2))
+
+def test_rms_of_large_images():
+    #The sum of squared differences doesn't fit in 32 bits.
+    a1 = numpy.zeros((600, 800, 3), dtype=numpy.uint8)
+    a2 = numpy.empty_like(a1)
+    a2.fill(255)
+    eq_(img_compare._rms(a1, a2), 255.0)
+
+def test_vectorized_matches_pixel_loop():
+    im1 = _load_test_image()
+    im2 = im1.rotate(90)
+    r = int(math.ceil(min(im1.size) * 0.10))
+    pix1 = im1.convert('RGB').filter(ImageFilter.GaussianBlur(r)).load()
+    pix2 = im2.convert('RGB').filter(ImageFilter.GaussianBlur(r)).load()
+    energy = 0
+    for x in range(im1.size[0]):
+        for y in range(im1.size[1]):
+            energy += sum((a - b) ** 2 for a, b in zip(pix1[x, y], pix2[x, y]))
+    expected = math.sqrt(float(energy) / float(3 * im1.size[0] * im1.size[1]))
+
+    blur1 = im1.convert('RGB').filter(ImageFilter.GaussianBlur(r))
+    blur2 = im2.convert('RGB').filter(ImageFilter.GaussianBlur(r))
+    actual = img_compare._rms(numpy.asarray(blur1), numpy.asarray(blur2))
+    ok_(abs(actual - expected) < 1e-9)
@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import math
+import re
+import StringIO
+import zlib
+
+import pyps
+from pyps import geom
+from pyps.shapes import Circle
+from pyps.writers.pdf import PDFWriter
+
+
+def _doc(pages=3):
+    doc = pyps.Document()
+    for p in xrange(pages):
+        if p:
+            doc.new_page()
+        for i in xrange(50):
+            doc.add_shape(Circle((100 + i, 100 + p), 20, fill=(0.2, 0.5, 0.7), stroke_width=2))
+    return doc
+
+def _objects(pdf):
+    return dict((int(m.group(1)), m.start()) for m in re.finditer(r'(?m)^(\d+) 0 obj$', pdf))
+
+def _content_streams(pdf):
+    return [m.group(1) for m in re.finditer(r'(?s)stream\n(.*?)\nendstream', pdf)]
+
+
+def test_arc_to_beziers():
+    start, curves = geom.arc_to_beziers(10, 20, 5, 0, 360)
+    eq_(len(curves), 4)
+    assert_almost_equal(start[0], 15)
+    assert_almost_equal(start[1], 20)
+    assert_almost_equal(curves[-1][4], 15)
+    assert_almost_equal(curves[-1][5], 20)
+
+    #The midpoint of each curve should be very close to the circle.
+    for x1, y1, x2, y2, x3, y3 in curves:
+        mx = (start[0] + 3*x1 + 3*x2 + x3) / 8.0
+        my = (start[1] + 3*y1 + 3*y2 + y3) / 8.0
+        assert_almost_equal(math.hypot(mx - 10, my - 20), 5, places=3)
+        start = (x3, y3)
+
+    #Clockwise arcs go the other way around.
+    start, curves = geom.arc_to_beziers(0, 0, 1, 0, 90, ccw=False)
+    eq_(len(curves), 3)
+    assert_almost_equal(curves[0][5], -1)
+
+def test_pdf_structure():
+    ostream = StringIO.StringIO()
+    stats = PDFWriter().write(ostream, _doc())
+    pdf = ostream.getvalue()
+
+    eq_(stats.shapes, 150)
+    eq_(stats.bytes, len(pdf))
+    ok_(pdf.startswith('%PDF-1.4\n'))
+    ok_(pdf.endswith('%%EOF\n'))
+    ok_('/Count 3' in pdf)
+
+    #Every xref entry points at the start of its object.
+    xref_offset = int(re.search(r'startxref\n(\d+)\n', pdf).group(1))
+    ok_(pdf[xref_offset:].startswith('xref\n'))
+    entries = re.findall(r'(\d{10}) 00000 n ', pdf[xref_offset:])
+    objects = _objects(pdf)
+    eq_(len(entries), len(objects))
+    for num, offset in enumerate(entries):
+        eq_(objects[num + 1], int(offset))
+
+def test_pdf_content_is_compressed():
+    doc = _doc(1)
+    compressed = StringIO.StringIO()
+    PDFWriter().write(compressed, doc)
+    plain = StringIO.StringIO()
+    PDFWriter(compress=False).write(plain, doc)
+
+    ok_(len(compressed.getvalue()) < len(plain.getvalue()) / 4)
+
+    content = zlib.decompress(_content_streams(compressed.getvalue())[0])
+    eq_(content, _content_streams(plain.getvalue())[0])
+    eq_(content.count(' c\n'), 200)
+    eq_(content.count('B\n'), 50)
+    ok_(content.startswith('120 100 m\n'))
+
+    length = int(re.search(r'/Length (\d+) 0 R', compressed.getvalue()).group(1))
+    eq_(int(re.search(r'(?m)^%d 0 obj\n(\d+)\n' % (length,), compressed.getvalue()).group(1)),
+        len(_content_streams(compressed.getvalue())[0]))
+
+def test_curves():
+    from pyps.shapes import Path
+    writer = PDFWriter()
+    parts = []
+    writer._write_path(parts.append, Path(stroke=(0, 0, 0)).moveTo((0, 0)).curveTo((3, 0), (1, 1), (2, 1)).line(1, 1))
+    eq_(''.join(parts), '0 0 m\n1 1 2 1 3 0 c\n4 1 l\n0 0 0 RG 1 w\nS\n')
+
+def test_dpi():
+    doc = pyps.Document()
+    doc.add_shape(
+        Circle((10.5, 10.5), 0.2, fill=(1, 0, 0), stroke=None),
+        Circle((12.5, 10.5), 0.2, fill=(1, 0, 0), stroke=None),
+        Circle((100.123456, 100), 20, fill=(0.2, 0.5, 0.7)),
+    )
+    ostream = StringIO.StringIO()
+    stats = PDFWriter(compress=False, dpi=72).write(ostream, doc)
+    content = _content_streams(ostream.getvalue())[0]
+    eq_((stats.shapes, stats.subpixel), (1, 2))
+    ok_(content.startswith('1 0 0 rg\n'))
+    ok_('10 10 1 1 re\n' in content and '12 10 1 1 re\n' in content)
+    eq_(content.count('f\n'), 1)
+    ok_('120.1 100 m\n' in content)
+
+    ostream = StringIO.StringIO()
+    PDFWriter(compress=False, dpi=72, dots=False).write(ostream, doc)
+    ok_(' re\n' not in _content_streams(ostream.getvalue())[0])
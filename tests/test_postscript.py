@@ -0,0 +1,589 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import gc
+import StringIO
+import struct
+
+import numpy
+
+import pyps
+from pyps.shapes import Circle, CircleArray, Path
+from pyps.shapes.xforms import Translate, Scale
+from pyps.writers import BufferedSink, WriteProfile, FragmentCache
+from pyps.writers.postscript import EPSWriter, PSWriter, NumberEncoder
+
+
+class _RecordingStream(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def getvalue(self):
+        return ''.join(self.writes)
+
+
+def _circles_doc(count=200):
+    doc = pyps.Document()
+    for i in xrange(count):
+        doc.add_shape(Circle((i, 2*i), 10 + (i % 7), fill=(0.2, 0.5, 0.7), stroke_width=2))
+    return doc
+
+
+def test_buffered_sink_blocks():
+    ostream = _RecordingStream()
+    sink = BufferedSink(ostream, 100)
+    for i in xrange(1000):
+        sink.write('abc')
+    sink.flush()
+
+    eq_(ostream.getvalue(), 'abc' * 1000)
+    eq_(sink.bytes_written, 3000)
+    ok_(all(len(w) < 103 for w in ostream.writes))
+
+def test_streamed_output_matches_render_path():
+    doc = _circles_doc()
+    writer = EPSWriter()
+    ostream = _RecordingStream()
+    stats = writer.write(ostream, doc, buffer_size=256)
+    output = ostream.getvalue()
+
+    for shape in doc.itershapes():
+        expected = '\n'.join('newpath %s' % writer.render_path(p) for p in shape.render())
+        ok_(expected + '\n\n' in output)
+    ok_(output.startswith('%!PS-Adobe-3.0 EPSF-3.0\n'))
+    ok_(output.endswith('%%EOF\n'))
+    ok_(max(len(w) for w in ostream.writes) < 512)
+
+    eq_(stats.shapes, 200)
+    eq_(stats.bytes, len(output))
+    ok_(stats.throughput() > 0)
+
+def test_buffer_size_does_not_change_output():
+    doc = _circles_doc()
+    outputs = []
+    for buffer_size in (1, 100, 1 << 20):
+        ostream = StringIO.StringIO()
+        EPSWriter().write(ostream, doc, verbose=True, buffer_size=buffer_size)
+        outputs.append(ostream.getvalue())
+    eq_(outputs[0], outputs[1])
+    eq_(outputs[0], outputs[2])
+
+def test_bounding_box_comments():
+    doc = pyps.Document()
+    doc.add_shape(Circle((10.5, 20), 5, stroke_width=2))
+    ostream = StringIO.StringIO()
+    EPSWriter().write(ostream, doc)
+    lines = ostream.getvalue().splitlines()
+
+    ok_('%%BoundingBox: 4 14 17 26' in lines)
+    ok_('%%HiResBoundingBox: 4.500000 14.000000 16.500000 26.000000' in lines)
+
+def test_empty_bounding_box():
+    ostream = StringIO.StringIO()
+    EPSWriter().write(ostream, pyps.Document())
+    ok_('%%BoundingBox: 0 0 0 0' in ostream.getvalue().splitlines())
+
+def _multipage_doc(pages=6):
+    doc = pyps.Document()
+    for p in xrange(pages):
+        if p:
+            doc.new_page()
+        for i in xrange(20):
+            doc.add_shape(Circle((10*p + i, 20), 5 + i, title='Page %d circle %d' % (p, i)))
+    return doc
+
+def test_multipage_postscript():
+    doc = _multipage_doc()
+    ostream = StringIO.StringIO()
+    stats = PSWriter().write(ostream, doc, verbose=True)
+    output = ostream.getvalue()
+    lines = output.splitlines()
+
+    eq_(stats.shapes, 120)
+    ok_(lines[0] == '%!PS-Adobe-3.0')
+    ok_('%%Pages: 6' in lines)
+    page_lines = [l for l in lines if l.startswith('%%Page:')]
+    eq_(page_lines, ['%%%%Page: %d %d' % (n, n) for n in xrange(1, 7)])
+    eq_(output.count('showpage'), 6)
+    ok_(output.index('Page 2 circle 19') < output.index('%%Page: 4 4') < output.index('Page 3 circle 0'))
+    ok_(output.endswith('%%Trailer\n%%EOF\n'))
+
+def test_parallel_pages_match_serial():
+    doc = _multipage_doc()
+    serial = StringIO.StringIO()
+    PSWriter().write(serial, doc, verbose=True)
+    parallel = StringIO.StringIO()
+    stats = PSWriter().write(parallel, doc, verbose=True, processes=3)
+
+    eq_(stats.shapes, 120)
+    eq_(parallel.getvalue(), serial.getvalue())
+
+def test_eps_rejects_multiple_pages():
+    assert_raises(ValueError, EPSWriter().write, StringIO.StringIO(), _multipage_doc(2))
+
+def test_profile_does_not_change_output():
+    doc = _circles_doc()
+    plain = StringIO.StringIO()
+    EPSWriter().write(plain, doc, verbose=True)
+
+    profiled = StringIO.StringIO()
+    seen = []
+    profile = WriteProfile(callback=seen.append)
+    stats = EPSWriter().write(profiled, doc, verbose=True, profile=profile)
+    eq_(profiled.getvalue(), plain.getvalue())
+
+    eq_(profile.shapes, 200)
+    eq_(stats.shapes, 200)
+    eq_(seen, profile.records)
+    eq_([r.shape for r in profile.records], list(doc.itershapes()))
+    eq_(sum(r.bytes for r in profile.records), profile.bytes)
+    ok_(profile.bytes < stats.bytes)
+
+    record = profile.records[0]
+    shape = record.shape
+    expected = "% Shape: " + str(shape) + "\n" + '\n'.join(
+        'newpath %s' % EPSWriter().render_path(p) for p in shape.render()) + '\n\n'
+    eq_(record.bytes, len(expected))
+    eq_(record.paths, 1)
+    eq_(record.components, 1)
+    eq_(profile.components, 200)
+    #Each circle has a fill and a stroke.
+    eq_(profile.color_calls, 400)
+    ok_(record.seconds >= record.render_seconds >= 0)
+
+def test_profile_summaries():
+    doc = _multipage_doc(3)
+    profile = WriteProfile()
+    stats = PSWriter().write(StringIO.StringIO(), doc, profile=profile, processes=2)
+    eq_(stats.shapes, 60)
+    eq_([r.page for r in profile.records], [1] * 20 + [2] * 20 + [3] * 20)
+
+    summary = profile.by_type()
+    eq_(summary.keys(), ['Circle'])
+    eq_(summary['Circle']['count'], 60)
+    eq_(summary['Circle']['bytes'], profile.bytes)
+
+    largest = profile.largest(5)
+    eq_(len(largest), 5)
+    eq_([r.bytes for r in largest], sorted((r.bytes for r in profile.records), reverse=True)[:5])
+
+    quiet = WriteProfile(keep_records=False)
+    PSWriter().write(StringIO.StringIO(), doc, profile=quiet)
+    eq_(quiet.records, [])
+    eq_(quiet.shapes, 60)
+
+def test_curves():
+    from pyps.shapes.xforms import Scale
+    doc = pyps.Document()
+    doc.add_shape(Scale(2, 1, Circle((0, 0), 10)))
+    ostream = StringIO.StringIO()
+    EPSWriter().write(ostream, doc)
+    output = ostream.getvalue()
+    eq_(output.count(' curveto'), 4)
+    ok_('20.000000 0.000000 moveto' in output)
+
+def test_symbol_instancing():
+    doc = pyps.Document()
+    for i in xrange(50):
+        doc.add_shape(Circle((i * 3, 10), 2, fill=(1, 0, 0)))
+    doc.add_shape(Circle((0, 0), 2, fill=(0, 1, 0)))
+    doc.add_shape(Circle((5, 5), 3, fill=(1, 0, 0)))
+    doc.add_shape(Circle((7, 7), 2, fill=(0, 1, 0)))
+
+    plain = StringIO.StringIO()
+    EPSWriter().write(plain, doc)
+    ostream = StringIO.StringIO()
+    stats = EPSWriter(symbols=True).write(ostream, doc)
+    output = ostream.getvalue()
+
+    eq_(stats.shapes, 53)
+    ok_(len(output) < len(plain.getvalue()) / 2)
+    eq_(output.count('} bind def'), 2)
+    eq_(output.count(' S0 grestore'), 49)
+    eq_(output.count(' S1 grestore'), 1)
+    eq_(output.count(' arc\n'), 5)
+    ok_('gsave 3.000000 10.000000 translate S0 grestore' in output)
+    ok_('gsave 7.000000 7.000000 translate S1 grestore' in output)
+    eq_(output.splitlines()[:5], plain.getvalue().splitlines()[:5])
+
+def test_symbol_keys():
+    #Circles are keyed before they are rendered, so they're only rendered
+    # until their procedure is defined.
+    class CountingCircle(Circle):
+        renders = 0
+        def render(self, capabilities=[]):
+            CountingCircle.renders += 1
+            return Circle.render(self, capabilities)
+    doc = pyps.Document()
+    for i in xrange(10):
+        doc.add_shape(CountingCircle((i, 0), 1))
+    ostream = StringIO.StringIO()
+    EPSWriter(symbols=True).write(ostream, doc)
+    eq_(CountingCircle.renders, 2)
+    eq_(ostream.getvalue().count(' S0 grestore'), 9)
+
+    #Other shapes are keyed by the code they're written as, so arcs which
+    # differ only in their seventh decimal place aren't shared.
+    class UnkeyedCircle(Circle):
+        def symbol(self):
+            return None
+    doc = pyps.Document()
+    for i, r in enumerate((1.0, 1.0000001, 1.0000001)):
+        doc.add_shape(UnkeyedCircle((i, 0), r))
+    ostream = StringIO.StringIO()
+    EPSWriter(symbols=True).write(ostream, doc)
+    output = ostream.getvalue()
+    eq_(output.count('} bind def'), 1)
+    eq_(output.count(' S0 grestore'), 1)
+    ok_('0.0 0.0 1.0 0.0 360.0 arc' in output)
+    ok_('0.0 0.0 1.0000001 0.0 360.0 arc' in output)
+
+def test_symbols_per_page():
+    doc = _multipage_doc(3)
+    for p in xrange(3):
+        for i in xrange(5):
+            doc.get_page(p).add_shape(Circle((i, p), 1))
+    serial = StringIO.StringIO()
+    PSWriter(symbols=True).write(serial, doc, verbose=True)
+    parallel = StringIO.StringIO()
+    PSWriter(symbols=True).write(parallel, doc, verbose=True, processes=2)
+    eq_(parallel.getvalue(), serial.getvalue())
+
+    pages = serial.getvalue().split('%%Page:')[1:]
+    eq_(len(pages), 3)
+    for page in pages:
+        eq_(page.count('/S0 {'), 1)
+        eq_(page.count(' S0 grestore'), 4)
+
+def test_number_encoder():
+    encoder = NumberEncoder(3)
+    eq_(encoder.format_many([1.0, -0.0001, 100, 2.5, -3.25, 0.1234567, 1e6, -1000.0004]),
+        ['1', '0', '100', '2.5', '-3.25', '0.123', '1000000', '-1000'])
+    eq_(encoder.format(10.0005), '10.001')
+    eq_(encoder.join((0.2, 0.5, 1.0)), '0.2 0.5 1')
+    eq_(NumberEncoder(0).join((0.4, 2.6, -0.4)), '0 3 0')
+
+    #The precision is applied however large the numbers are.
+    eq_(NumberEncoder(6).format_many([123456789.123456, -98765.4321, 1e12, 100.5, 1e-7]),
+        ['123456789.123456', '-98765.4321', '1000000000000', '100.5', '0'])
+    eq_(NumberEncoder(2).format_many([1e20, 1e-20, 0.1]), ['100000000000000000000', '0', '0.1'])
+
+    #Large batches are rounded with numpy, but must give the same results.
+    values = [i * 1.37 - 50 for i in xrange(100)]
+    eq_(encoder.format_many(values), [encoder.format(v) for v in values])
+
+    #Halves are rounded away from zero in batches of either size.
+    halves = [2.125, -2.125, 0.0625, 1.5, -1.5]
+    expected = ['2.125', '-2.125', '0.063', '1.5', '-1.5']
+    eq_(encoder.format_many(halves), expected)
+    eq_(encoder.format_many(halves * 4), expected * 4)
+    eq_(NumberEncoder(2).format_many([2.125] * 20), ['2.13'] * 20)
+    halves = [0.5, -2.5, 2.5, 3.5, -0.5]
+    expected = ['1', '-3', '3', '4', '-1']
+    eq_(NumberEncoder(0).format_many(halves), expected)
+    eq_(NumberEncoder(0).format_many(halves * 4), expected * 4)
+
+def test_precision():
+    from pyps.shapes import Path
+    writer = EPSWriter(precision=2)
+    path = Path(fill=(0.25, 0.5, 1.0), stroke=(0, 0, 0), stroke_width=1.5).moveTo((1.0, 2.125)).line(-0.5, 0).arc((3, 4), 5.5, 0, 90.0)
+    eq_(writer.render_path(path),
+        '1 2.13 moveto\n -0.5 0 rlineto\n 3 4 5.5 0 90 arc'
+        '\n 0.25 0.5 1 setrgbcolor gsave fill grestore'
+        '\n 0 0 0 setrgbcolor 1.5 setlinewidth stroke')
+
+    doc = _circles_doc()
+    plain = StringIO.StringIO()
+    EPSWriter().write(plain, doc)
+    compact = StringIO.StringIO()
+    EPSWriter(precision=3).write(compact, doc)
+    ok_(len(compact.getvalue()) < len(plain.getvalue()) * 0.9)
+
+def test_binary_arrays():
+    from pyps.shapes import Path
+    path = Path(stroke=(0, 0, 0)).moveTo((1, 2)).lineTo((3, 4)).arc((5, 6), 7, 8, 9)
+    code = EPSWriter(binary=True).render_path(path)
+
+    token, rep, count = struct.unpack('>BBH', code[:4])
+    eq_((token, rep, count), (149, 48, 9))
+    values = struct.unpack('>9f', code[4:40])
+    eq_(values, (5, 6, 7, 8, 9, 3, 4, 1, 2))
+    ok_(code[40:].startswith(' aload pop moveto lineto arc\n'))
+
+    #Long paths are split into blocks that fit on the operand stack.
+    long_path = Path(stroke=(0, 0, 0)).moveTo((0, 0))
+    for i in xrange(199):
+        long_path.lineTo((i, i))
+    code = EPSWriter(binary=True).render_path(long_path)
+    eq_(code.count(' aload pop '), 4)
+
+    ostream = StringIO.StringIO()
+    EPSWriter(binary=True).write(ostream, _circles_doc(10))
+    ok_('%%DocumentData: Binary' in ostream.getvalue().splitlines())
+
+def test_fragment_cache():
+    from pyps import geom
+    center = geom.MovablePt(10, 10)
+    moving = Circle(center, 5)
+    doc = _circles_doc(20)
+    doc.add_shape(moving)
+
+    cache = FragmentCache()
+    writer = EPSWriter(cache=cache)
+    def check():
+        expected = StringIO.StringIO()
+        EPSWriter().write(expected, doc, verbose=True)
+        ostream = StringIO.StringIO()
+        writer.write(ostream, doc, verbose=True)
+        eq_(ostream.getvalue(), expected.getvalue())
+
+    check()
+    eq_((cache.hits, cache.misses, len(cache)), (0, 21, 21))
+    check()
+    eq_((cache.hits, cache.misses), (21, 21))
+
+    #Only changed shapes are rendered again.
+    center.move_to(20, 20)
+    doc.get_shape(3).touch()
+    check()
+    eq_((cache.hits, cache.misses), (40, 23))
+
+    #Fragments written with different options are kept apart.
+    EPSWriter(cache=cache, precision=2).write(StringIO.StringIO(), doc)
+    eq_(cache.hits, 40)
+
+def test_fragment_cache_dynamic_paint():
+    #Colors which can change behind a shape's back can't be cached.
+    from pyps.art.color import Color
+    class Mutable(Color):
+        __slots__ = ('rgb',)
+        def __init__(self, rgb):
+            self.rgb = rgb
+        def rgbf(self):
+            return self.rgb
+    fill = Mutable((1.0, 0.0, 0.0))
+    doc = pyps.Document()
+    doc.add_shape(Circle((10, 10), 5, fill=fill))
+    doc.add_shape(CircleArray([(20, 20)], 1, stroke=Mutable((0.0, 0.0, 0.0))))
+    eq_([s.revision() for s in doc.get_shapes()], [None, None])
+
+    writer = EPSWriter(cache=FragmentCache())
+    writer.write(StringIO.StringIO(), doc)
+    fill.rgb = (0.0, 0.0, 1.0)
+    ostream = StringIO.StringIO()
+    writer.write(ostream, doc)
+    ok_('0.0 0.0 1.0 setrgbcolor' in ostream.getvalue())
+
+def test_fragment_cache_eviction():
+    cache = FragmentCache(max_bytes=100)
+    circles = [Circle((i, i), 1) for i in xrange(5)]
+    for c in circles:
+        cache.put(c, c.revision(), 'x' * 30)
+    eq_(len(cache), 3)
+    eq_(cache.bytes, 90)
+    eq_(cache.get(circles[0], circles[0].revision()), None)
+    eq_(cache.get(circles[2], circles[2].revision()), 'x' * 30)
+
+    #The least recently used fragment goes first.
+    cache.put(circles[0], circles[0].revision(), 'y' * 30)
+    eq_(cache.get(circles[3], circles[3].revision()), None)
+    eq_(cache.get(circles[2], circles[2].revision()), 'x' * 30)
+
+    #Fragments for shapes which no longer exist are dropped.
+    del circles[:], c
+    gc.collect()
+    eq_(len(cache), 0)
+    eq_(cache.bytes, 0)
+
+def test_viewport():
+    doc = _circles_doc()
+    #Circles reaching into the viewport, including just their strokes.
+    visible = [
+        s for i, s in enumerate(doc.itershapes())
+        if i - (10 + i % 7) - 1 <= 50 and 2*i - (10 + i % 7) - 1 <= 40
+    ]
+    ostream = StringIO.StringIO()
+    stats = EPSWriter().write(ostream, doc, verbose=True, viewport=(50, 40, 0, 0))
+    output = ostream.getvalue()
+    lines = output.splitlines()
+
+    eq_(stats.shapes, len(visible))
+    eq_(stats.culled, 200 - len(visible))
+    ok_('%%BoundingBox: 0 0 50 40' in lines)
+    ok_('0.000000 0.000000 50.000000 40.000000 rectclip' in lines)
+    eq_(output.count('% Shape: '), len(visible))
+    eq_(output.count('gsave'), output.count('grestore'))
+
+    #The visible shapes are written the same as without a viewport.
+    cropped = StringIO.StringIO()
+    EPSWriter().write(cropped, doc, viewport=(0, 0, 50, 40))
+    subset = pyps.Document()
+    subset.add_shape(*visible)
+    expected = StringIO.StringIO()
+    EPSWriter().write(expected, subset)
+    body = expected.getvalue().split('%%Pages: 1\n')[1]
+    ok_(body.split('%%EOF')[0].strip() in cropped.getvalue())
+
+def test_viewport_pages():
+    doc = _multipage_doc()
+    serial = StringIO.StringIO()
+    stats = PSWriter().write(serial, doc, viewport=(0, 0, 30, 30))
+    parallel = StringIO.StringIO()
+    parallel_stats = PSWriter().write(parallel, doc, viewport=(0, 0, 30, 30), processes=3)
+
+    eq_(parallel.getvalue(), serial.getvalue())
+    eq_(stats.shapes + stats.culled, 120)
+    ok_(stats.culled > 0)
+    eq_((parallel_stats.shapes, parallel_stats.culled), (stats.shapes, stats.culled))
+    ok_('%%BoundingBox: 0 0 30 30' in serial.getvalue().splitlines())
+    eq_(serial.getvalue().count('%%PageBoundingBox: 0 0 30 30'), 6)
+
+def test_viewport_invalid():
+    assert_raises(ValueError, EPSWriter().write, StringIO.StringIO(), _circles_doc(), viewport=(0, 0, 10))
+
+def test_circle_batch():
+    rand = numpy.random.RandomState(161)
+    centers = rand.uniform(0, 100, (150, 2))
+    array = CircleArray(centers, 2.5, fill=(0.2, 0.5, 0.7))
+    doc = pyps.Document()
+    doc.add_shape(array)
+    ostream = StringIO.StringIO()
+    stats = EPSWriter().write(ostream, doc)
+    output = ostream.getvalue()
+
+    eq_(stats.shapes, 1)
+    eq_(output.count(' bind def'), 1)
+    eq_(output.count('0 360 arc'), 1)
+    ok_('0.2 0.5 0.7 setrgbcolor gsave fill grestore 0.0 0.0 0.0 setrgbcolor 1.000000 setlinewidth stroke' in output)
+    #Blocks of circles, each pushed last circle first.
+    eq_(output.count(' 64 { c } repeat'), 2)
+    eq_(output.count(' 22 { c } repeat'), 1)
+    first = output.split('bind def\n ')[1].split(' 64 { c } repeat')[0].split()
+    eq_(len(first), 64 * 3)
+    eq_([round(float(v), 6) for v in first[-3:]], [round(v, 6) for v in centers[0].tolist() + [2.5]])
+    eq_([round(float(v), 6) for v in first[:3]], [round(v, 6) for v in centers[63].tolist() + [2.5]])
+
+def test_circle_batch_fills():
+    array = CircleArray([(10, 10), (20, 20)], [1, 2], fills=[(1, 0, 0), (0, 0.5, 1)], stroke=None)
+    eq_(
+        EPSWriter(precision=2).render_path(array.render(EPSWriter.capabilities)[0]),
+        '1 dict begin /c { setrgbcolor newpath 0 360 arc gsave fill grestore } bind def'
+        '\n 20 20 2 0 0.5 1 10 10 1 1 0 0 2 { c } repeat\n end'
+    )
+
+def test_circle_batch_binary():
+    array = CircleArray([(10, 10), (20.5, 20)], 1)
+    code = EPSWriter(binary=True).render_path(array.render(EPSWriter.capabilities)[0])
+    header = struct.pack('>BBH', 149, 48, 6)
+    ok_(header in code)
+    values = struct.unpack('>6f', code.split(header)[1][:24])
+    eq_(values, (20.5, 20.0, 1.0, 10.0, 10.0, 1.0))
+    ok_(code.endswith(' aload pop 2 { c } repeat\n end'))
+
+def test_circle_batch_options():
+    #Batches work with all of the writer's other options.
+    array = CircleArray([(10, 10), (20, 20)], 1)
+    doc = pyps.Document()
+    doc.add_shape(array, Circle((5, 5), 1), array)
+    plain = StringIO.StringIO()
+    EPSWriter().write(plain, doc)
+    batch = EPSWriter().render_path(array.render(EPSWriter.capabilities)[0])
+    ostream = StringIO.StringIO()
+    EPSWriter(symbols=True).write(ostream, doc)
+    eq_(ostream.getvalue().count(batch), 2)
+    ostream = StringIO.StringIO()
+    EPSWriter(cache=FragmentCache()).write(ostream, doc)
+    eq_(ostream.getvalue(), plain.getvalue())
+    profile = WriteProfile()
+    ostream = StringIO.StringIO()
+    EPSWriter().write(ostream, doc, profile=profile)
+    eq_(ostream.getvalue(), plain.getvalue())
+    eq_([r.components for r in profile.records], [2, 1, 2])
+
+def test_circle_batch_transformed():
+    array = CircleArray([(10, 10), (20, 20)], 1)
+    moved = EPSWriter().render_path(Translate(5, 5, array).render(EPSWriter.capabilities)[0])
+    ok_(moved.startswith('1 dict begin'))
+    ok_(' 25.0 25.0 1.0 15.0 15.0 1.0 2 { c } repeat' in moved)
+    #Matrix transforms get paths instead.
+    paths = Scale(2, 1, array).render(EPSWriter.capabilities)
+    eq_(len(paths), 2)
+    ok_(all(isinstance(p, Path) for p in paths))
+
+def _tiny_doc():
+    doc = pyps.Document()
+    doc.add_shape(
+        Circle((10.5, 10.5), 0.2, fill=(1, 0, 0), stroke=None),
+        #In the same pixel as the first, and on top of it.
+        Circle((10.6, 10.6), 0.2, fill=(0, 1, 0), stroke=None),
+        Circle((20.5, 5.5), 0.2, fill=(1, 0, 0), stroke=None),
+        Translate(100, 0, Circle((10.5, 10.5), 0.1, stroke=(0, 0, 1), stroke_width=0.5)),
+        Circle((250.123456, 250), 50, fill=(0.5, 0.5, 0.5)),
+        Circle((3.5, 3.5), 0.2, fill=(0, 0, 1), stroke=None),
+        Circle((4.5, 4.5), 0.2, stroke=None),
+        #The stroke makes this one bigger than a pixel.
+        Circle((30.5, 30.5), 0.2, stroke_width=1),
+    )
+    return doc
+
+def test_dpi_dots():
+    ostream = StringIO.StringIO()
+    stats = EPSWriter(dpi=72).write(ostream, _tiny_doc())
+    output = ostream.getvalue()
+    eq_(stats.shapes, 2)
+    eq_(stats.subpixel, 6)
+
+    first, rest = output.split('newpath 250.1 250 50 0 360 arc', 1)
+    ok_('1 0 0 setrgbcolor\n20 5 1 { 1 dup rectfill } repeat\n' in first)
+    ok_('0 1 0 setrgbcolor\n10 10 1 { 1 dup rectfill } repeat\n' in first)
+    ok_('0 0 1 setrgbcolor\n110 10 1 { 1 dup rectfill } repeat\n' in first)
+    eq_(first.count('rectfill'), 3)
+    ok_('0 0 1 setrgbcolor\n3 3 1 { 1 dup rectfill } repeat\n' in rest)
+    eq_(rest.count('rectfill'), 1)
+    ok_('newpath 30.5 30.5 0.2 0 360 arc' in rest)
+
+def test_dpi_skip():
+    ostream = StringIO.StringIO()
+    stats = EPSWriter(dpi=72, dots=False).write(ostream, _tiny_doc())
+    eq_((stats.shapes, stats.subpixel), (2, 6))
+    ok_('rectfill' not in ostream.getvalue())
+
+def test_dpi_precision():
+    ostream = StringIO.StringIO()
+    stats = EPSWriter(dpi=300).write(ostream, _tiny_doc())
+    output = ostream.getvalue()
+    ok_('newpath 250.12 250 50 0 360 arc' in output)
+    eq_(stats.subpixel, 0)
+
+    doc = pyps.Document()
+    doc.add_shape(Circle((10.6, 10.6), 0.05, fill=(0, 1, 0), stroke=None))
+    ostream = StringIO.StringIO()
+    EPSWriter(dpi=300).write(ostream, doc)
+    ok_('0 1 0 setrgbcolor\n10.56 10.56 1 { 0.24 dup rectfill } repeat\n' in ostream.getvalue())
+
+    ostream = StringIO.StringIO()
+    EPSWriter(dpi=300, precision=4).write(ostream, _tiny_doc())
+    ok_('newpath 250.1235 250 50 0 360 arc' in ostream.getvalue())
+
+    assert_raises(ValueError, EPSWriter, dpi=0)
+
+def test_dpi_pages():
+    doc = _tiny_doc()
+    doc.new_page().add_shape(*_tiny_doc().get_shapes())
+    serial = StringIO.StringIO()
+    stats = PSWriter(dpi=72).write(serial, doc)
+    parallel = StringIO.StringIO()
+    parallel_stats = PSWriter(dpi=72).write(parallel, doc, processes=2)
+    eq_(parallel.getvalue(), serial.getvalue())
+    eq_((stats.shapes, stats.subpixel), (4, 12))
+    eq_((parallel_stats.shapes, parallel_stats.subpixel), (4, 12))
+    eq_(serial.getvalue().count('rectfill'), 8)
+
+def test_device_precision():
+    from pyps.writers import device_precision
+    eq_([device_precision(dpi) for dpi in (7.2, 72, 150, 300, 600, 1200)], [0, 1, 2, 2, 2, 3])
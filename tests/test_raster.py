@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import math
+import StringIO
+
+import numpy
+
+import pyps
+from pyps.shapes import Circle, Path, PaintableShape
+from pyps.writers.raster import RasterWriter
+
+
+class _PathShape(PaintableShape):
+    """
+    A shape which just renders a given path.
+    """
+    def __init__(self, path):
+        self._path = path
+        super(_PathShape, self).__init__()
+
+    def hittest(self, x, y):
+        return False
+
+    def boundingbox(self):
+        from pyps.shapes import BoundingBox
+        return BoundingBox((0, 0), (100, 100))
+
+    def render(self, capabilities=[]):
+        return [self._path]
+
+
+def _count(image, rgb):
+    return int(numpy.all(image == numpy.array(rgb, dtype=numpy.uint8), axis=2).sum())
+
+
+def test_filled_circle():
+    doc = pyps.Document()
+    doc.add_shape(Circle((50, 50), 40, fill=(0, 0, 1.0), stroke=None))
+    image = RasterWriter().render(doc, (0, 0, 100, 100))
+
+    eq_(image.shape, (100, 100, 3))
+    eq_(image.dtype, numpy.uint8)
+    assert_almost_equal(_count(image, (0, 0, 255)) / (math.pi * 40 * 40), 1.0, places=2)
+    eq_(tuple(image[50, 50]), (0, 0, 255))
+    eq_(tuple(image[0, 0]), (255, 255, 255))
+
+def test_stroked_circle():
+    doc = pyps.Document()
+    doc.add_shape(Circle((50, 50), 40, stroke=(1.0, 0, 0), stroke_width=4))
+    image = RasterWriter().render(doc, (0, 0, 100, 100))
+
+    #An annulus of width 4 around the circle.
+    assert_almost_equal(_count(image, (255, 0, 0)) / (2 * math.pi * 40 * 4), 1.0, places=1)
+    eq_(tuple(image[50, 50]), (255, 255, 255))
+    eq_(tuple(image[50, 10]), (255, 0, 0))
+
+def test_y_axis_points_up():
+    path = Path(fill=(0, 1.0, 0), stroke=None).moveTo((0, 0)).lineTo((100, 0)).lineTo((100, 20)).lineTo((0, 20))
+    doc = pyps.Document()
+    doc.add_shape(_PathShape(path))
+    image = RasterWriter().render(doc, (0, 0, 100, 100))
+
+    eq_(_count(image, (0, 255, 0)), 2000)
+    eq_(tuple(image[99, 50]), (0, 255, 0))
+    eq_(tuple(image[0, 50]), (255, 255, 255))
+
+def test_nonzero_winding():
+    #Two overlapping squares with opposite orientation leave a hole, with the
+    # same orientation they don't.
+    path = (Path(fill=(0, 0, 0), stroke=None)
+        .moveTo((10, 10)).line(40, 0).line(0, 40).line(-40, 0)
+        .moveTo((20, 20)).line(0, 20).line(20, 0).line(0, -20))
+    doc = pyps.Document()
+    doc.add_shape(_PathShape(path))
+    image = RasterWriter().render(doc, (0, 0, 100, 100))
+    eq_(_count(image, (0, 0, 0)), 1600 - 400)
+
+def test_dpi_and_supersample():
+    doc = pyps.Document()
+    doc.add_shape(Circle((50, 50), 40, fill=(0, 0, 1.0), stroke=None))
+    image = RasterWriter(dpi=144, supersample=3).render(doc, (0, 0, 100, 100))
+    eq_(image.shape, (200, 200, 3))
+    #Anti-aliased edges have intermediate values.
+    ok_(len(numpy.unique(image[:, :, 0])) > 2)
+
+def test_write_ppm():
+    doc = pyps.Document()
+    doc.add_shape(Circle((50, 50), 40, fill=(0, 0, 1.0)))
+    doc.new_page()
+    doc.add_shape(Circle((10, 10), 5))
+    ostream = StringIO.StringIO()
+    RasterWriter().write(ostream, doc)
+    data = ostream.getvalue()
+
+    ok_(data.startswith('P6\n82 82\n255\n'))
+    eq_(data.count('P6\n'), 2)
+
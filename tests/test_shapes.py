@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import numpy
+
+from pyps.shapes import (Shape, Circle, CircleArray, CircleBatch, Path, PATH_ARITY, PATH_MOVETO,
+    PATH_ARCN, PATH_RLINETO, CAPABILITY_CIRCLE_BATCH)
+
+
+class _Square(Shape):
+    """
+    A minimal shape which only implements the scalar `hittest`.
+    """
+    def __init__(self, size):
+        self._size = size
+        super(_Square, self).__init__()
+
+    def hittest(self, x, y):
+        return 0 <= x <= self._size and 0 <= y <= self._size
+
+    def boundingbox(self):
+        raise NotImplementedError()
+
+    def render(self, capabilities=[]):
+        raise NotImplementedError()
+
+
+def _sample_points(count=1000, seed=57721):
+    rand = numpy.random.RandomState(seed)
+    return rand.uniform(-20, 220, count), rand.uniform(-20, 220, count)
+
+
+def test_circle_hittest_many_matches_hittest():
+    circle = Circle((100, 100), 50)
+    xs, ys = _sample_points()
+    mask = circle.hittest_many(xs, ys)
+
+    eq_(mask.dtype, numpy.bool_)
+    eq_(mask.shape, xs.shape)
+    ok_(mask.any())
+    eq_(list(mask), [circle.hittest(x, y) for x, y in zip(xs, ys)])
+
+def test_default_hittest_many_matches_hittest():
+    square = _Square(100)
+    xs, ys = _sample_points()
+    mask = square.hittest_many(xs, ys)
+
+    eq_(mask.dtype, numpy.bool_)
+    eq_(list(mask), [square.hittest(x, y) for x, y in zip(xs, ys)])
+
+def test_hittest_many_keeps_shape():
+    xs, ys = numpy.meshgrid(numpy.arange(0, 200, 10.0), numpy.arange(0, 150, 10.0))
+    for shape in (Circle((100, 100), 50), _Square(100)):
+        mask = shape.hittest_many(xs, ys)
+        eq_(mask.shape, xs.shape)
+        eq_(mask[10, 10], shape.hittest(100, 100))
+        eq_(mask[0, 19], shape.hittest(190, 0))
+
+def test_path_components():
+    path = Path().moveTo((1, 2)).lineTo((3.5, 4)).move(1, -1).line(0, 2).arc((5, 6), 7, 10, 20).arc((0, 0), 1, ccw=False)
+    expected = [
+        ('M', 1.0, 2.0),
+        ('L', 3.5, 4.0),
+        ('m', 1.0, -1.0),
+        ('l', 0.0, 2.0),
+        ('a', 5.0, 6.0, 7.0, 10.0, 20.0, True),
+        ('a', 0.0, 0.0, 1.0, 0.0, 360.0, False),
+    ]
+    eq_(len(path), len(expected))
+    eq_(list(path), expected)
+    eq_([path[i] for i in xrange(len(path))], expected)
+    eq_(path[-2], expected[-2])
+    eq_(path[1:4], expected[1:4])
+    assert_raises(IndexError, lambda: path[6])
+
+    #Random access still works after more components are added.
+    path.lineTo((9, 9))
+    eq_(path[6], ('L', 9.0, 9.0))
+
+def test_path_raw_arrays():
+    path = Path().moveTo((1, 2)).arc((5, 6), 7, 10, 20, ccw=False).line(3, 4)
+    eq_(list(path.opcodes), [PATH_MOVETO, PATH_ARCN, PATH_RLINETO])
+    eq_(list(path.coordinates), [1, 2, 5, 6, 7, 10, 20, 3, 4])
+    eq_(len(path.coordinates), sum(PATH_ARITY[op] for op in path.opcodes))
+
+    #The buffer can be shared without copying.
+    view = numpy.frombuffer(path.coordinates, dtype=numpy.float64)
+    eq_(list(view), list(path.coordinates))
+
+
+def test_path_translated():
+    path = Path(fill=(1, 0, 0)).moveTo((1, 2)).line(3, 4).arc((5, 6), 7, 10, 20).lineTo((0, 0))
+    moved = path.translated(10, -1)
+    eq_(list(moved), [
+        ('M', 11.0, 1.0),
+        ('l', 3.0, 4.0),
+        ('a', 15.0, 5.0, 7.0, 10.0, 20.0, True),
+        ('L', 10.0, -1.0),
+    ])
+    ok_(moved.fill is path.fill)
+    eq_(path[0], ('M', 1.0, 2.0))
+
+    #The copy is independent of the original.
+    moved.lineTo((1, 1))
+    eq_(len(path), 4)
+
+def test_path_transformed():
+    path = Path().moveTo((1, 2)).line(3, 4).curveTo((5, 6), (1, 1), (2, 2)).arc((0, 0), 1, 0, 90)
+    eq_(path[2], ('C', 1.0, 1.0, 2.0, 2.0, 5.0, 6.0))
+
+    #Rotate a quarter turn and move by (10, 0).
+    moved = path.transformed([[0, -1, 10], [1, 0, 0], [0, 0, 1]])
+    eq_([tuple(round(v, 9) if isinstance(v, float) else v for v in c) for c in moved], [
+        ('M', 8.0, 1.0),
+        ('l', -4.0, 3.0),
+        ('C', 9.0, 1.0, 8.0, 2.0, 4.0, 5.0),
+        ('a', 10.0, 0.0, 1.0, 90.0, 180.0, True),
+    ])
+
+    #A reflection reverses arcs.
+    mirrored = Path().arc((1, 0), 2, 0, 90).transformed([[-1, 0, 0], [0, 1, 0], [0, 0, 1]])
+    eq_(list(mirrored), [('a', -1.0, 0.0, 2.0, 180.0, 90.0, False)])
+
+    #Anything else turns arcs into curves, joined to the current point.
+    squashed = Path().moveTo((0, 0)).arc((0, 0), 1, 0, 180).transformed([[1, 0, 0], [0, 0.5, 0], [0, 0, 1]])
+    eq_([c[0] for c in squashed], ['M', 'L', 'C', 'C'])
+    eq_(squashed[1], ('L', 1.0, 0.0))
+    eq_(tuple(round(v, 9) for v in squashed[3][5:]), (-1.0, 0.0))
+
+def test_revision():
+    from pyps import geom
+    eq_(_Square(10).revision(), None)
+
+    circle = Circle((0, 0), 1)
+    rev = circle.revision()
+    ok_(rev is not None)
+    circle.touch()
+    ok_(circle.revision() != rev)
+    rev = circle.revision()
+    circle.set_title('changed')
+    ok_(circle.revision() != rev)
+
+    center = geom.MovablePt(0, 0)
+    circle = Circle(center, 1)
+    rev = circle.revision()
+    center.move_by(1, 0)
+    ok_(circle.revision() != rev)
+
+    #Derived points which can't track their sources can't be cached.
+    class Wobbly(geom.Point):
+        def coords(self):
+            return (0, 0)
+    eq_(Circle(geom.Translated(Wobbly(), 1, 1), 1).revision(), None)
+
+def _circle_array_args(count=300, seed=31415):
+    rand = numpy.random.RandomState(seed)
+    return rand.uniform(0, 100, (count, 2)), rand.uniform(0.5, 6, count), rand.uniform(0, 1, (count, 3))
+
+def test_circle_array_hittest():
+    centers, radii, fills = _circle_array_args()
+    array = CircleArray(centers, radii, fills)
+    circles = [Circle(tuple(c), r) for c, r in zip(centers.tolist(), radii.tolist())]
+
+    rand = numpy.random.RandomState(2718)
+    xs = rand.uniform(-10, 110, 500)
+    ys = rand.uniform(-10, 110, 500)
+    expected = numpy.array([any(c.hittest(x, y) for c in circles) for x, y in zip(xs, ys)])
+    ok_(expected.any() and not expected.all())
+    eq_(array.hittest_many(xs, ys).tolist(), expected.tolist())
+    eq_([array.hittest(x, y) for x, y in zip(xs[:50], ys[:50])], expected[:50].tolist())
+    eq_(array.hittest_many(xs.reshape(20, 25), ys.reshape(20, 25)).shape, (20, 25))
+
+def test_circle_array_boundingbox():
+    array = CircleArray([(10, 20), (30, -5), (0, 0)], [5, 2, 1])
+    bbox = array.boundingbox()
+    eq_(bbox.lowerleft.coords(), (-1.0, -7.0))
+    eq_(bbox.upperright.coords(), (32.0, 25.0))
+    eq_(len(array), 3)
+    eq_(array.radii.tolist(), [5.0, 2.0, 1.0])
+
+def test_circle_array_invalid():
+    assert_raises(ValueError, CircleArray, [], 1)
+    assert_raises(ValueError, CircleArray, [(1, 2, 3)], 1)
+    assert_raises(ValueError, CircleArray, [(1, 2), (3, 4)], [1, 2, 3])
+    assert_raises(ValueError, CircleArray, [(1, 2), (3, 4)], [1, 0])
+    assert_raises(ValueError, CircleArray, [(1, 2)], 1, fills=[(0, 0)])
+    assert_raises(ValueError, CircleArray, [(1, 2)], 1, fills=[(0, 0, 2)])
+
+def test_circle_array_is_immutable():
+    centers = numpy.array([(1.0, 2.0), (3.0, 4.0)])
+    array = CircleArray(centers, 1)
+    centers[0] = (50, 50)
+    eq_(array.centers.tolist(), [[1.0, 2.0], [3.0, 4.0]])
+    assert_raises(ValueError, array.centers.__setitem__, 0, (50, 50))
+
+def test_circle_array_render():
+    centers, radii, fills = _circle_array_args(20)
+    array = CircleArray(centers, radii, fills, stroke=(0.1, 0.2, 0.3), stroke_width=2)
+
+    #Without the capability, there's a path for each circle, like a Circle's.
+    paths = array.render()
+    eq_(len(paths), 20)
+    for path, c, r, fill in zip(paths, centers.tolist(), radii.tolist(), fills.tolist()):
+        expected = Circle(tuple(c), r, fill=fill, stroke=(0.1, 0.2, 0.3), stroke_width=2).render()[0]
+        eq_(list(path), list(expected))
+        eq_(path.fill.rgbf(), tuple(fill))
+        eq_(path.stroke.rgbf(), (0.1, 0.2, 0.3))
+        eq_(float(path.stroke_width), 2.0)
+
+    batches = array.render([CAPABILITY_CIRCLE_BATCH])
+    eq_(len(batches), 1)
+    ok_(isinstance(batches[0], CircleBatch))
+    eq_(len(batches[0]), 20)
+    ok_(batches[0].fills is array.fills)
+    moved = batches[0].translated(5, -5)
+    eq_(moved.centers.tolist(), (centers + (5, -5)).tolist())
+    eq_(moved.stroke.rgbf(), (0.1, 0.2, 0.3))
+
+def test_circle_trusted():
+    from pyps import geom
+    from pyps.art.color import FixedColor
+
+    circle = Circle((3, 4), 2, fill=(0.5, 0.5, 0.5))
+    trusted = Circle.trusted(geom.Pt(3, 4), 2, fill=FixedColor(0.5, 0.5, 0.5))
+    eq_(list(trusted.render()[0]), list(circle.render()[0]))
+    eq_(trusted.render()[0].fill.rgbf(), (0.5, 0.5, 0.5))
+    eq_(trusted.render()[0].stroke.rgbf(), (0.0, 0.0, 0.0))
+    eq_(float(trusted.render()[0].stroke_width), 1.0)
+    eq_(trusted.boundingbox().lowerleft.coords(), (1.0, 2.0))
+    ok_(trusted.hittest(4, 5))
+    revision = trusted.revision()
+    ok_(revision is not None)
+    trusted.touch()
+    ok_(trusted.revision() != revision)
+
+def test_path_trusted():
+    from pyps.shapes import PATH_LINETO
+    path = Path.trusted(fill=Path(fill=(1, 0, 0)).fill)
+    path.add_component(PATH_MOVETO, 1.0, 2.0).add_component(PATH_LINETO, 3.0, 4.0)
+    expected = Path(fill=(1, 0, 0)).moveTo((1, 2)).lineTo((3, 4))
+    eq_(list(path), list(expected))
+    eq_(path.fill.rgbf(), (1.0, 0.0, 0.0))
+    eq_(path.stroke, None)
+
+def test_cast_error_messages():
+    with assert_raises(TypeError) as cm:
+        Path().lineTo('x')
+    eq_(str(cm.exception), "Line-to argument must be a point: 'x'")
+    with assert_raises(TypeError) as cm:
+        Path(stroke='x')
+    eq_(str(cm.exception), "Paintable stroke must be a color or None: 'x'")
+    with assert_raises(TypeError) as cm:
+        Circle(('a',), 1)
+    eq_(str(cm.exception), "Center point must be a point: ('a',)")
+
+def test_extent():
+    from pyps import geom
+    from pyps.shapes.xforms import Translate, Rotate
+
+    center = geom.MovablePt(3, 4)
+    circle = Circle(center, 2)
+    for shape in (circle, Translate(1, -1, circle), Rotate(30, circle), CircleArray([(1, 2), (5, 6)], 1)):
+        bbox = shape.boundingbox()
+        eq_(shape.extent(), bbox.lowerleft.coords() + bbox.upperright.coords())
+    center.move_to(10, 10)
+    eq_(Translate(1, -1, circle).extent(), (9.0, 7.0, 13.0, 11.0))
@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+# vim: set fileencoding=utf-8: set encoding=utf-8:
+
+from nose.tools import *
+
+import os
+import random
+import shutil
+import StringIO
+import tempfile
+
+import numpy
+
+import pyps
+from pyps import geom, storage
+from pyps.shapes import Shape, Circle, CircleArray
+from pyps.shapes.xforms import Translate, Matrix, Scale, Rotate
+from pyps.writers.postscript import PSWriter
+
+
+_tmpdir = None
+
+def setup_module():
+    global _tmpdir
+    _tmpdir = tempfile.mkdtemp()
+
+def teardown_module():
+    shutil.rmtree(_tmpdir)
+
+def _save(document, name='doc.pyps'):
+    path = os.path.join(_tmpdir, name)
+    with open(path, 'wb') as ofile:
+        storage.save(document, ofile)
+    return path
+
+def _rendered(shape):
+    return [(list(p), p.stroke and p.stroke.rgbf(), p.fill and p.fill.rgbf(), float(p.stroke_width))
+        for p in shape.render()]
+
+def _document():
+    rand = random.Random(1123)
+    doc = pyps.Document()
+    for i in xrange(50):
+        doc.add_shape(Circle((rand.uniform(0, 100), rand.uniform(0, 100)), rand.uniform(1, 5),
+            fill=(rand.random(), 0.5, 0.5), stroke=None if i % 3 else (0, 0, 1), stroke_width=i % 4 + 1))
+    doc.add_shape(
+        Circle(geom.MovablePt(5, 5), 2, title='movable'),
+        Translate(10, 20, Translate(1, 1, Circle((0, 0), 1))),
+        Scale(2, 3, Translate(1, 2, Circle((4, 4), 1, fill=(1, 0, 0)))),
+        Rotate(30, CircleArray([(1, 2), (3, 4)], [1, 2], stroke=None, fill=(0, 1, 0)), center=(5, 5)),
+        CircleArray([(10, 20), (30, 40), (50, 60)], 2, fills=[(0, 0, 0), (0.5, 0.5, 0.5), (1, 1, 1)]),
+    )
+    doc.current_page().get_shape(-1).set_title('array')
+    doc.new_page()
+    doc.new_page().add_shape(Circle((1, 1), 1))
+    return doc
+
+
+def test_round_trip():
+    doc = _document()
+    loaded = storage.load(_save(doc))
+    eq_(loaded.page_count(), 3)
+    for page, loaded_page in zip(doc.iterpages(), loaded.iterpages()):
+        eq_(loaded_page.shape_count(), page.shape_count())
+        eq_(loaded_page.bounds(), page.bounds())
+        for shape, loaded_shape in zip(page.itershapes(), loaded_page.itershapes()):
+            eq_(type(loaded_shape), Matrix if isinstance(shape, Matrix) else type(shape))
+            eq_(loaded_shape.title(), shape.title())
+            eq_(_rendered(loaded_shape), _rendered(shape))
+
+    page = loaded.get_page(0)
+    eq_(page.get_shape(50).center.coords(), (5.0, 5.0))
+    eq_(page.get_shape(-1).fills.tolist(), [[0, 0, 0], [0.5, 0.5, 0.5], [1, 1, 1]])
+    assert_raises(ValueError, page.get_shape(-1).centers.__setitem__, 0, (0, 0))
+
+def test_writes_same_output():
+    doc = _document()
+    loaded = storage.load(_save(doc))
+    for options in ({}, {'binary': True}):
+        expected = StringIO.StringIO()
+        PSWriter(**options).write(expected, doc)
+        actual = StringIO.StringIO()
+        PSWriter(**options).write(actual, loaded)
+        eq_(actual.getvalue(), expected.getvalue())
+
+def test_shapes_are_lazy():
+    doc = _document()
+    loaded = storage.load(_save(doc))
+    page = loaded.get_page(0)
+    shapes = page._Page__shapes
+    eq_(shapes._shapes.count(None), 55)
+
+    #Queries only need the stored extents, so only the shapes they return are
+    # created.
+    found = page.shapes_intersecting((0, 0), (20, 20))
+    eq_(len(found), len(doc.get_page(0).shapes_intersecting((0, 0), (20, 20))))
+    ok_(0 < len(found) < 55)
+    eq_(shapes._shapes.count(None), 55 - len(found))
+    x, y = doc.get_page(0).get_shape(7).center.coords()
+    eq_([s.center.coords() for s in page.shapes_at(x, y)],
+        [s.center.coords() for s in doc.get_page(0).shapes_at(x, y)])
+    ok_(shapes._shapes.count(None) < 55)
+
+    #Shapes are only created once.
+    ok_(page.get_shape(3) is page.get_shape(3))
+    ok_(page.get_shape(-2) is page.get_shape(53))
+    ok_(tuple(page.itershapes())[3] is page.get_shape(3))
+
+def test_add_to_loaded_page():
+    loaded = storage.load(_save(_document()))
+    page = loaded.get_page(0)
+    circle = Circle((500, 500), 10)
+    page.add_shape(circle)
+    eq_(page.shape_count(), 56)
+    ok_(page.get_shape(55) is circle)
+    eq_(page.shapes_at(500, 500), (circle,))
+    eq_(page.bounds()[2], 510.5)
+
+    #And it can be saved again.
+    again = storage.load(_save(loaded, 'again.pyps'))
+    eq_(again.get_page(0).shape_count(), 56)
+    eq_(_rendered(again.get_page(0).get_shape(55)), _rendered(circle))
+
+def test_shared_leaves():
+    #A shape wrapped by several transforms, or wrapped and on the page
+    # itself, is loaded as a single shape.
+    shared = Circle((1, 2), 3)
+    on_page = Circle((4, 5), 6)
+    doc = pyps.Document()
+    doc.add_shape(Translate(1, 0, shared), Translate(0, 1, shared), Scale(2, 2, shared),
+        on_page, Translate(5, 5, on_page))
+    loaded = storage.load(_save(doc)).get_page(0)
+    leaf = loaded.get_shape(0).leaf
+    eq_(leaf.center.coords(), (1, 2))
+    ok_(loaded.get_shape(1).leaf is leaf)
+    ok_(loaded.get_shape(2).leaf is leaf)
+    ok_(loaded.get_shape(4).leaf is loaded.get_shape(3))
+    for shape, loaded_shape in zip(doc.get_page(0).itershapes(), loaded.itershapes()):
+        eq_(_rendered(loaded_shape), _rendered(shape))
+
+def test_save_streams_columns():
+    class RecordingStream(object):
+        def __init__(self):
+            self.chunks = []
+        def write(self, data):
+            self.chunks.append(data)
+
+    doc = pyps.Document()
+    for i in xrange(3 * storage._BLOCK):
+        doc.add_shape(Circle((i, i), 1))
+    ostream = RecordingStream()
+    storage.save(doc, ostream)
+    data = ''.join(ostream.chunks)
+
+    #Columns are written a block of shapes at a time, and the footer last.
+    ok_(max(len(chunk) for chunk in ostream.chunks) <= 32 * storage._BLOCK)
+    ok_(ostream.chunks[-2].startswith('{'))
+    path = os.path.join(_tmpdir, 'streamed.pyps')
+    with open(path, 'wb') as ofile:
+        ofile.write(data)
+    eq_(storage.load(path).get_page(0).get_shape(-1).center.coords(), (3 * storage._BLOCK - 1.0,) * 2)
+
+def test_unsupported_shape():
+    class Square(Shape):
+        def hittest(self, x, y):
+            return False
+        def boundingbox(self):
+            return pyps.shapes.BoundingBox((0, 0), (1, 1))
+        def render(self, capabilities=[]):
+            return []
+
+    doc = pyps.Document()
+    doc.add_shape(Circle((0, 0), 1), Translate(1, 1, Square()))
+    ostream = StringIO.StringIO()
+    assert_raises(TypeError, storage.save, doc, ostream)
+    eq_(ostream.getvalue(), '')
+
+def test_invalid_file():
+    path = os.path.join(_tmpdir, 'invalid.pyps')
+    with open(path, 'wb') as ofile:
+        ofile.write('Not a document at all.')
+    assert_raises(ValueError, storage.load, path)
+
+    data = open(_save(_document()), 'rb').read()
+    with open(path, 'wb') as ofile:
+        ofile.write(data[:-100])
+    assert_raises(ValueError, storage.load, path)
@@ -3,50 +3,23 @@
 
 from nose.tools import *
 
-from PIL import Image
+import math
+import numpy
 
-import tempfile
+from PIL import Image
 
 from tools import img_compare
 
-from pyps.writers.postscript import EPSWriter
-import subprocess
-import os
+from pyps.writers.raster import RasterWriter
 
 import pyps
 from pyps.shapes import Circle
+from pyps.shapes import xforms
 from pyps.shapes.xforms import Translate
 
 
 def _doc_to_img(doc):
-    
-    writer = EPSWriter()
-
-    eps_fd, eps_file = tempfile.mkstemp('.eps', 'pyps_tests_')
-    try:
-        with os.fdopen(eps_fd, 'wb') as ostream:
-            writer.write(ostream, doc)
-
-        png_fd, png_file = tempfile.mkstemp('.png', 'pyps_test_')
-        try:
-            os.close(png_fd)
-
-            subprocess.check_call(['convert', eps_file, png_file], shell=True)
-
-            im = Image.open(png_file)
-            im = im.convert('RGBA')
-            im = im.convert('RGB')
-            im.load()
-            return im
-
-        finally:
-            try: os.close(png_fd)
-            except: pass
-            os.unlink(png_file)
-    finally:
-        try: os.close(eps_fd)
-        except: pass
-        os.unlink(eps_file)
+    return Image.fromarray(RasterWriter().render(doc), 'RGB')
 
 def _test_docs_similar(doc1, doc2):
     im1 = _doc_to_img(doc1)
@@ -76,3 +49,97 @@ def test_translate():
     _test_docs_similar(doc1, doc2)
 
 
+
+def test_nested_translate_is_flattened():
+    circle = Circle((10, 20), 5)
+    shape = circle
+    for i in xrange(20):
+        shape = Translate(1, -2, shape)
+
+    ok_(shape.leaf is circle)
+    eq_(shape.offset(), (20.0, -40.0))
+    ok_(xforms.leaf(shape) is circle)
+    ok_(xforms.leaf(circle) is circle)
+
+    ok_(shape.hittest(30, -20))
+    ok_(not shape.hittest(10, 20))
+    eq_(shape.to_local(30, -20), (10.0, 20.0))
+    eq_(shape.to_global((10, 20)).coords(), (30.0, -20.0))
+    eq_(list(shape.hittest_many([30, 10, 34], [-20, 20, -20])), [True, False, True])
+
+    bbox = shape.boundingbox()
+    eq_(bbox.lowerleft.coords(), (25.0, -25.0))
+    eq_(bbox.upperright.coords(), (35.0, -15.0))
+
+    paths = shape.render()
+    eq_(len(paths), 1)
+    eq_(list(paths[0]), [('a', 30.0, -20.0, 5.0, 0.0, 360.0, True)])
+
+    #The page bounds include the leaf shape's stroke.
+    doc = pyps.Document()
+    doc.add_shape(shape)
+    eq_(doc.bounds(), (24.5, -25.5, 35.5, -14.5))
+
+def test_rotate_keeps_arcs():
+    circle = Circle((10, 0), 5)
+    rotated = xforms.Rotate(90, circle)
+    ok_(rotated.hittest(0, 10))
+    ok_(not rotated.hittest(10, 0))
+
+    path = rotated.render()[0]
+    eq_(len(path), 1)
+    cmd, cx, cy, r, start, stop, ccw = path[0]
+    eq_(cmd, 'a')
+    ok_(abs(cx) < 1e-9 and abs(cy - 10) < 1e-9)
+    eq_((r, start, stop, ccw), (5.0, 90.0, 450.0, True))
+
+    about = xforms.Rotate(180, circle, center=(10, 10))
+    eq_([round(v, 9) for v in about.to_local(10, 20)], [10.0, 0.0])
+
+def test_scale_converts_arcs_to_curves():
+    ellipse = xforms.Scale(3, 1, Circle((0, 0), 10, stroke=None, fill=(0, 0, 0)))
+    ok_(ellipse.hittest(29, 0))
+    ok_(not ellipse.hittest(0, 11))
+    eq_(list(ellipse.hittest_many([29, 0, 0], [0, 9, 11])), [True, True, False])
+
+    bbox = ellipse.boundingbox()
+    eq_(bbox.lowerleft.coords(), (-30.0, -10.0))
+    eq_(bbox.upperright.coords(), (30.0, 10.0))
+
+    path = ellipse.render()[0]
+    eq_(path[0][0], 'M')
+    eq_([c[0] for c in path[1:]], ['C'] * 4)
+
+    #The curves really do trace an ellipse.
+    doc = pyps.Document()
+    doc.add_shape(ellipse)
+    image = RasterWriter().render(doc)
+    area = (image[:, :, 0] < 128).sum()
+    ok_(abs(area - math.pi * 30 * 10) / (math.pi * 30 * 10) < 0.02)
+
+def test_nested_transforms_are_flattened():
+    circle = Circle((0, 0), 1)
+    shape = xforms.Rotate(30, xforms.Rotate(60, Translate(5, 0, circle)))
+    ok_(shape.leaf is circle)
+    ok_(xforms.leaf(Translate(1, 1, shape)) is circle)
+    ok_(numpy.allclose(shape.matrix(), [[0, -1, 0], [1, 0, 5], [0, 0, 1]]))
+    ok_(shape.hittest(0, 5))
+
+    matrix = xforms.Matrix((1, 0, 0, 1, 2, 3), shape)
+    ok_(matrix.leaf is circle)
+    ok_(matrix.hittest(2, 8))
+    eq_([round(v, 9) for v in matrix.to_global((0, 0)).coords()], [2.0, 8.0])
+    assert_raises(ValueError, xforms.Matrix, (1, 2, 3), circle)
+
+def test_singular_transform():
+    circle = Circle((5, 5), 2)
+    flat = xforms.Scale(0, 1, circle)
+    eq_(flat.hittest(0, 5), False)
+    eq_(flat.hittest_many([0, 10], [[5], [6]]).tolist(), [[False, False], [False, False]])
+    assert_raises(ValueError, flat.to_local, 0, 5)
+    eq_(flat.to_global((5, 5)).coords(), (0.0, 5.0))
+
+    doc = pyps.Document()
+    doc.add_shape(flat, circle)
+    eq_(doc.shapes_at(5, 5), (circle,))
+    eq_(doc.shapes_at(0, 5), ())
@@ -1,12 +1,79 @@
 #! /usr/bin/env python
 # vim: set fileencoding=utf-8: set encoding=utf-8:
 
-from PIL import ImageFilter
+from PIL import Image, ImageFilter
 import math
+import numpy
 
-def similar(im1, im2):
+THRESHOLD = 6
+"""
+The root mean square difference between blurred images, in 8-bit channel
+units, below which `similar` considers two images similar.
+"""
+
+_MIN_COARSE_RADIUS = 4.0
+"""
+The smallest blur radius, in downsampled pixels, that `similar` will use in
+multi-scale mode. The images are downsampled by the largest power of two that
+leaves at least this radius, and aren't downsampled at all if that is one.
+"""
+
+_COARSE_MARGIN = 1.0
+"""
+How far above `THRESHOLD` the downsampled comparison in multi-scale mode needs
+to be for `similar` to reject the images without comparing them at full
+resolution. Blurring after downsampling only approximates downsampling after
+blurring, and on the test images, the estimate was never more than about a
+quarter of a channel unit above the full resolution result.
+"""
+
+
+def _rms(a1, a2):
+    """
+    Returns the root mean square of the differences between two arrays of
+    channel values.
+    """
+    #The sum of squares overflows 32-bit integers for large images.
+    d = (a1.astype(numpy.int64) - a2.astype(numpy.int64)).ravel()
+    return math.sqrt(float(numpy.dot(d, d)) / float(d.size))
+
+def _coarse_factor(size, r):
+    """
+    Returns the factor by which `similar` downsamples images of the given size
+    in multi-scale mode, for a blur radius of ``r`` at full resolution.
+    """
+    factor = 1
+    while r / (factor * 2.0) >= _MIN_COARSE_RADIUS and min(size) >= factor * 2:
+        factor *= 2
+    return factor
+
+def _coarse_rms(im1, im2, r, factor):
+    """
+    Estimates the root mean square difference between two RGB images blurred
+    with radius ``r``, by downsampling them with averages over ``factor`` by
+    ``factor`` blocks first, and blurring the downsampled images with a
+    proportionally smaller radius. That takes a small fraction of the time of
+    blurring at full resolution.
+    """
+    width, height = im1.size[0] // factor, im1.size[1] // factor
+    box = (0, 0, width * factor, height * factor)
+    blur = ImageFilter.GaussianBlur(r / float(factor))
+    a1 = numpy.asarray(im1.resize((width, height), Image.BOX, box).filter(blur))
+    a2 = numpy.asarray(im2.resize((width, height), Image.BOX, box).filter(blur))
+    return _rms(a1, a2)
+
+def similar(im1, im2, multiscale=False):
     """
     Checks to see if two images are "similar", which is very vaguely defined.
+
+    Both images are blurred, and they are similar if the root mean square
+    difference between their channel values is less than `THRESHOLD`.
+
+    If ``multiscale`` is true, the images are first downsampled and blurred
+    at the reduced resolution, see `_coarse_rms`, which is much cheaper for
+    large images. If that shows them to be clearly too different, by more than
+    `_COARSE_MARGIN`, they are rejected without being blurred at full
+    resolution. Otherwise they are compared at full resolution as usual.
     """
 
     size = im1.size
@@ -14,25 +81,17 @@ def similar(im1, im2):
         return False
 
     r = int(math.ceil(min(size) * 0.10))
+    im1 = im1.convert('RGB')
+    im2 = im2.convert('RGB')
 
-    pix1 = im1.convert('RGB').filter(ImageFilter.GaussianBlur(r)).load()
-    pix2 = im2.convert('RGB').filter(ImageFilter.GaussianBlur(r)).load()
-
-    wrange = range(size[0])
-    hrange = range(size[1])
+    if multiscale:
+        factor = _coarse_factor(size, r)
+        if factor > 1 and _coarse_rms(im1, im2, r, factor) >= THRESHOLD + _COARSE_MARGIN:
+            return False
 
-    energy = 0
-    for x in wrange:
-        for y in hrange:
-            loc = (x,y)
-            rgb1 = pix1[loc]
-            rgb2 = pix2[loc]
-            if rgb1 != rgb2:
-                deltas = [abs(rgb1[i]-rgb2[i]) for i in (0,1,2)]
-                energy += sum(d*d for d in deltas)
-
-    avg_energy = math.sqrt(float(energy) / float(3*size[0]*size[1]))
+    blur1 = im1.filter(ImageFilter.GaussianBlur(r))
+    blur2 = im2.filter(ImageFilter.GaussianBlur(r))
+    avg_energy = _rms(numpy.asarray(blur1), numpy.asarray(blur2))
     print avg_energy
-    return avg_energy < 6
-
+    return avg_energy < THRESHOLD
 